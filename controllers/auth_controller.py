@@ -17,17 +17,16 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from repositories.auth_repository import AuthRepository
 from schemas.token import Token
 from schemas.email import EmailMessage
-from services.email_service import EmailService
+from repositories.email_outbox_repository import EmailOutboxRepository
+from services.email_outbox_service import EmailOutboxService
 from sql_app.database import get_db
 from sql_app.models import User
-from sql_app.models import TemporaryUser
-from asyncer import syncify
 from utils.html_generator import HtmlGenerator
 
 
 class AuthController:
 
-    def __init__(self, repository: AuthRepository, email_service: EmailService, background_tasks: BackgroundTasks):
+    def __init__(self, repository: AuthRepository, email_service: EmailOutboxService, background_tasks: BackgroundTasks):
 
         self.repository = repository
         self.email_service = email_service
@@ -43,11 +42,7 @@ class AuthController:
 
         return AuthController(repository=repository,
                               background_tasks=background_tasks,
-                              email_service=EmailService(
-                                  host=getenv('SMTP_HOST'),
-                                  port=getenv('SMTP_PORT'),
-                                  email=getenv('EMAIL_SMTP'),
-                                  password=getenv('PASSWORD_SMTP')))
+                              email_service=EmailOutboxService(repository=EmailOutboxRepository(db=repository.db)))
 
     @staticmethod
     async def get_user_from_token(
@@ -117,11 +112,7 @@ class AuthController:
                     f"{getenv('HOST_URL')}confirm-email/{temporary_user.id}",
                 )
 
-                self.background_tasks.add_task(
-                    self._send_email_account_confirmation_wrapper,
-                    email_message=email_message,
-                    temporary_user=temporary_user
-                )
+                await self.email_service.send_email(email_message)
                 return 'resend_email'
 
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado!")
@@ -225,7 +216,7 @@ class AuthController:
         await self.repository.update_user(user)
         email_message = self._create_recovery_email_message(temporary_password, user.email)
 
-        self.background_tasks.add_task(self._send_email_recovery_password_wrapper, email_message=email_message)
+        await self.email_service.send_email(email_message)
 
     async def change_password(self, user: User, actual_password: str, new_password: str) -> None:
 
@@ -259,28 +250,6 @@ class AuthController:
 
         return EmailMessage.with_default_logo_images(to_email=to_email, subject="Recuperação de senha Plataforma de Energias do RN", html_content=content)
 
-    def _send_email_recovery_password_wrapper(self, email_message: EmailMessage):
-        try:
-            self.email_service.send_email_recovery_password(email_message)
-            syncify(async_function=self.repository.create_log_email)(
-                subject=email_message.subject,
-                content=email_message.html_content,
-                to=email_message.to_email,
-                sender=getenv('EMAIL_SMTP'),
-                has_error=False,
-                error_message=None
-            )
-        except Exception as e:
-            capture_exception(e)
-            syncify(async_function=self.repository.create_log_email)(
-                subject=email_message.subject,
-                content=email_message.html_content,
-                to=email_message.to_email,
-                sender=getenv('EMAIL_SMTP'),
-                has_error=True,
-                error_message=str(e)
-            )
-
     def _create_confirmation_account_email_message(self, to_email, confirmation_link_url) -> EmailMessage:
 
         link_url = self._replace_safety_url_for_sender_pattern(confirmation_link_url)
@@ -298,30 +267,6 @@ class AuthController:
     def _replace_safety_url_for_sender_pattern(self, url: str) -> str:
         return url.replace("&", "&amp;").replace("?", "&quest;")
 
-    def _send_email_account_confirmation_wrapper(self, email_message: EmailMessage, temporary_user: TemporaryUser):
-
-        try:
-            self.email_service.send_email_account_confirmation(email_message)
-            syncify(async_function=self.repository.create_log_email)(
-                subject=email_message.subject,
-                content=email_message.html_content,
-                to=email_message.to_email,
-                sender=getenv('EMAIL_SMTP'),
-                has_error=False,
-                error_message=None
-            )
-        except Exception as e:
-            capture_exception(e)
-            syncify(async_function=self.repository.create_log_email)(
-                subject=email_message.subject,
-                content=email_message.html_content,
-                to=email_message.to_email,
-                sender=getenv('EMAIL_SMTP'),
-                has_error=True,
-                error_message=str(e)
-            )
-
-
     @staticmethod
     def get_permission_dependency(permission_name: str) -> Callable[..., bool]:
         @staticmethod
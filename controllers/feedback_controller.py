@@ -8,13 +8,14 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 from repositories.feedback_repository import FeedbackRepository
 from schemas.email import EmailMessage
 from schemas.feedback import FeedbackCreate
-from services.email_service import EmailService
+from repositories.email_outbox_repository import EmailOutboxRepository
+from services.email_outbox_service import EmailOutboxService
 from sql_app.database import get_db
 
 
 class FeedbackController:
 
-    def __init__(self, repository: FeedbackRepository, email_service: EmailService, background_tasks: BackgroundTasks):
+    def __init__(self, repository: FeedbackRepository, email_service: EmailOutboxService, background_tasks: BackgroundTasks):
 
         self.repository = repository
         self.email_service = email_service
@@ -25,12 +26,7 @@ class FeedbackController:
 
         return FeedbackController(
             repository=FeedbackRepository(db=db),
-            email_service=EmailService(
-                host=getenv("SMTP_HOST"),
-                port=getenv("SMTP_PORT"),
-                email=getenv("EMAIL_SMTP"),
-                password=getenv("PASSWORD_SMTP")
-            ),
+            email_service=EmailOutboxService(repository=EmailOutboxRepository(db=db)),
             background_tasks=background_tasks
         )
 
@@ -46,10 +42,7 @@ class FeedbackController:
         )
 
         if getenv('ENVIRONMENT') != 'local':
-            self.background_tasks.add_task(
-                self._send_feedback_email,
-                email_message=email_message,
-            )
+            await self.email_service.send_email(email_message)
 
         return created_feedback
 
@@ -64,7 +57,3 @@ class FeedbackController:
         content['opniao'] += f' <a style="display: inline-block;"><br> Menssagem:<br>{feedback.message}</a><h3>'
 
         return EmailMessage.with_default_logo_images(html_content=content[feedback.type], subject="Novo feedback enviado", to_email=to_email)
-
-    def _send_feedback_email(self, email_message: EmailMessage):
-
-        self.email_service.send_email_account_confirmation(email_message)
@@ -1,21 +1,36 @@
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 
-from fastapi import Depends, status, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import Depends, Response, status, UploadFile
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.exceptions import HTTPException
-from io import BytesIO
+from asyncer import asyncify
+from sqlalchemy.exc import DataError
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from repositories.geo_repository import GeoRepository
-from schemas.geojson import GeoJSON
+from schemas.polygon_query import PolygonQuery
 from sentry_sdk import capture_exception
-from sql_app.database import get_db
+from scripts.raster_render import TILE_FORMATS, ColorMap, webp_supported
+from services.layer_config_store import style_store
+from services.polygon_artifact_store import PolygonArtifact, polygon_artifact_store
+from services.tile_cache import vector_tile_cache
+from services.tile_renderer import tile_renderer
+from sql_app.database import get_db, session_router
+from utils.content_encoding import negotiate_encoding
 
+import hashlib
 import os
+import zlib
 
 
 class GeoFilesController:
 
+    MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+    TILE_CACHE_CONTROL = "private, max-age=3600"
+    RASTER_TILE_EXTENSIONS = {".png": "png", ".png8": "png8", ".webp": "webp"}
+    # Part of the artifact signature, bumped when the features written by build_polygon_features_query change
+    POLYGON_FEATURES_FORMAT = 2
+
     def __init__(self, repository: GeoRepository):
         self.repository = repository
 
@@ -36,28 +51,212 @@ class GeoFilesController:
         elif not geofile[1] == type:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tipo incorreto de geometria!")
 
-    async def get_polygon(self, table_name: str) -> GeoJSON:
+    async def get_polygon(
+        self,
+        table_name: str,
+        query: PolygonQuery | None = None,
+        if_none_match: str | None = None,
+        accept_encoding: str | None = None
+    ) -> Response:
 
-        await self._validate_geofile(table_name, 'polygon')
+        query = query or PolygonQuery()
+        await self._validate_vector_table(table_name)
         try:
-            return await self.repository.get_polygon_by_name(table_name)
+            sql_query, parameters = await self.repository.build_polygon_features_query(table_name, query)
+            if query.is_whole_table():
+                signature = f"{self.POLYGON_FEATURES_FORMAT}:{await self.repository.get_table_signature(table_name)}"
+                artifact = await polygon_artifact_store.get_or_build(
+                    f"{table_name}.{query.resolution}",
+                    signature,
+                    lambda: self._stream_feature_collection(self._read_feature_partitions(sql_query, parameters), query.limit)
+                )
+            else:
+                # The query runs before the response starts, so its errors still become a 400 or a 500
+                partitions = await self._start_partitions(self._read_feature_partitions(sql_query, parameters))
+        except ValueError as error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+        except DataError as error:
+            # Filter or cursor values Postgres can not cast to the column type
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Valor de filtro inválido: {error.orig}")
         except Exception as error:
             capture_exception(error)
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=error)
-
-    async def get_raster(self, table_name: str, x: int, y: int, z: int):
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(error))
 
-        raster_file = await self.repository.get_raster(table_name, x, y, z)
-        if not raster_file:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Raster file não processado!')
+        if query.is_whole_table():
+            return self._artifact_response(artifact, if_none_match, accept_encoding)
 
-        image = BytesIO(raster_file)
         return StreamingResponse(
-            image,
-            media_type="image/png",
-            headers={"Content-Disposition": "attachment; filename=raster.png"}
+            self._stream_feature_collection(partitions, query.limit),
+            media_type="application/geo+json"
         )
 
+    def _artifact_response(self, artifact: PolygonArtifact, if_none_match: str | None, accept_encoding: str | None) -> Response:
+
+        headers = {"ETag": artifact.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if if_none_match and artifact.etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        encoding = negotiate_encoding(accept_encoding, polygon_artifact_store.encodings)
+        if encoding:
+            return FileResponse(
+                artifact.files[encoding],
+                media_type="application/geo+json",
+                headers={**headers, "Content-Encoding": encoding}
+            )
+
+        return StreamingResponse(self._gunzip_file(artifact.files["gzip"]), media_type="application/geo+json", headers=headers)
+
+    @staticmethod
+    async def _gunzip_file(path: str) -> AsyncIterator[bytes]:
+
+        # Clients that do not accept any compression get the gzip artifact decompressed on the way
+        decompressor = zlib.decompressobj(31)
+        with open(path, "rb") as file:
+            while chunk := await asyncify(file.read)(1024 * 1024):
+                yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+
+    @staticmethod
+    async def _read_feature_partitions(sql_query: str, parameters: dict) -> AsyncIterator[list[tuple[str, str]]]:
+
+        """
+            Partitions of the feature rows of the query. The request session is already closed when the body
+            is sent, so the rows are read through a session of their own.
+        """
+
+        async with session_router.read_session() as db:
+            async for rows in GeoRepository(db=db).stream_polygon_features(sql_query, parameters):
+                yield rows
+
+    @staticmethod
+    async def _start_partitions(partitions: AsyncIterator[list]) -> AsyncIterator[list]:
+
+        """
+            Reads the first partition now and returns the partitions starting again from it
+        """
+
+        first = await anext(partitions, None)
+
+        async def restarted() -> AsyncIterator[list]:
+            try:
+                if first is not None:
+                    yield first
+                async for rows in partitions:
+                    yield rows
+            finally:
+                await partitions.aclose()
+
+        return restarted()
+
+    async def _stream_feature_collection(self, partitions: AsyncIterator[list[tuple[str, str]]], limit: int | None) -> AsyncIterator[bytes]:
+
+        """
+            FeatureCollection written chunk by chunk from the rows serialized by PostGIS, memory stays at one
+            partition of rows whatever the table size
+        """
+
+        yield b'{"type":"FeatureCollection","features":['
+        count = 0
+        last_key = None
+        has_next_page = False
+        async for rows in partitions:
+            # The query selects limit + 1 rows, the extra one only tells there is a next page
+            if limit is not None and count + len(rows) > limit:
+                rows = rows[:limit - count]
+                has_next_page = True
+            if rows:
+                yield (b"," if count else b"") + ",".join(row[1] for row in rows).encode()
+                count += len(rows)
+                last_key = rows[-1][0]
+
+        if has_next_page and last_key is not None:
+            yield b'],"next_cursor":"' + GeoRepository.encode_cursor(last_key).encode() + b'"}'
+        else:
+            yield b"]}"
+
+    async def _validate_vector_table(self, table_name: str) -> None:
+
+        # Uploaded layers are ingested to their own tables and are not registered as Geodata
+        if not await self.repository.get_ingested_layer_table(table_name):
+            await self._validate_geofile(table_name, 'polygon')
+
+    async def get_vector_tile(self, table_name: str, z: int, x: int, y: int) -> Response:
+
+        if z < 0 or z > 24 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Coordenadas do tile inválidas!")
+
+        key = (table_name, z, x, y)
+        tile = vector_tile_cache.get(key)
+        if tile is None:
+            await self._validate_vector_table(table_name)
+            try:
+                tile = await self.repository.get_vector_tile(table_name, z, x, y) or b""
+            except ValueError as error:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+            except Exception as error:
+                capture_exception(error)
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(error))
+            vector_tile_cache.set(key, tile)
+
+        headers = {"Cache-Control": self.TILE_CACHE_CONTROL}
+        if not tile:
+            return Response(status_code=status.HTTP_204_NO_CONTENT, headers=headers)
+
+        return Response(content=tile, media_type=self.MVT_MEDIA_TYPE, headers=headers)
+
+    def _raster_tile_format(self, table_name: str, accept: str | None) -> tuple[str, str, bool]:
+
+        """
+            Table name without the extension, tile format and whether the format came from Accept. An extension
+            wins over Accept, without one WebP goes to clients that accept it and the palette PNG to the others
+        """
+
+        name, extension = os.path.splitext(table_name)
+        tile_format = self.RASTER_TILE_EXTENSIONS.get(extension.lower())
+        if tile_format:
+            if tile_format == "webp" and not webp_supported():
+                raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Formato webp não disponível.")
+            return name, tile_format, False
+
+        if "image/webp" in (accept or "") and webp_supported():
+            return table_name, "webp", True
+        return table_name, "png8", True
+
+    async def get_raster(
+        self,
+        table_name: str,
+        x: int,
+        y: int,
+        z: int,
+        accept: str | None = None,
+        if_none_match: str | None = None,
+        band: int = 1
+    ) -> Response:
+
+        table_name, tile_format, negotiated = self._raster_tile_format(table_name, accept)
+        try:
+            if not await self.repository.get_raster_pyramid(table_name):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Raster não existe!")
+            values = await self.repository.get_raster_tile(table_name, x, y, z, band)
+            if values is None:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Raster file não processado!')
+            # Raster styles are stored in layers_style.json under the raster table name
+            colormap = ColorMap.from_style(await style_store.get(table_name))
+            raster_range = await self.repository.get_raster_value_range(table_name, band) if colormap.relative else None
+        except ValueError as error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+        tile = await tile_renderer.render(values, colormap, raster_range, tile_format)
+
+        etag = f'"{hashlib.blake2b(tile, digest_size=16).hexdigest()}"'
+        headers = {"Cache-Control": self.TILE_CACHE_CONTROL, "ETag": etag}
+        if negotiated:
+            headers["Vary"] = "Accept"
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        return Response(content=tile, media_type=TILE_FORMATS[tile_format], headers=headers)
+
     async def get_geofile_download(self, table_name: str):
 
         try:
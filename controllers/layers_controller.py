@@ -1,36 +1,64 @@
-import json
 from repositories.layers_repository import LayersRepository
 from typing import Annotated
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from schemas.layers import LayerCreate,LayerGroupCreate
 from pathlib import Path
-from fastapi import Depends, HTTPException, status, UploadFile
+from fastapi import BackgroundTasks, Depends, HTTPException, Response, status, UploadFile
+from services.layer_config_store import popup_store, style_store
+from services.layer_ingest_service import LayerIngestService, layer_ingest_service
+from services.layer_tree_cache import layer_tree_cache
 from sql_app.database import get_db
 from utils.utils import Utils
+from scripts.layer_schema import extract_property_schema
+from asyncer import asyncify
 import shutil
 
 class LayersController:
-    def __init__(self, repository: LayersRepository):
+    def __init__(
+        self,
+        repository: LayersRepository,
+        background_tasks: BackgroundTasks | None = None,
+        ingest_service: LayerIngestService = layer_ingest_service
+    ):
         self.repository = repository
+        self.background_tasks = background_tasks
+        self.ingest_service = ingest_service
 
     @staticmethod
-    async def inject_controller(db: Annotated[AsyncSession, Depends(get_db)]):
+    async def inject_controller(db: Annotated[AsyncSession, Depends(get_db)], background_tasks: BackgroundTasks):
         return LayersController(
-            repository=LayersRepository(db=db)
+            repository=LayersRepository(db=db),
+            background_tasks=background_tasks
         )    
 
     async def create_layer_group(self, layer_group: LayerGroupCreate):
-        return await self.repository.create_layer_group(layer_group)
+        new_layer_group = await self.repository.create_layer_group(layer_group)
+        layer_tree_cache.invalidate()
+        return new_layer_group
 
     async def update_layer_group(self, layer_group: LayerGroupCreate, id:str):
-        return await self.repository.update_layer_group(layer_group, id)
+        updated_layer_group = await self.repository.update_layer_group(layer_group, id)
+        layer_tree_cache.invalidate()
+        return updated_layer_group
     
     async def delete_layer_group(self, id:str):
-        return await self.repository.delete_layer_group(id)
+        result = await self.repository.delete_layer_group(id)
+        layer_tree_cache.invalidate()
+        return result
     
     async def delete_layer(self, id:str):
-        return await self.repository.delete_layer(id)
+        layer = await self.repository.get_layer_by_id(id)
+        result = await self.repository.delete_layer(id)
+        layer_tree_cache.invalidate()
+
+        if layer.table_name:
+            await self.ingest_service.drop(layer.table_name)
+
+        layer_name = Utils().format_layer_name(layer.name)
+        await popup_store.delete(layer_name)
+        await style_store.delete(layer_name)
+        return result
 
     async def get_layer_by_group_id(self, id: str):
         return await self.repository.get_layer_by_group_id(id)
@@ -41,33 +69,22 @@ class LayersController:
         if not layer:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer não encontrada")
 
-        popup_path = Path("assets/public/jsons/popups_fields.json")
-        style_path = Path("assets/public/jsons/layers_style.json")
+        layer_name = Utils().format_layer_name(layer.name)
 
-        if popup_path.exists():
-            with open(popup_path, "r", encoding="utf-8") as f:
-                existing_popup = json.load(f)   
+        return {
+            "layer": layer,
+            "popup": await popup_store.get(layer_name),
+            "style": await style_store.get(layer_name)
+        }
 
-        if style_path.exists():
-            with open(style_path, "r", encoding="utf-8") as f:
-                existing_style = json.load(f) 
-                
-        layer_name = Utils().format_layer_name(layer.name) 
+    async def get_layer_groups(self, if_none_match: str | None = None) -> Response:
+        body, etag = await layer_tree_cache.get(self.repository)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
 
-        if existing_popup and layer_name in existing_popup:
-            popup = existing_popup[layer_name]   
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-        if existing_style and layer_name in existing_style:
-            style = existing_style[layer_name]
-        
-        return {
-            "layer": layer,
-            "popup": popup if 'popup' in locals() else None,
-            "style": style if 'style' in locals() else None
-        }                       
-    
-    async def get_layer_groups(self):
-        return await self.repository.get_all_groups_and_layers()
+        return Response(content=body, media_type="application/json", headers=headers)
     
     async def get_all_layer_groups(self):
         return await self.repository.get_layer_group()
@@ -75,35 +92,43 @@ class LayersController:
     async def create_layer(self, layer: LayerCreate, file: UploadFile, file_icon: UploadFile):
         await self.create_layer_files(layer, file, file_icon)
 
-        return await self.repository.create_layer(layer)
+        new_layer = await self.repository.create_layer(layer)
+        layer_tree_cache.invalidate()
+        self._schedule_ingest(new_layer)
+        return new_layer
     
     async def update_layer(self, layer: LayerCreate, file: UploadFile, file_icon: UploadFile, id: str):
         await self.create_layer_files(layer, file, file_icon)
 
-        return await self.repository.update_layer(layer, id)
+        updated_layer = await self.repository.update_layer(layer, id)
+        layer_tree_cache.invalidate()
+        self._schedule_ingest(updated_layer)
+        return updated_layer
+
+    def _schedule_ingest(self, layer):
+        if layer.ingest_status != LayerIngestService.PENDING or self.background_tasks is None:
+            return
+
+        self.background_tasks.add_task(self.ingest_service.ingest, layer.id, layer.path, layer.properties_schema)
     
     async def create_layer_popup(self, id: str, fields: dict):
         layer = await self.repository.get_layer_by_id(id)
 
         if not layer:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
-        
-        import json
 
-        with open(layer.path, "r", encoding="utf-8", errors="replace") as file:
-            data = json.load(file)
-
-        data = data.get('features', [])
+        # Layers uploaded before the schema was stored get it extracted once and saved
+        if layer.properties_schema is None:
+            properties_schema = await self._extract_properties_schema(layer.path)
+            layer = await self.repository.update_layer_properties_schema(layer, properties_schema)
 
         layer_name = Utils().format_layer_name(layer.name)
 
         fields_popup = {}
-        if len(data) > 0:
-            properties = data[0].get('properties', {})
-            for key, value in properties.items():
-                if key in fields["fields"].keys():
-                    data = fields["fields"][key]
-                    fields_popup[data.get("title", key)] = {"property": key, "unit": data.get("unit", ""), "decimal": data.get("decimal", 0)}
+        for key in (layer.properties_schema or {}).get('fields', {}):
+            if key in fields["fields"].keys():
+                data = fields["fields"][key]
+                fields_popup[data.get("title", key)] = {"property": key, "unit": data.get("unit", ""), "decimal": data.get("decimal", 0)}
 
         new_popup = {
             layer_name: {
@@ -114,21 +139,7 @@ class LayersController:
             }
         }
 
-        json_path = Path("assets/public/jsons/popups_fields.json")
-
-        if json_path.exists():
-            with open(json_path, "r", encoding="utf-8") as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = {}
-        else:
-            existing_data = {}
-
-        existing_data.update(new_popup)
-
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=4)
+        await popup_store.set(layer_name, new_popup[layer_name])
 
         return new_popup
 
@@ -138,21 +149,7 @@ class LayersController:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
         layer_name = Utils().format_layer_name(layer.name)
 
-        style_path = Path("assets/public/jsons/layers_style.json")
-        if style_path.exists():
-            with open(style_path, "r", encoding="utf-8") as f:
-                try:
-                    existing_data = json.load(f)
-                except json.JSONDecodeError:
-                    existing_data = {}
-        else:
-            existing_data = {}
-        existing_data[layer_name] = style
-
-        with open(style_path, "w", encoding="utf-8") as f:
-            json.dump(existing_data, f, ensure_ascii=False, indent=4)
-
-        return existing_data
+        return await style_store.set(layer_name, style)
     
     async def create_layer_files(self, layer: LayerCreate, file: UploadFile, file_icon: UploadFile):
         if file:
@@ -171,6 +168,8 @@ class LayersController:
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error saving file: {str(e)}")
 
             layer.path = str(file_location)
+            layer.properties_schema = await self._extract_properties_schema(layer.path)
+            layer.ingest_status = LayerIngestService.PENDING if layer.properties_schema is not None else None
 
         if file_icon:
             private_directory = Path("assets/public/icons")
@@ -187,4 +186,13 @@ class LayersController:
             except Exception as e:
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error saving file: {str(e)}")
 
-            layer.path_icon = str(file_location)
\ No newline at end of file
+            layer.path_icon = str(file_location)
+
+    async def _extract_properties_schema(self, path: str) -> dict | None:
+        if Path(path).suffix.lower() not in {'.json', '.geojson'}:
+            return None
+
+        try:
+            return await asyncify(extract_property_schema)(path)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"GeoJSON inválido: {str(e)}")
@@ -1,5 +1,7 @@
 import asyncio
-from typing import Annotated
+from typing import Annotated, AsyncIterator, Iterator
+
+from asyncer import asyncify
 
 from fastapi import Depends, status
 from fastapi.exceptions import HTTPException
@@ -7,21 +9,24 @@ from sqlmodel.ext.asyncio.session import AsyncSession
 
 from repositories.geo_repository import GeoRepository
 from schemas.geojson import GeoJSON
-from scripts.create_raster_obj import read_raster_as_json
+from scripts.create_raster_obj import iter_raster_json, read_raster_as_json
 from schemas.feature import Feature
-from scripts.geo_processing import clip_and_get_pixel_values
+from scripts.geo_processing import ZonalBatch, buffer_distance, clip_and_get_pixel_values
+from scripts.memory_raster import MemoryRaster
 from scripts.dash_data import mean_stats
-from sql_app.database import get_db
+from sql_app.database import get_process_db
 
 
 class ProcessController:
 
+    MAX_BATCH_RASTERS = 20
+
     def __init__(self, repository: GeoRepository):
         self.repository = repository
         self.tasks = {'geo_processing': {}, 'process_raster': {}}
 
     @staticmethod
-    async def inject_controller(db: Annotated[AsyncSession, Depends(get_db)]):
+    async def inject_controller(db: Annotated[AsyncSession, Depends(get_process_db)]):
 
         return ProcessController(
             repository=GeoRepository(db=db)
@@ -37,14 +42,38 @@ class ProcessController:
             if feature.geometry.type == 'Polygon' and feature.geometry.coordinates[0][-1] != feature.geometry.coordinates[0][0]:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect coordinates in Polygon")
 
-    async def process_geo_process(self, feature: Feature, raster_name: str, user_id: str):
+    async def _get_raster(self, raster_name: str, bands: list[int] | None) -> MemoryRaster:
+
+        """
+            The requested bands of the raster opened in memory, band 1 when none
+        """
+
+        try:
+            bands = await self.repository.check_raster_bands(raster_name, bands)
+            raster = await self.repository.get_raster_dataset(raster_name, bands)
+        except ValueError as error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+        if not raster:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Problemas no processamento!')
+        return raster
+
+    async def process_geo_process(
+        self,
+        feature: Feature,
+        raster_name: str,
+        user_id: str,
+        bands: list[int] | None = None,
+        statistics: bool = False,
+        include_values: bool = False
+    ):
 
         if user_id in self.tasks['geo_processing']:
             task = self.tasks['geo_processing'][user_id]
             task.cancel()
             await task
 
-        task = asyncio.create_task(self.geo_process_wrapper(feature, raster_name))
+        task = asyncio.create_task(self.geo_process_wrapper(feature, raster_name, bands, statistics, include_values))
         self.tasks[user_id] = task
         try:
             return await task
@@ -53,23 +82,88 @@ class ProcessController:
         finally:
             del self.tasks[user_id]
 
-    async def geo_process_wrapper(self, feature: Feature, raster_name: str):
+    async def geo_process_wrapper(
+        self,
+        feature: Feature,
+        raster_name: str,
+        bands: list[int] | None = None,
+        statistics: bool = False,
+        include_values: bool = False
+    ):
 
         self._validate_features(feature)
-        dataset = await self.repository.get_raster_dataset(raster_name)
+        raster = await self._get_raster(raster_name, bands)
+        with raster:
+            try:
+                return await clip_and_get_pixel_values(feature, raster.dataset, raster_name, statistics, include_values)
+            except ValueError as error:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+    async def batch_geo_process(
+        self,
+        feature: Feature,
+        raster_names: list[str],
+        bands: list[int] | None = None,
+        include_values: bool = False
+    ):
+
+        """
+            Zonal statistics of the feature over every raster in one response. The rasters are loaded one
+            after the other on the request session and each is closed once summarized, the next one loads
+            while the previous is read in a worker thread, so at most two rasters are in memory
+        """
 
-        if not dataset:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Problemas no processamento!')
-        return await clip_and_get_pixel_values(feature, dataset, raster_name)
+        self._validate_features(feature)
+        raster_names = list(dict.fromkeys(raster_names))
+        if not raster_names:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nenhum raster informado.")
+        if len(raster_names) > self.MAX_BATCH_RASTERS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"No máximo {self.MAX_BATCH_RASTERS} rasters por requisição."
+            )
+        try:
+            for raster_name in raster_names:
+                if not GeoRepository.TABLE_NAME_PATTERN.fullmatch(raster_name):
+                    raise ValueError(f"Nome de raster inválido: {raster_name}")
+                buffer_distance(raster_name)
+        except ValueError as error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+        batch = ZonalBatch(feature, include_values)
+        summaries, running = {}, None
+        try:
+            for raster_name in raster_names:
+                raster = await self._get_raster(raster_name, bands)
+                if running is not None:
+                    try:
+                        await running
+                    except BaseException:
+                        raster.close()
+                        raise
+                running = asyncio.create_task(self._summarize_raster(batch, raster_name, raster))
+                summaries[raster_name] = running
+            await running
+        finally:
+            # A raster is never closed under a worker thread still reading it
+            if running is not None and not running.done():
+                await asyncio.gather(running, return_exceptions=True)
 
-    async def process_raster(self, raster_name: str, user_id: str):
+        return batch.response({raster_name: task.result() for raster_name, task in summaries.items()})
+
+    @staticmethod
+    async def _summarize_raster(batch: ZonalBatch, raster_name: str, raster: MemoryRaster) -> dict:
+
+        with raster:
+            return await batch.summarize(raster_name, raster.dataset)
+
+    async def process_raster(self, raster_name: str, user_id: str, bands: list[int] | None = None):
 
         if user_id in self.tasks['process_raster']:
             task = self.tasks['process_raster'][user_id]
             task.cancel()
             await task
 
-        task = asyncio.create_task(self.process_raster_wrapper(raster_name))
+        task = asyncio.create_task(self.process_raster_wrapper(raster_name, bands))
         self.tasks[user_id] = task
         try:
             return await task
@@ -78,12 +172,35 @@ class ProcessController:
         finally:
             del self.tasks[user_id]
 
-    async def process_raster_wrapper(self, raster_name: str):
+    async def process_raster_wrapper(self, raster_name: str, bands: list[int] | None = None):
 
-        dataset = await self.repository.get_raster_dataset(raster_name)
-        if not dataset:
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail='Problemas no processamento!')
-        return await read_raster_as_json(dataset)
+        raster = await self._get_raster(raster_name, bands)
+        with raster:
+            return await read_raster_as_json(raster.dataset)
+
+    async def process_raster_stream(self, raster_name: str, bands: list[int] | None = None) -> AsyncIterator[bytes]:
+
+        """
+            The raster document of process_raster as an iterator of JSON pieces, the dataset is loaded
+            before the response starts and the bands are read block by block in a worker thread
+        """
+
+        raster = await self._get_raster(raster_name, bands)
+        return self._stream_raster(raster)
+
+    async def _stream_raster(self, raster: MemoryRaster) -> AsyncIterator[bytes]:
+
+        # The raster is released when the body ends, also when the client goes away in the middle
+        with raster:
+            async for chunk in self._iterate_in_thread(iter_raster_json(raster.dataset)):
+                yield chunk
+
+    @staticmethod
+    async def _iterate_in_thread(iterator: Iterator[bytes]) -> AsyncIterator[bytes]:
+
+        end = object()
+        while (chunk := await asyncify(next)(iterator, end)) is not end:
+            yield chunk
 
     async def dash_data(self, feature: Feature, energy_type: str):
 
@@ -3,25 +3,30 @@ from typing import Annotated
 
 from fastapi import BackgroundTasks, Depends, status
 from fastapi.exceptions import HTTPException
-from sentry_sdk import capture_exception
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from controllers.auth_controller import AuthController
 from repositories.user_repository import UserRepository
 from schemas.user import UserCreate
 from schemas.email import EmailMessage
-from services.email_service import EmailService
+from repositories.auth_repository import AuthRepository
+from repositories.email_outbox_repository import EmailOutboxRepository
+from services.email_outbox_service import EmailOutboxService
 from sql_app.database import get_db
-from sql_app.models import TemporaryUser
 from sql_app.models import User
-from asyncer import syncify
 from utils.html_generator import HtmlGenerator
 import bcrypt
 
 
 class UserController:
 
-    def __init__(self, repository: UserRepository, email_service: EmailService, background_tasks: BackgroundTasks, auth_controller: AuthController):
+    def __init__(
+        self,
+        repository: UserRepository,
+        email_service: EmailOutboxService,
+        background_tasks: BackgroundTasks,
+        auth_controller: AuthController
+    ):
         self.repository = repository
         self.email_service = email_service
         self.background_tasks = background_tasks
@@ -30,16 +35,11 @@ class UserController:
     @staticmethod
     async def inject_controller(background_tasks: BackgroundTasks, db: Annotated[AsyncSession, Depends(get_db)]):
 
-        auth_controller = AuthController.inject_controller(background_tasks, db)
+        auth_controller = AuthController.inject_controller(AuthRepository(db=db), background_tasks)
 
         return UserController(
             repository=UserRepository(db=db),
-            email_service=EmailService(
-                host=getenv("SMTP_HOST"),
-                port=getenv("SMTP_PORT"),
-                email=getenv("EMAIL_SMTP"),
-                password=getenv("PASSWORD_SMTP")
-            ),
+            email_service=EmailOutboxService(repository=EmailOutboxRepository(db=db)),
             background_tasks=background_tasks,
             auth_controller=auth_controller
         )
@@ -71,11 +71,7 @@ class UserController:
             f"{getenv('HOST_URL')}confirm-email/{temporary_user.id}",
         )
 
-        self.background_tasks.add_task(
-            self._send_email_account_confirmation_wrapper,
-            email_message=email_message,
-            temporary_user=temporary_user
-        )
+        await self.email_service.send_email(email_message)
 
         return temporary_user
 
@@ -93,29 +89,6 @@ class UserController:
 
         return EmailMessage.with_default_logo_images(html_content=content, subject="Confirmação de email Plataforma de Energias do RN", to_email=to_email)
 
-    def _send_email_account_confirmation_wrapper(self, email_message: EmailMessage, temporary_user: TemporaryUser):
-
-        try:
-            self.email_service.send_email_account_confirmation(email_message)
-            syncify(async_function=self.repository.create_log_email)(
-                subject=email_message.subject,
-                content=email_message.html_content,
-                to=email_message.to_email,
-                sender=getenv('EMAIL_SMTP'),
-                has_error=False,
-                error_message=None
-            )
-        except Exception as e:
-            capture_exception(e)
-            syncify(async_function=self.repository.create_log_email)(
-                subject=email_message.subject,
-                content=email_message.html_content,
-                to=email_message.to_email,
-                sender=getenv('EMAIL_SMTP'),
-                has_error=True,
-                error_message=str(e)
-            )
-
     async def update_user(self, user_update: dict, user: User = None, id: str = None):
 
         if 'current_password' in user_update and 'new_password' in user_update:
@@ -4,21 +4,16 @@ from contextlib import asynccontextmanager
 from typing import Annotated, List
 from uuid import UUID
 
-import base64
-from Crypto.Cipher import AES
-from Crypto.Random import get_random_bytes
-from Crypto.Util.Padding import pad, unpad
-
 import sentry_sdk
 from dotenv import load_dotenv, find_dotenv
-from fastapi import Body, Depends, FastAPI, status, Response, UploadFile, HTTPException, Form, Body, File
-from fastapi.responses import JSONResponse
+from fastapi import Body, Depends, FastAPI, status, Response, UploadFile, HTTPException, Form, Body, File, Header, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import EmailStr
 from typing import Union
 from pathlib import Path
-from typing import Optional, Annotated
+from typing import Literal, Optional, Annotated
 import json
 
 from controllers.auth_controller import AuthController
@@ -30,6 +25,7 @@ from controllers.media_controller import MediaController
 from controllers.layers_controller import LayersController
 from schemas.AdminStatusResponse import AdminStatusResponse
 from schemas.layers import LayerGroupCreate, LayerCreate
+from schemas.polygon_query import AttributeFilter, PolygonQuery
 from schemas.feature import Feature
 from schemas.featureCollection import FeatureCollection
 from schemas.feedback import FeedbackCreate
@@ -37,7 +33,15 @@ from schemas.token import Token
 from schemas.user import UserCreate, UserUpdate
 from schemas.media import MediaCreate, MediaUpdate
 from sql_app import models
-from sql_app.database import init_db
+from sql_app.database import dispose_engines, init_db
+from sql_app.pool_metrics import pool_metrics
+from services.email_outbox_service import email_outbox_worker
+from services.encryption_service import encryption_service
+from services.tile_renderer import tile_renderer
+from schemas.email import load_default_logo_images
+from utils.compression_middleware import CompressionMiddleware
+from utils.content_encoding import negotiate_encoding
+from utils.html_generator import HtmlGenerator
 from enums.ocupation_enum import OcupationEnum
 
 
@@ -60,34 +64,53 @@ async def lifespan(app: FastAPI):
         )
 
     await init_db()
+    HtmlGenerator.compile_templates()
+    load_default_logo_images()
+    # Without the key only the encrypted endpoints fail, as before
+    if os.getenv("ENCRYPTION_KEY"):
+        encryption_service.load_key()
+    email_outbox_worker.start()
     yield
+    await email_outbox_worker.stop()
+    tile_renderer.shutdown()
+    await dispose_engines()
+
 
+PAYLOAD_ENCODING_HEADER = "X-Payload-Encoding"
+ENCRYPTION_HEADER = "X-Encryption"
+ENVELOPE_MEDIA_TYPE = "application/octet-stream"
+ENCRYPTED_STREAM_MEDIA_TYPE = "application/x-aes-gcm-stream"
 
-async def get_encryption_key():
-    key_hex = os.getenv("ENCRYPTION_KEY")
-    if key_hex is None:
-        raise ValueError("ENCRYPTION_KEY não está definida no ambiente.")
-    return bytes.fromhex(key_hex)
 
+def wants_binary_envelope(accept: Annotated[str | None, Header()] = None) -> bool:
+    """Clients accepting application/octet-stream opt in to the binary AES-GCM envelope instead of the base64 string"""
+    return ENVELOPE_MEDIA_TYPE in (accept or "")
 
-async def encrypt_data(data: dict) -> str:
-    plaintext = json.dumps(data)
 
-    iv = get_random_bytes(16)
-    cipher = AES.new(await get_encryption_key(), AES.MODE_CBC, iv)
+def wants_encrypted_stream(accept: Annotated[str | None, Header()] = None) -> bool:
+    """Clients accepting application/x-aes-gcm-stream get big results encrypted in frames as they are produced"""
+    return ENCRYPTED_STREAM_MEDIA_TYPE in (accept or "")
 
-    ciphertext = cipher.encrypt(pad(plaintext.encode('utf-8'), AES.block_size))
-    return base64.b64encode(iv + ciphertext).decode('utf-8')
 
+async def encrypt_response(data, payload_encoding: str | None, binary_envelope: bool):
+    if not binary_envelope:
+        return await encryption_service.encrypt(data, payload_encoding)
 
-async def decrypt_data(encrypted_data: str) -> dict:
-    iv = encrypted_data[:16]
-    ciphertext = encrypted_data[16:]
+    # Headers set by dependencies are not copied to a Response returned by the route
+    headers = {ENCRYPTION_HEADER: "aes-gcm"}
+    if payload_encoding:
+        headers[PAYLOAD_ENCODING_HEADER] = payload_encoding
+    envelope = await encryption_service.encrypt_envelope(data, payload_encoding)
+    return Response(content=envelope, media_type=ENVELOPE_MEDIA_TYPE, headers=headers)
 
-    cipher = AES.new(await get_encryption_key(), AES.MODE_CBC, iv)
-    plaintext = unpad(cipher.decrypt(ciphertext), AES.block_size)
 
-    return json.loads(plaintext.decode('utf-8'))
+def get_payload_encoding(response: Response, x_payload_encoding: Annotated[str | None, Header()] = None) -> str | None:
+    """Clients sending X-Payload-Encoding: gzip get the encrypted plaintext gzipped, flagged by the same response header"""
+    payload_encoding = negotiate_encoding(x_payload_encoding, ["gzip"])
+    if payload_encoding:
+        response.headers[PAYLOAD_ENCODING_HEADER] = payload_encoding
+    return payload_encoding
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -102,7 +125,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag", PAYLOAD_ENCODING_HEADER, ENCRYPTION_HEADER],
 )
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
 
 
 GeoJSONInput = Union[Feature, FeatureCollection]
@@ -222,13 +247,42 @@ async def post_process_geo_processing(
     raster_name: str,
     user: Annotated[models.User | models.AnonymousUser, Depends(AuthController.get_user_from_token)],
     controller: Annotated[ProcessController, Depends(ProcessController.inject_controller)],
-    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_geo_processing"))]
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_geo_processing"))],
+    payload_encoding: Annotated[str | None, Depends(get_payload_encoding)],
+    binary_envelope: Annotated[bool, Depends(wants_binary_envelope)],
+    bands: Annotated[list[int] | None, Query()] = None,
+    statistics: bool = False,
+    include_values: bool = False
+):
+
+    if not has_permission:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
+
+    return await encrypt_response(
+        await controller.process_geo_process(feature, raster_name, user.id.hex, bands, statistics, include_values),
+        payload_encoding,
+        binary_envelope
+    )
+
+
+@app.post("/process/geo-processing")
+async def post_process_batch_geo_processing(
+    feature: Annotated[Feature, Body()],
+    rasters: Annotated[list[str], Body()],
+    controller: Annotated[ProcessController, Depends(ProcessController.inject_controller)],
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_geo_processing"))],
+    payload_encoding: Annotated[str | None, Depends(get_payload_encoding)],
+    binary_envelope: Annotated[bool, Depends(wants_binary_envelope)],
+    bands: Annotated[list[int] | None, Query()] = None,
+    include_values: bool = False
 ):
 
     if not has_permission:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
 
-    return await encrypt_data(await controller.process_geo_process(feature, raster_name, user.id.hex))
+    return await encrypt_response(
+        await controller.batch_geo_process(feature, rasters, bands, include_values), payload_encoding, binary_envelope
+    )
 
 
 @app.get("/process/raster/{raster_name}")
@@ -236,13 +290,27 @@ async def post_process_raster(
     raster_name: str,
     controller: Annotated[ProcessController, Depends(ProcessController.inject_controller)],
     user: Annotated[models.User | models.AnonymousUser, Depends(AuthController.get_user_from_token)],
-    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_raster"))]
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_raster"))],
+    payload_encoding: Annotated[str | None, Depends(get_payload_encoding)],
+    binary_envelope: Annotated[bool, Depends(wants_binary_envelope)],
+    encrypted_stream: Annotated[bool, Depends(wants_encrypted_stream)],
+    bands: Annotated[list[int] | None, Query()] = None
 ):
 
     if not has_permission:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
 
-    return await encrypt_data(await controller.process_raster(raster_name, user.id.hex))
+    if encrypted_stream:
+        headers = {ENCRYPTION_HEADER: "aes-gcm-stream"}
+        if payload_encoding:
+            headers[PAYLOAD_ENCODING_HEADER] = payload_encoding
+        return StreamingResponse(
+            encryption_service.encrypt_stream(await controller.process_raster_stream(raster_name, bands), payload_encoding),
+            media_type=ENCRYPTED_STREAM_MEDIA_TYPE,
+            headers=headers
+        )
+
+    return await encrypt_response(await controller.process_raster(raster_name, user.id.hex, bands), payload_encoding, binary_envelope)
 
 
 @app.post("/process/dash-data/{energy_type}")
@@ -251,7 +319,9 @@ async def get_dash_data(
     energy_type: str,
     user: Annotated[models.User, Depends(AuthController.get_user_from_token)],
     controller: Annotated[ProcessController, Depends(ProcessController.inject_controller)],
-    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_dash_data"))]
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_dash_data"))],
+    payload_encoding: Annotated[str | None, Depends(get_payload_encoding)],
+    binary_envelope: Annotated[bool, Depends(wants_binary_envelope)]
 ):
     if not has_permission:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
@@ -262,10 +332,16 @@ async def get_dash_data(
         results = []
         for single_feature in feature.features:
             result = await controller.dash_data(single_feature, energy_type)
-            results.append(await encrypt_data(result))
-        return results  # Return a list of encrypted results for each feature
+            if binary_envelope:
+                results.append(result)
+            else:
+                results.append(await encryption_service.encrypt(result, payload_encoding))
+        # The binary envelope holds the list of results, the base64 mode returns a list of encrypted results
+        if binary_envelope:
+            return await encrypt_response(results, payload_encoding, binary_envelope)
+        return results
 
-    return await encrypt_data(await controller.dash_data(feature, energy_type))
+    return await encrypt_response(await controller.dash_data(feature, energy_type), payload_encoding, binary_envelope)
 
 
 @app.get("/sentry-debug")
@@ -274,33 +350,88 @@ async def trigger_error():
     return division_by_zero
 
 
+@app.get("/metrics/database", status_code=status.HTTP_200_OK)
+async def get_database_metrics(
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_metrics"))]
+):
+
+    if not has_permission:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
+
+    # Pools are per worker, so the numbers are the ones of the worker that answered
+    return {"pid": os.getpid(), "pools": pool_metrics.snapshot()}
+
+
 @app.get("/geofiles/polygon/{table_name}")
 async def get_geofiles_polygon(
     table_name: str,
-    response: Response,
+    controller: Annotated[GeoFilesController, Depends(GeoFilesController.inject_controller)],
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_polygon"))],
+    bbox: Annotated[str | None, Query(description="minx,miny,maxx,maxy em EPSG:4326")] = None,
+    columns: Annotated[str | None, Query(description="Colunas separadas por vírgula")] = None,
+    where: Annotated[list[str] | None, Query(description="coluna:operador:valor, operadores eq, ne, lt, lte, gt, gte, like, in")] = None,
+    limit: Annotated[int | None, Query(ge=1, le=10000)] = None,
+    cursor: str | None = None,
+    resolution: Annotated[Literal['full', 'high', 'medium', 'low'] | None, Query()] = None,
+    zoom: Annotated[float | None, Query(ge=0, le=24, description="Zoom do mapa, escolhe a resolution quando ela não é informada")] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    accept_encoding: Annotated[str | None, Header()] = None
+):
+
+    if not has_permission:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
+
+    try:
+        query = PolygonQuery(
+            bbox=PolygonQuery.parse_bbox(bbox),
+            columns=[column.strip() for column in columns.split(",") if column.strip()] if columns is not None else None,
+            filters=[AttributeFilter.parse(expression) for expression in where or []],
+            limit=limit,
+            cursor=cursor,
+            resolution=resolution or (PolygonQuery.resolution_for_zoom(zoom) if zoom is not None else 'full')
+        )
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+    return await controller.get_polygon(
+        table_name=table_name, query=query, if_none_match=if_none_match, accept_encoding=accept_encoding
+    )
+
+
+@app.get("/tiles/{table_name}/{z}/{x}/{y}.mvt")
+async def get_vector_tile(
+    table_name: str,
+    z: int,
+    x: int,
+    y: int,
     controller: Annotated[GeoFilesController, Depends(GeoFilesController.inject_controller)],
     has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_polygon"))]
 ):
 
     if not has_permission:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
-    return await controller.get_polygon(table_name=table_name, response=response)
+    return await controller.get_vector_tile(table_name=table_name, z=z, x=x, y=y)
 
 
 @app.get("/geofiles/raster/{z}/{x}/{y}/{table_name}")
 async def get_geofiles_raster(
     table_name: str,
-    x,
-    y,
-    z,
+    x: int,
+    y: int,
+    z: int,
     controller: Annotated[GeoFilesController, Depends(GeoFilesController.inject_controller)],
-    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_raster"))]
+    has_permission: Annotated[bool, Depends(AuthController.get_permission_dependency("view_raster"))],
+    accept: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+    band: Annotated[int, Query(ge=1)] = 1
 ):
 
     if not has_permission:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Não possui permissão.")
 
-    return await controller.get_raster(table_name=table_name, x=x, y=y, z=z)
+    return await controller.get_raster(
+        table_name=table_name, x=x, y=y, z=z, accept=accept, if_none_match=if_none_match, band=band
+    )
 
 
 @app.post("/file",
@@ -673,8 +804,9 @@ async def update_layer(
 )
 async def get_layer_groups(
     controller: Annotated[LayersController, Depends(LayersController.inject_controller)],
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
-    return await controller.get_layer_groups()
+    return await controller.get_layer_groups(if_none_match)
 
 @app.get(
     "/layer-group/all",
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from schemas.email import EmailMessage
+from sql_app import models
+
+
+class EmailOutboxRepository:
+
+    # Time after which an email left as 'sending' by a dead worker is claimed again
+    SENDING_LEASE = timedelta(minutes=10)
+
+    def __init__(self, db: AsyncSession):
+
+        self.db = db
+
+    async def enqueue_email(self, email_message: EmailMessage, with_default_images: bool = True) -> models.EmailOutbox:
+
+        outbox_email = models.EmailOutbox(
+            to=email_message.to_email,
+            subject=email_message.subject,
+            content=email_message.html_content,
+            with_default_images=with_default_images
+        )
+        self.db.add(outbox_email)
+        await self.db.commit()
+        await self.db.refresh(outbox_email)
+        return outbox_email
+
+    async def claim_pending_emails(self, limit: int) -> list[models.EmailOutbox]:
+
+        """
+            Lock a batch of due emails with SKIP LOCKED so concurrent uvicorn workers never claim the same row
+        """
+
+        now = datetime.now()
+        due_emails = (
+            select(models.EmailOutbox.id)
+            .where(or_(
+                (models.EmailOutbox.status == 'pending') & (models.EmailOutbox.next_attempt_at <= now),
+                (models.EmailOutbox.status == 'sending') & (models.EmailOutbox.updated_at <= now - self.SENDING_LEASE)
+            ))
+            .order_by(models.EmailOutbox.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        statement = (
+            update(models.EmailOutbox)
+            .where(models.EmailOutbox.id.in_(due_emails.scalar_subquery()))
+            .values(status='sending', attempts=models.EmailOutbox.attempts + 1, updated_at=now)
+            .returning(models.EmailOutbox)
+        )
+        result = await self.db.execute(statement)
+        emails = result.scalars().all()
+        await self.db.commit()
+        return emails
+
+    async def mark_emails_sent(self, ids: list) -> None:
+
+        if not ids:
+            return
+
+        now = datetime.now()
+        statement = (
+            update(models.EmailOutbox)
+            .where(models.EmailOutbox.id.in_(ids))
+            .values(status='sent', sent_at=now, updated_at=now, error_message=None)
+        )
+        await self.db.execute(statement)
+        await self.db.commit()
+
+    async def mark_emails_failed(self, failures: list[tuple]) -> None:
+
+        """
+            Receives (id, error_message, next_attempt_at) tuples, the email is rescheduled for next_attempt_at
+            or given up when next_attempt_at is None. All updates share a single commit.
+        """
+
+        if not failures:
+            return
+
+        now = datetime.now()
+        for id, error_message, next_attempt_at in failures:
+            values = {'updated_at': now, 'error_message': error_message}
+            if next_attempt_at is None:
+                values['status'] = 'failed'
+            else:
+                values['status'] = 'pending'
+                values['next_attempt_at'] = next_attempt_at
+
+            await self.db.execute(update(models.EmailOutbox).where(models.EmailOutbox.id == id).values(**values))
+
+        await self.db.commit()
+
+    async def create_logs_email(self, logs: list[dict]) -> None:
+
+        if not logs:
+            return
+
+        self.db.add_all([models.LogsEmail(**log) for log in logs])
+        await self.db.commit()
@@ -1,27 +1,73 @@
 import asyncio
+import base64
+import datetime
 import os
 import tempfile
 from asyncio.subprocess import DEVNULL, PIPE
 import re
-from typing import TYPE_CHECKING
+from itertools import islice
+from typing import TYPE_CHECKING, AsyncIterator, NamedTuple
 
+import numpy
+import orjson
+from asyncer import asyncify
 from os import getenv
-from sqlalchemy import MetaData, Table, text
+from sqlalchemy import MetaData, Table, TextClause, text
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel.ext.asyncio.session import AsyncSession
 
-from schemas.geojson import GeoJSON
-from schemas.geometry import Geometry
-from sql_app.models import Geodata, GeoJsonData
+from schemas.polygon_query import SIMPLIFICATION_TOLERANCES, AttributeFilter, PolygonQuery
+from scripts.layer_schema import iter_geojson_features
+from scripts.memory_raster import MemoryRaster, open_raster_bytes
+from sql_app.database import session_router
+from sql_app.models import CacheVersion, Geodata, GeoJsonData, Layer
 from sqlmodel import select
 
 if TYPE_CHECKING:
     import geopandas
-    from osgeo.gdal import Dataset
+
+
+class VectorTableSource(NamedTuple):
+    srid: int
+    columns: list[tuple[str, str]]
+    simplified_levels: set[str]
+    geographic: bool
 
 
 class GeoRepository:
 
     TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+    RASTER_SRID = 4674
+    RASTER_NODATA = -9999
+    RASTER_TILE_SIZE = 256
+    RASTER_OVERVIEW_FACTORS = (2, 4, 8, 16, 32, 64)
+    RASTER_TILE_QUERIES: dict[tuple[str, int], TextClause] = {}
+    RASTER_PYRAMIDS: dict[str, list[tuple[str, float | None]]] = {}
+    RASTER_BAND_COUNTS: dict[str, int] = {}
+    RASTER_VALUE_RANGES: dict[tuple[str, int], tuple[float, float] | None] = {}
+    # Version of each raster on Cache_Versions with the loop time it was read, checked at most every
+    # CACHE_VERSION_REVALIDATE_SECONDS so uploads handled by another uvicorn worker reach the caches above
+    RASTER_CACHE_VERSIONS: dict[str, tuple[int, float]] = {}
+    CACHE_VERSION_REVALIDATE_SECONDS = 5.0
+    WEB_MERCATOR_WIDTH = 40075016.68557849
+    MVT_EXTENT = 4096
+    METERS_PER_DEGREE = 111320.0
+    INGEST_BATCH_SIZE = 5000
+    STREAM_PARTITION_SIZE = 1000
+    PROPERTY_SQL_TYPES = {
+        'integer': 'bigint',
+        'number': 'double precision',
+        'boolean': 'boolean',
+        'string': 'text',
+        'null': 'text',
+    }
+
+    FILTER_OPERATORS = {'eq': '=', 'ne': '<>', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>='}
+    UNFILTERABLE_TYPES = {'json', 'jsonb', 'geometry', 'bytea'}
+
+    _vector_table_sources: dict[str, VectorTableSource] = {}
+    # Same as RASTER_CACHE_VERSIONS for _vector_table_sources, ingests, drops and backfills bump the version
+    _vector_cache_versions: dict[str, tuple[int, float]] = {}
 
     def __init__(self, db: AsyncSession):
         self.db = db
@@ -39,6 +85,11 @@ class GeoRepository:
 
         return normalized_table_name
 
+    @staticmethod
+    def quote_identifier(identifier: str) -> str:
+
+        return '"' + identifier.replace('"', '""') + '"'
+
     def upload_polygon(self, polygon: "geopandas.GeoDataFrame", table_name: str, increment: bool = True, new_columns: list = None):
 
         import geopandas
@@ -60,8 +111,10 @@ class GeoRepository:
         table_name = self.normalize_table_name(table_name)
         # Drop the previous table if isnt to increment
         if not increment:
-            drop_table_command = f"DROP TABLE IF EXISTS {table_name};"
+            overview_tables = "".join(f", o_{factor}_{table_name}" for factor in self.RASTER_OVERVIEW_FACTORS)
+            drop_table_command = f"DROP TABLE IF EXISTS {table_name}{overview_tables};"
             await self.db.exec(text(drop_table_command))
+            await self._bump_raster_version(table_name)
             await self.db.commit()
 
         database_url = getenv('SYNC_DATABASE_URL')
@@ -88,6 +141,8 @@ class GeoRepository:
                     str(srid),
                     "-t",
                     "256x256",
+                    "-l",
+                    ",".join(str(factor) for factor in self.RASTER_OVERVIEW_FACTORS),
                     raster_path,
                     table_name,
                     stdout=sql_output,
@@ -120,9 +175,14 @@ class GeoRepository:
             if psql_process.returncode != 0:
                 raise RuntimeError(psql_stderr or psql_stdout or "Falha ao importar o raster.")
 
+            # Increments change the raster too, the value range and the levels of every worker are refreshed
+            await self._bump_raster_version(table_name)
+            await self.db.commit()
+
             return {
                 "table_name": table_name,
                 "detail": "Raster importado com sucesso.",
+                "bands": await self.get_raster_band_count(table_name),
                 "output": psql_stdout,
             }
         finally:
@@ -133,30 +193,673 @@ class GeoRepository:
             if os.path.exists(stderr_file_path):
                 os.unlink(stderr_file_path)
 
-    async def get_polygon_by_name(self, table_name) -> GeoJSON:
+    async def ingest_geojson_layer(self, table_name: str, path: str, properties_schema: dict | None, srid: int = 4326) -> int:
 
-        import geopandas
+        """
+            Bulk load a GeoJSON FeatureCollection into its own PostGIS table. Features are streamed from disk
+            and COPY'd into a staging table, typed into a new table with invalid geometries fixed and the
+            simplification levels precomputed, indexed with GiST and only then swapped with the previous table
+            in the same transaction, so readers never see a partially loaded layer
+        """
+
+        table_name = self.normalize_table_name(table_name)
+        loading_table = f"{table_name}_loading"
+        fields = (properties_schema or {}).get('fields', {})
+        columns = self._layer_table_columns(fields)
+
+        # Two uploads of the same layer are loaded one after the other
+        await self.db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:table_name))"), {"table_name": table_name})
+        await self.db.execute(text(f"DROP TABLE IF EXISTS {loading_table}"))
+        await self.db.execute(text(
+            "CREATE TEMP TABLE layer_staging (feature_geometry text, properties jsonb) ON COMMIT DROP"
+        ))
+        geometry_type = f"geometry(Geometry, {int(srid)})"
+        level_definitions = "".join(f", geometry_{level} {geometry_type}" for level in SIMPLIFICATION_TOLERANCES)
+        column_definitions = "".join(f", {self.quote_identifier(name)} {sql_type}" for name, _, sql_type in columns)
+        await self.db.execute(text(
+            f"CREATE TABLE {loading_table} (gid bigserial PRIMARY KEY, geometry {geometry_type}{level_definitions}{column_definitions})"
+        ))
+
+        connection = await self.db.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            features = iter_geojson_features(file)
+            read_batch = asyncify(lambda: [self._staging_record(feature) for feature in islice(features, self.INGEST_BATCH_SIZE)])
+            while records := await read_batch():
+                await driver_connection.copy_records_to_table(
+                    "layer_staging", records=records, columns=["feature_geometry", "properties"]
+                )
+
+        keys = {f"key_{index}": key for index, (_, key, _) in enumerate(columns)}
+        geographic = await self._is_geographic(srid)
+        tolerances = {f"tolerance_{level}": self.simplification_tolerance(level, geographic) for level in SIMPLIFICATION_TOLERANCES}
+        selected_levels = "".join(
+            f", ST_SimplifyPreserveTopology(feature.geometry, :tolerance_{level})" for level in SIMPLIFICATION_TOLERANCES
+        )
+        selected_values = "".join(
+            f", {self._typed_property(f'key_{index}', sql_type)}" for index, (_, _, sql_type) in enumerate(columns)
+        )
+        inserted_levels = "".join(f", geometry_{level}" for level in SIMPLIFICATION_TOLERANCES)
+        inserted_columns = "".join(f", {self.quote_identifier(name)}" for name, _, _ in columns)
+        result = await self.db.execute(
+            text(f"""
+                INSERT INTO {loading_table} (geometry{inserted_levels}{inserted_columns})
+                SELECT feature.geometry{selected_levels}{selected_values}
+                FROM (
+                    SELECT CASE WHEN ST_IsValid(raw.geometry) THEN raw.geometry ELSE ST_MakeValid(raw.geometry) END AS geometry,
+                           raw.properties
+                    FROM (
+                        SELECT ST_Force2D(ST_SetSRID(ST_GeomFromGeoJSON(feature_geometry), :srid)) AS geometry, properties
+                        FROM layer_staging
+                        WHERE feature_geometry IS NOT NULL
+                    ) AS raw
+                ) AS feature
+            """),
+            {"srid": srid, **tolerances, **keys}
+        )
+        feature_count = result.rowcount
+
+        await self.db.execute(text(f"CREATE INDEX {loading_table}_geometry_idx ON {loading_table} USING GIST (geometry)"))
+        await self.db.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        await self.db.execute(text(f"ALTER TABLE {loading_table} RENAME TO {table_name}"))
+        await self.db.execute(text(f"ALTER INDEX {loading_table}_geometry_idx RENAME TO {table_name}_geometry_idx"))
+        await self.db.execute(text(f"ALTER INDEX {loading_table}_pkey RENAME TO {table_name}_pkey"))
+        await self.db.execute(text(f"ALTER SEQUENCE {loading_table}_gid_seq RENAME TO {table_name}_gid_seq"))
+        await self._bump_vector_version(table_name)
+        await self.db.commit()
+
+        await self.db.execute(text(f"ANALYZE {table_name}"))
+        await self.db.commit()
+
+        return feature_count
+
+    async def store_simplification_levels(self, table_name: str) -> list[str]:
+
+        """
+            Adds the geometry_<level> columns ingest_geojson_layer creates to a polygon table loaded before the
+            levels existed, and fills them for the rows that do not have them yet, so it can run again safely
+        """
+
+        table_name = self.normalize_table_name(table_name)
+        self._vector_table_sources.pop(table_name, None)
+        source = await self.get_vector_table_source(table_name)
+        if source is None:
+            raise ValueError("Tabela não possui geometria.")
+
+        geometry_type = f"geometry(Geometry, {int(source.srid)})"
+        for level in SIMPLIFICATION_TOLERANCES:
+            await self.db.execute(text(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS geometry_{level} {geometry_type}"))
+
+        tolerances = {
+            f"tolerance_{level}": self.simplification_tolerance(level, source.geographic) for level in SIMPLIFICATION_TOLERANCES
+        }
+        assignments = ", ".join(
+            f"geometry_{level} = ST_SimplifyPreserveTopology(geometry, :tolerance_{level})" for level in SIMPLIFICATION_TOLERANCES
+        )
+        missing = " OR ".join(f"geometry_{level} IS NULL" for level in SIMPLIFICATION_TOLERANCES)
+        await self.db.execute(
+            text(f"UPDATE {table_name} SET {assignments} WHERE geometry IS NOT NULL AND ({missing})"), tolerances
+        )
+        await self._bump_vector_version(table_name)
+        await self.db.commit()
+
+        return list(SIMPLIFICATION_TOLERANCES)
+
+    async def get_polygon_table_names(self) -> list[str]:
+
+        query = select(Geodata.name).filter_by(geotype='polygon').where(Geodata.deleted_at.is_(None))
+        data = await self.db.exec(query)
+        return list(data.all())
+
+    async def drop_layer_table(self, table_name: str) -> None:
+
+        table_name = self.normalize_table_name(table_name)
+        await self.db.execute(text(f"DROP TABLE IF EXISTS {table_name}"))
+        await self._bump_vector_version(table_name)
+        await self.db.commit()
+
+    @classmethod
+    def _layer_table_columns(cls, fields: dict) -> list[tuple[str, str, str]]:
+
+        """
+            (column name, property key, SQL type) of every feature property, column names are cut to the
+            63 bytes Postgres allows and properties colliding with an existing column are left out
+        """
+
+        columns = []
+        used_names = {'gid', 'geometry', *(f'geometry_{level}' for level in SIMPLIFICATION_TOLERANCES)}
+        for key, field in fields.items():
+            name = key.encode("utf-8")[:63].decode("utf-8", errors="ignore")
+            if not name or name.lower() in used_names:
+                continue
+            used_names.add(name.lower())
+            columns.append((name, key, cls.PROPERTY_SQL_TYPES.get(field.get('type'), 'jsonb')))
+        return columns
+
+    @staticmethod
+    def _typed_property(key_parameter: str, sql_type: str) -> str:
+
+        if sql_type == 'jsonb':
+            return f"feature.properties -> :{key_parameter}"
+        if sql_type == 'text':
+            return f"feature.properties ->> :{key_parameter}"
+        return f"(feature.properties ->> :{key_parameter})::{sql_type}"
+
+    @staticmethod
+    def _staging_record(feature: dict) -> tuple[str | None, str]:
+
+        geometry = feature.get('geometry')
+        return (
+            orjson.dumps(geometry).decode() if geometry else None,
+            orjson.dumps(feature.get('properties') or {}).decode()
+        )
 
-        polygon = geopandas.read_postgis(f'select * from {table_name}', geom_col='geometry', con=self.db.bind)
-        return polygon.to_json()
+    async def get_vector_table_source(self, table_name: str) -> VectorTableSource | None:
 
-    async def get_raster(self, table_name, x, y, z) -> Geometry | None:
+        """
+            SRID of the geometry column, the (name, type) of the attribute columns and the simplification
+            levels stored for a vector table, cached per process until the table is loaded, dropped or
+            backfilled again in any worker
+        """
+
+        await self._revalidate_vector(table_name)
+        if table_name in self._vector_table_sources:
+            return self._vector_table_sources[table_name]
+
+        result = await self.db.execute(
+            text("SELECT Find_SRID('public', :table_name, 'geometry')"),
+            {"table_name": table_name}
+        )
+        srid = result.scalar()
+        if srid is None:
+            self._vector_cache_versions.pop(table_name, None)
+            return None
+
+        result = await self.db.execute(
+            text("""
+                SELECT column_name, udt_name FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = :table_name
+                ORDER BY ordinal_position
+            """),
+            {"table_name": table_name}
+        )
+        columns = []
+        simplified_levels = set()
+        for column_name, udt_name in result.fetchall():
+            if udt_name != 'geometry':
+                columns.append((column_name, udt_name))
+            elif column_name.startswith('geometry_') and column_name[len('geometry_'):] in SIMPLIFICATION_TOLERANCES:
+                simplified_levels.add(column_name[len('geometry_'):])
+
+        source = VectorTableSource(srid, columns, simplified_levels, await self._is_geographic(srid))
+        self._vector_table_sources[table_name] = source
+        return source
+
+    async def _is_geographic(self, srid: int) -> bool:
+
+        result = await self.db.execute(
+            text("SELECT proj4text LIKE '%+proj=longlat%' FROM spatial_ref_sys WHERE srid = :srid"),
+            {"srid": srid}
+        )
+        return bool(result.scalar())
+
+    @classmethod
+    def simplification_tolerance(cls, level: str, geographic: bool) -> float:
+
+        """
+            Tolerance of a simplification level in the units of the table SRID
+        """
+
+        tolerance = SIMPLIFICATION_TOLERANCES[level]
+        return tolerance / cls.METERS_PER_DEGREE if geographic else tolerance
+
+    @staticmethod
+    def simplified_geometry(source: VectorTableSource, level: str) -> str:
+
+        """
+            SQL expression of the table geometry at a simplification level, read from the column stored at
+            import when there is one, tables loaded before the levels existed are simplified on the fly
+        """
+
+        if level == 'full':
+            return "t.geometry"
+        if level in source.simplified_levels:
+            return f"t.geometry_{level}"
+        return "ST_SimplifyPreserveTopology(t.geometry, :simplification_tolerance)"
+
+    async def get_table_signature(self, table_name: str) -> str | None:
+
+        """
+            Changes whenever rows of the table are written or the table is replaced. The write counters come
+            from the statistics collector, a stats reset only causes one extra rebuild
+        """
+
+        result = await self.db.execute(
+            text("""
+                SELECT c.oid, c.relfilenode, s.n_tup_ins, s.n_tup_upd, s.n_tup_del
+                FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+                WHERE c.oid = to_regclass(:table_name)
+            """),
+            {"table_name": self.normalize_table_name(table_name)}
+        )
+        row = result.fetchone()
+        return ":".join(str(value) for value in row) if row else None
 
-        sql_query = "set postgis.gdal_enabled_drivers = 'ENABLE_ALL';"
-        await self.db.execute(text(sql_query))
+    async def build_polygon_features_query(self, table_name: str, query: PolygonQuery) -> tuple[str, dict]:
 
+        """
+            SQL returning (key, GeoJSON feature) rows of the table, built by ST_AsGeoJSON, filtered by bbox
+            (EPSG:4326) and attribute filters and paginated by a keyset cursor on gid. Tables without gid can
+            not be paginated, their features are numbered in the order they are read, like the GeoDataFrame
+            index the route returned before. With a limit one extra row is selected to tell if there is a next page.
+        """
+
+        table_name = self.normalize_table_name(table_name)
+        source = await self.get_vector_table_source(table_name)
+        if source is None:
+            raise ValueError("Tabela não possui geometria.")
+
+        column_types = dict(source.columns)
+        selected_columns = query.columns if query.columns is not None else list(column_types)
+        for column in selected_columns + [attribute_filter.column for attribute_filter in query.filters]:
+            if column not in column_types:
+                raise ValueError(f"Coluna '{column}' não existe.")
+
+        if "gid" in column_types:
+            key, order = "t.gid", "ORDER BY t.gid"
+        elif query.limit is not None or query.cursor:
+            raise ValueError("Tabela sem a coluna gid não pode ser paginada.")
+        else:
+            key, order = "row_number() OVER () - 1", ""
+        conditions = []
+        parameters = {"srid": source.srid}
+        if query.resolution != 'full' and query.resolution not in source.simplified_levels:
+            parameters["simplification_tolerance"] = self.simplification_tolerance(query.resolution, source.geographic)
+
+        if query.bbox:
+            conditions.append(
+                "t.geometry && ST_Transform(ST_MakeEnvelope(:min_x, :min_y, :max_x, :max_y, 4326), :srid) "
+                "AND ST_Intersects(t.geometry, ST_Transform(ST_MakeEnvelope(:min_x, :min_y, :max_x, :max_y, 4326), :srid))"
+            )
+            parameters.update(zip(("min_x", "min_y", "max_x", "max_y"), query.bbox))
+
+        for index, attribute_filter in enumerate(query.filters):
+            conditions.append(self._filter_condition(index, attribute_filter, column_types[attribute_filter.column], parameters))
+
+        if query.cursor:
+            conditions.append("t.gid > CAST(CAST(:cursor AS text) AS int8)")
+            parameters["cursor"] = self.decode_cursor(query.cursor)
+
+        limit = ""
+        if query.limit is not None:
+            # One extra row tells if there is a next page
+            limit = "LIMIT :limit"
+            parameters["limit"] = query.limit + 1
+
+        attributes = "".join(f", t.{self.quote_identifier(column)}" for column in selected_columns)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         sql_query = f"""
-            SELECT ST_AsGDALRaster(ST_Union(ST_ColorMap(rast, 1, 'bluered')), 'PNG') AS rast_data
-            FROM {table_name}
-            WHERE ST_Intersects(rast, ST_Transform(ST_TileEnvelope({z}, {x}, {y}), 4674));
+            SELECT feature.key::text, json_build_object(
+                'type', 'Feature',
+                'id', feature.key::text,
+                'geometry', ST_AsGeoJSON(feature.geometry, 9)::json,
+                'properties', to_jsonb(feature.*) - 'key' - 'geometry'
+            )::text
+            FROM (
+                SELECT {key} AS key, {self.simplified_geometry(source, query.resolution)} AS geometry{attributes}
+                FROM {table_name} t
+                {where}
+                {order}
+                {limit}
+            ) AS feature;
         """
-        result = await self.db.execute(text(sql_query))
+        return sql_query, parameters
+
+    async def stream_polygon_features(self, sql_query: str, parameters: dict) -> AsyncIterator[list[tuple[str, str]]]:
+
+        """
+            Rows of a query from build_polygon_features_query read through a server-side cursor,
+            STREAM_PARTITION_SIZE rows at a time
+        """
+
+        result = await self.db.stream(
+            text(sql_query), parameters, execution_options={"yield_per": self.STREAM_PARTITION_SIZE}
+        )
+        async for partition in result.partitions():
+            yield partition
+
+    def _filter_condition(self, index: int, attribute_filter: AttributeFilter, column_type: str, parameters: dict) -> str:
+
+        column = f"t.{self.quote_identifier(attribute_filter.column)}"
+        parameter = f"filter_{index}"
+
+        if attribute_filter.operator == 'like':
+            parameters[parameter] = attribute_filter.value
+            return f"{column}::text ILIKE :{parameter}"
+
+        if column_type in self.UNFILTERABLE_TYPES:
+            raise ValueError(f"Coluna '{attribute_filter.column}' não pode ser filtrada por '{attribute_filter.operator}'.")
+
+        if attribute_filter.operator == 'in':
+            parameters[parameter] = attribute_filter.value.split("|")
+            return f"{column} = ANY(CAST(CAST(:{parameter} AS text[]) AS {column_type}[]))"
+
+        parameters[parameter] = attribute_filter.value
+        # Bound as text and cast by Postgres, otherwise asyncpg would expect a value of the column type
+        return f"{column} {self.FILTER_OPERATORS[attribute_filter.operator]} CAST(CAST(:{parameter} AS text) AS {column_type})"
+
+    @staticmethod
+    def encode_cursor(key: str) -> str:
+
+        return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> str:
+
+        try:
+            return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Cursor inválido.")
+
+    @session_router.read_only
+    async def get_vector_tile(self, table_name: str, z: int, x: int, y: int) -> bytes | None:
+
+        """
+            Mapbox Vector Tile of the table features that intersect the web tile. The bbox filter runs on the
+            native SRID so the GiST index on geometry is used, and geometries are simplified to the tile
+            resolution before being clipped by ST_AsMVTGeom.
+        """
+
+        table_name = self.normalize_table_name(table_name)
+        source = await self.get_vector_table_source(table_name)
+        if source is None:
+            return None
+
+        attributes = "".join(f", t.{self.quote_identifier(column)}" for column, _ in source.columns)
+        # Size in meters of one unit of the 4096 tile extent at this zoom
+        tolerance = self.WEB_MERCATOR_WIDTH / (2 ** z) / self.MVT_EXTENT
+        # Start from the coarsest stored level that is still finer than the tile, it is simplified further below
+        geometry = next(
+            (f"t.geometry_{level}" for level, level_tolerance in SIMPLIFICATION_TOLERANCES.items()
+             if level in source.simplified_levels and level_tolerance <= tolerance),
+            "t.geometry"
+        )
+
+        sql_query = f"""
+            WITH bounds AS (
+                SELECT ST_TileEnvelope(:z, :x, :y) AS envelope,
+                       ST_Transform(ST_TileEnvelope(:z, :x, :y), :srid) AS native_envelope
+            )
+            SELECT ST_AsMVT(tile, :layer_name, {self.MVT_EXTENT}, 'mvt_geometry')
+            FROM (
+                SELECT ST_AsMVTGeom(
+                    ST_SimplifyPreserveTopology(ST_Transform({geometry}, 3857), :tolerance),
+                    bounds.envelope, {self.MVT_EXTENT}, 64, true
+                ) AS mvt_geometry{attributes}
+                FROM {table_name} t, bounds
+                WHERE t.geometry && bounds.native_envelope
+            ) AS tile
+            WHERE tile.mvt_geometry IS NOT NULL;
+        """
+        result = await self.db.execute(
+            text(sql_query),
+            {"z": z, "x": x, "y": y, "srid": source.srid, "tolerance": tolerance, "layer_name": table_name}
+        )
+        tile = result.scalar()
+        return bytes(tile) if tile else None
+
+    @classmethod
+    def raster_tile_query(cls, table_name: str, band: int = 1) -> TextClause:
+
+        """
+            Tile query of a raster table with z, x and y bound. Only the raster tiles that intersect the web tile
+            are read, each clipped to it and resampled onto the 256x256 Web Mercator grid of the tile, so the work
+            depends on the output size and not on how much raster the tile covers. The raw values come back as a
+            GTiff, the colors are applied by the app. The SQL text only changes with the table and the band, so the
+            statement asyncpg prepared for them is reused by every tile
+        """
+
+        query = cls.RASTER_TILE_QUERIES.get((table_name, band))
+        if query is None:
+            if not cls.TABLE_NAME_PATTERN.fullmatch(table_name):
+                raise ValueError("Nome da tabela inválido.")
+            if not isinstance(band, int) or band < 1:
+                raise ValueError(f"Banda inválida: {band}")
+            size, nodata = cls.RASTER_TILE_SIZE, cls.RASTER_NODATA
+            query = text(f"""
+                WITH tile AS (
+                    SELECT
+                        envelope,
+                        ST_Transform(envelope, {cls.RASTER_SRID}) AS native_envelope,
+                        ST_AddBand(
+                            ST_MakeEmptyRaster(
+                                {size}, {size}, ST_XMin(envelope), ST_YMax(envelope),
+                                (ST_XMax(envelope) - ST_XMin(envelope)) / {size}, (ST_YMin(envelope) - ST_YMax(envelope)) / {size},
+                                0, 0, 3857
+                            ),
+                            '32BF'::text, {nodata}, {nodata}
+                        ) AS grid
+                    FROM ST_TileEnvelope(:z, :x, :y) AS envelope
+                ),
+                pieces AS (
+                    SELECT 0 AS layer, grid AS rast FROM tile
+                    UNION ALL
+                    SELECT 1, ST_Transform(ST_Clip(source.rast, {band}, tile.native_envelope, {nodata}, true), tile.grid)
+                    FROM {table_name} AS source, tile
+                    WHERE ST_Intersects(source.rast, tile.native_envelope)
+                ),
+                merged AS (
+                    SELECT ST_Union(rast, 'LAST' ORDER BY layer) AS rast, count(*) AS pieces FROM pieces
+                )
+                SELECT ST_AsGDALRaster(ST_Clip(merged.rast, tile.envelope, {nodata}, true), 'GTiff') AS rast_data
+                FROM tile, merged
+                WHERE merged.pieces > 1
+            """)
+            cls.RASTER_TILE_QUERIES[(table_name, band)] = query
+        return query
+
+    @classmethod
+    def _forget_raster(cls, table_name: str) -> None:
+
+        cls.RASTER_PYRAMIDS.pop(table_name, None)
+        cls.RASTER_BAND_COUNTS.pop(table_name, None)
+        for key in [key for key in cls.RASTER_VALUE_RANGES if key[0] == table_name]:
+            del cls.RASTER_VALUE_RANGES[key]
+
+    async def _bump_cache_version(self, name: str) -> None:
+
+        # Executed before the commit of the change so the new version is visible together with it
+        statement = insert(CacheVersion).values(
+            name=name, version=1, updated_at=datetime.datetime.now()
+        ).on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': CacheVersion.version + 1, 'updated_at': datetime.datetime.now()}
+        )
+        await self.db.execute(statement)
+
+    async def _cache_version_changed(self, versions: dict[str, tuple[int, float]], table_name: str, name: str) -> bool:
+
+        """
+            Whether the version on Cache_Versions differs from the one in versions, also when the table was
+            not seen yet. Read again at most every CACHE_VERSION_REVALIDATE_SECONDS
+        """
+
+        now = asyncio.get_running_loop().time()
+        cached = versions.get(table_name)
+        if cached is not None and now - cached[1] < self.CACHE_VERSION_REVALIDATE_SECONDS:
+            return False
+
+        version = (await self.db.exec(select(CacheVersion.version).filter_by(name=name))).first() or 0
+        versions[table_name] = (version, now)
+        return cached is None or cached[0] != version
+
+    async def _bump_raster_version(self, table_name: str) -> None:
+
+        await self._bump_cache_version(f"raster:{table_name}")
+        self._forget_raster(table_name)
+        self.RASTER_CACHE_VERSIONS.pop(table_name, None)
+
+    async def _revalidate_raster(self, table_name: str) -> None:
+
+        """
+            Drops what this worker cached about the raster when its version on Cache_Versions changed
+        """
+
+        if await self._cache_version_changed(self.RASTER_CACHE_VERSIONS, table_name, f"raster:{table_name}"):
+            self._forget_raster(table_name)
+
+    async def _bump_vector_version(self, table_name: str) -> None:
+
+        await self._bump_cache_version(f"vector:{table_name}")
+        self._vector_table_sources.pop(table_name, None)
+        self._vector_cache_versions.pop(table_name, None)
+
+    async def _revalidate_vector(self, table_name: str) -> None:
+
+        if await self._cache_version_changed(self._vector_cache_versions, table_name, f"vector:{table_name}"):
+            self._vector_table_sources.pop(table_name, None)
+
+    async def get_raster_pyramid(self, table_name: str) -> list[tuple[str, float | None]]:
+
+        """
+            The raster table and its overview tables with their pixel size, finest first. Cached by table
+            until the raster is uploaded again, empty when the table does not exist, which caches nothing
+        """
+
+        if not self.TABLE_NAME_PATTERN.fullmatch(table_name):
+            raise ValueError("Nome da tabela inválido.")
+        await self._revalidate_raster(table_name)
+        pyramid = self.RASTER_PYRAMIDS.get(table_name)
+        if pyramid is not None:
+            return pyramid
+
+        result = await self.db.execute(text("""
+            SELECT 1 AS factor, r_table_name, abs(scale_x)
+            FROM raster_columns
+            WHERE r_table_schema = current_schema() AND r_table_name = :table_name
+            UNION ALL
+            SELECT overview.overview_factor, overview.o_table_name, abs(columns.scale_x)
+            FROM raster_overviews AS overview
+            JOIN raster_columns AS columns
+                ON columns.r_table_schema = overview.o_table_schema AND columns.r_table_name = overview.o_table_name
+            WHERE overview.r_table_schema = current_schema() AND overview.r_table_name = :table_name
+            ORDER BY factor
+        """), {"table_name": table_name.lower()})
+        pyramid = [(level_table, scale) for _, level_table, scale in result.fetchall()]
+        if not pyramid:
+            # raster_columns lists every table with a raster column, so the table does not exist
+            self.RASTER_CACHE_VERSIONS.pop(table_name, None)
+            return pyramid
+        self.RASTER_PYRAMIDS[table_name] = pyramid
+        return pyramid
+
+    @classmethod
+    def raster_level_for_zoom(cls, pyramid: list[tuple[str, float | None]], z: int) -> str:
+
+        # Coarsest level whose pixels are still as small as the pixels of the tile, rasters are in degrees
+        tile_pixel_size = 360 / (2 ** z) / cls.RASTER_TILE_SIZE
+        level = pyramid[0][0]
+        for level_table, scale in pyramid[1:]:
+            if scale is None or scale > tile_pixel_size:
+                break
+            level = level_table
+        return level
+
+    async def get_raster_band_count(self, table_name: str) -> int:
+
+        """
+            Number of bands of the raster table, cached by table like the pyramid. A missing or empty table
+            has 0 bands and is looked up again next time
+        """
+
+        if not await self.get_raster_pyramid(table_name):
+            return 0
+        band_count = self.RASTER_BAND_COUNTS.get(table_name)
+        if band_count is not None:
+            return band_count
+
+        result = await self.db.execute(text(f"SELECT ST_NumBands(rast) FROM {table_name} LIMIT 1"))
+        row = result.fetchone()
+        band_count = int(row[0]) if row and row[0] else 0
+        if band_count:
+            self.RASTER_BAND_COUNTS[table_name] = band_count
+        return band_count
+
+    async def check_raster_bands(self, table_name: str, bands: list[int] | None) -> list[int]:
+
+        """
+            The requested bands, band 1 when none, raises ValueError for bands the raster does not have.
+            Every raster has band 1, so the default does not look the table up
+        """
+
+        if not self.TABLE_NAME_PATTERN.fullmatch(table_name):
+            raise ValueError("Nome da tabela inválido.")
+        bands = list(bands or [1])
+        if bands == [1]:
+            return bands
+        band_count = await self.get_raster_band_count(table_name)
+        invalid = [band for band in bands if not 1 <= band <= band_count]
+        if invalid:
+            raise ValueError(f"Banda inválida: {invalid[0]}, o raster possui {band_count} banda(s).")
+        return bands
+
+    @session_router.read_only
+    async def get_raster_tile(self, table_name, x, y, z, band: int = 1) -> numpy.ma.MaskedArray | None:
+
+        """
+            Raw values of the band on the 256x256 grid of the tile, nodata masked
+        """
+
+        pyramid = await self.get_raster_pyramid(table_name)
+        if not pyramid:
+            return None
+        await self.check_raster_bands(table_name, [band])
+        level = self.raster_level_for_zoom(pyramid, z)
+        result = await self.db.execute(self.raster_tile_query(level, band), {"z": z, "x": x, "y": y})
         raster_datas = result.fetchone()
 
-        if raster_datas:
-            return raster_datas[0]
-        else:
+        if not raster_datas or not raster_datas[0]:
+            return None
+        return await asyncify(self._read_tile_values)(raster_datas[0])
+
+    @staticmethod
+    def _read_tile_values(data: bytes) -> numpy.ma.MaskedArray | None:
+
+        raster = open_raster_bytes(data)
+        if raster is None:
+            return None
+        with raster:
+            band = raster.dataset.GetRasterBand(1)
+            values = band.ReadAsArray()
+            nodata = band.GetNoDataValue()
+        mask = ~numpy.isfinite(values) if nodata is None else (values == nodata) | ~numpy.isfinite(values)
+        return numpy.ma.MaskedArray(values, mask=mask)
+
+    @session_router.read_only
+    async def get_raster_value_range(self, table_name: str, band: int = 1) -> tuple[float, float] | None:
+
+        """
+            Minimum and maximum of the band, read from the coarsest level of the raster and cached by table and
+            band, the relative colormaps are spread over it so neighbouring tiles get the same colors. Uploads
+            reset it in every worker through the raster version, so all of them color with the same range
+        """
+
+        pyramid = await self.get_raster_pyramid(table_name)
+        if not pyramid:
             return None
+        if (table_name, band) in self.RASTER_VALUE_RANGES:
+            return self.RASTER_VALUE_RANGES[(table_name, band)]
+
+        level = pyramid[-1][0]
+        result = await self.db.execute(text(f"""
+            SELECT (stats).min, (stats).max FROM (SELECT ST_SummaryStatsAgg(rast, {int(band)}, true) AS stats FROM {level}) AS summary
+        """))
+        row = result.fetchone()
+        value_range = (float(row[0]), float(row[1])) if row and row[0] is not None else None
+        self.RASTER_VALUE_RANGES[(table_name, band)] = value_range
+        return value_range
 
     async def get_geofile_by_name(self, table_name):
 
@@ -164,27 +867,33 @@ class GeoRepository:
         data = await self.db.exec(query)
         return data.first()
 
-    async def get_raster_dataset(self, table_name) -> "Dataset | None":
+    async def get_raster_dataset(self, table_name, bands: list[int] | None = None) -> MemoryRaster | None:
 
-        from osgeo import gdal
-
-        sql_query = "set postgis.gdal_enabled_drivers = 'ENABLE_ALL';"
-        await self.db.execute(text(sql_query))
+        """
+            The whole raster as a GTiff opened in memory, the caller closes it when done reading. With bands
+            only those bands are unioned and sent, in that order, band 1 of the dataset is the first of them
+        """
 
-        sql_query = f"SELECT ST_AsGDALRaster(ST_Union(rast), 'GTiff') AS rast_data FROM {table_name};"
-        result = await self.db.execute(text(sql_query))
+        if not self.TABLE_NAME_PATTERN.fullmatch(table_name):
+            raise ValueError("Nome da tabela inválido.")
+        if bands:
+            sql_query = f"SELECT ST_AsGDALRaster(ST_Union(ST_Band(rast, CAST(:bands AS integer[]))), 'GTiff') AS rast_data FROM {table_name};"
+            result = await self.db.execute(text(sql_query), {"bands": list(bands)})
+        else:
+            sql_query = f"SELECT ST_AsGDALRaster(ST_Union(rast), 'GTiff') AS rast_data FROM {table_name};"
+            result = await self.db.execute(text(sql_query))
         raster_datas = result.fetchone()
 
         if not raster_datas:
             return None
 
-        with tempfile.NamedTemporaryFile(suffix=".tif", delete=False) as temp_file:
-            temp_file.write(raster_datas[0])
+        return await asyncify(open_raster_bytes)(raster_datas[0])
 
-        dataset = gdal.Open(temp_file.name)
-        os.remove(temp_file.name)
+    async def get_ingested_layer_table(self, table_name: str) -> str | None:
 
-        return dataset
+        query = select(Layer.table_name).filter_by(table_name=table_name, ingest_status='ready').where(Layer.deleted_at.is_(None)).fetch(1)
+        data = await self.db.exec(query)
+        return data.first()
 
     async def get_geofile_download(self, table_name) -> str:
 
@@ -1,10 +1,11 @@
 from fastapi import HTTPException
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sql_app import models
+from sql_app.database import session_router
 from sqlalchemy.orm import selectinload
 from schemas.layers import LayerGroupCreate, LayerCreate
 from sqlmodel import select, delete
-from pathlib import Path
+from sqlalchemy.dialects.postgresql import insert
 import datetime
 from utils.utils import Utils
 import os
@@ -12,13 +13,31 @@ import os
 
 class LayersRepository:
 
+    LAYERS_CACHE_VERSION = 'layers'
+
     def __init__(self, db: AsyncSession):
         self.db = db
 
+    async def get_layers_version(self) -> int:
+        statement = select(models.CacheVersion.version).filter_by(name=self.LAYERS_CACHE_VERSION)
+        version = await self.db.exec(statement)
+        return version.first() or 0
+
+    async def _bump_layers_version(self):
+        # Executed before the commit of every mutation so the new version is visible together with the change
+        statement = insert(models.CacheVersion).values(
+            name=self.LAYERS_CACHE_VERSION, version=1, updated_at=datetime.datetime.now()
+        ).on_conflict_do_update(
+            index_elements=['name'],
+            set_={'version': models.CacheVersion.version + 1, 'updated_at': datetime.datetime.now()}
+        )
+        await self.db.execute(statement)
+
     async def create_layer_group(self, layer_group: LayerGroupCreate):
         new_layer_group = models.LayerGroups(**layer_group.model_dump())
 
         self.db.add(new_layer_group)
+        await self._bump_layers_version()
         await self.db.commit()
         await self.db.refresh(new_layer_group)
         return new_layer_group
@@ -33,6 +52,7 @@ class LayersRepository:
             setattr(existing_layer_group, key, value)
 
         existing_layer_group.updated_at = datetime.datetime.now()
+        await self._bump_layers_version()
         await self.db.commit()
         await self.db.refresh(existing_layer_group)
 
@@ -54,6 +74,7 @@ class LayersRepository:
             layer.deleted_at = now
 
         existing_layer_group.deleted_at = now
+        await self._bump_layers_version()
         await self.db.commit()
 
         return {"detail": "Layer group deleted successfully"}
@@ -76,30 +97,9 @@ class LayersRepository:
                 except Exception:
                     pass
 
-        import json
-
-        # Remove ocorrências nos arquivos JSON de estilos e popups
-        json_files = [
-            Path("assets/public/jsons/layer_style.json"),
-            Path("assets/public/jsons/popups_fields.json"),
-        ]
-
-        for json_file in json_files:
-            if json_file.exists():
-                try:
-                    with open(json_file, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                except json.JSONDecodeError:
-                    data = {}
-
-                # Se existir a chave com o nome da camada, remove
-                if layer_name in data:
-                    del data[layer_name]
-                    with open(json_file, "w", encoding="utf-8") as f:
-                        json.dump(data, f, ensure_ascii=False, indent=4)
-
         # Remove do banco
         await self.db.delete(existing_layer)
+        await self._bump_layers_version()
         await self.db.commit()
 
         return {"detail": "Layer deleted successfully"}
@@ -108,6 +108,7 @@ class LayersRepository:
         new_layer = models.Layer(**layer.model_dump())
 
         self.db.add(new_layer)
+        await self._bump_layers_version()
         await self.db.commit()
         await self.db.refresh(new_layer)
         return new_layer
@@ -133,10 +134,31 @@ class LayersRepository:
         for key, value in layer.model_dump().items():
             setattr(existing_layer, key, value)
 
+        await self._bump_layers_version()
         await self.db.commit()
         await self.db.refresh(existing_layer)
         return existing_layer
 
+    async def update_layer_properties_schema(self, layer: models.Layer, properties_schema: dict | None):
+        layer.properties_schema = properties_schema
+        await self.db.commit()
+        await self.db.refresh(layer)
+        return layer
+
+    async def update_layer_ingest_status(self, id, ingest_status: str, table_name: str | None = None, ingest_error: str | None = None):
+        layer = await self.get_layer_by_id(id)
+        if not layer:
+            return None
+
+        layer.ingest_status = ingest_status
+        layer.ingest_error = ingest_error
+        if table_name:
+            layer.table_name = table_name
+        await self._bump_layers_version()
+        await self.db.commit()
+        await self.db.refresh(layer)
+        return layer
+
     async def get_layer_by_id(self, id: str):
         statement = select(models.Layer).where(models.Layer.deleted_at.is_(None)).filter_by(id=id).fetch(1)
         layer = await self.db.exec(statement)
@@ -162,6 +184,7 @@ class LayersRepository:
         group = await self.db.exec(statement)
         return group.all()
 
+    @session_router.read_only
     async def get_all_groups_and_layers(self):
     # Buscar todos os grupos
         groups_stmt = select(models.LayerGroups).where(models.LayerGroups.deleted_at.is_(None))
@@ -182,7 +205,8 @@ class LayersRepository:
                 "path": layer.path,
                 "path_icon": layer.path_icon,
                 "subtitle": layer.subtitle,
-                "activated": layer.activated
+                "activated": layer.activated,
+                "table_name": layer.table_name if layer.ingest_status == 'ready' else None
             })
 
         # Indexar grupos por grupo pai
@@ -1,5 +1,6 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sql_app import models
+from sql_app.database import session_router
 from schemas.media import CreatePdf, CreateVideo
 from sqlmodel import select, delete
 import datetime
@@ -30,6 +31,7 @@ class MediaRepository:
         file = await self.db.exec(statment)
         return file.all()
 
+    @session_router.read_only
     async def list_file(self, category_filter: str | None, filter_map: bool, sub_category_filter: str | None):
 
         statement = select(models.PdfFile)
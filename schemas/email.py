@@ -1,7 +1,36 @@
+from functools import lru_cache
+
 from pydantic import BaseModel
 from email.mime.image import MIMEImage
 
 
+DEFAULT_LOGO_IMAGES = (
+    ('utils/htmls/assets/GOVERNO_DO_ESTADO_SEDEC.png', 'estado'),
+    ('utils/htmls/assets/ISI_ER.png', 'isi'),
+    ('utils/htmls/assets/logo.png', 'logo'),
+)
+
+
+@lru_cache(maxsize=1)
+def load_default_logo_images() -> tuple[MIMEImage, ...]:
+
+    """
+        The images are read and base64 encoded only once per process, the parts are never changed
+        after being built so the same instances are attached to every message
+    """
+
+    images = []
+    for path, content_id in DEFAULT_LOGO_IMAGES:
+        with open(path, 'rb') as image_file:
+            image = MIMEImage(image_file.read(), _subtype='png')
+        image.add_header('Content-ID', f'<{content_id}>')
+        image.add_header('Content-Type', f'image/png; name="{content_id}.png"')
+        image.add_header('Content-Disposition', f'inline; filename="{content_id}.png"')
+        images.append(image)
+
+    return tuple(images)
+
+
 class EmailMessage(BaseModel):
     subject: str
     to_email: str
@@ -11,23 +40,4 @@ class EmailMessage(BaseModel):
     @classmethod
     def with_default_logo_images(cls, subject: str, to_email: str, html_content: str):
 
-        with open('utils/htmls/assets/GOVERNO_DO_ESTADO_SEDEC.png', 'rb') as estado_file:
-            state = MIMEImage(estado_file.read(), _subtype='png')
-            state.add_header('Content-ID', '<estado>')
-            state.add_header('Content-Type', 'image/png; name="estado.png"')
-            state.add_header('Content-Disposition', 'inline; filename="estado.png"')
-
-        with open('utils/htmls/assets/ISI_ER.png', 'rb') as isi_er_file:
-            isi_er = MIMEImage(isi_er_file.read(), _subtype='png')
-            isi_er.add_header('Content-ID', '<isi>')
-            isi_er.add_header('Content-Type', 'image/png; name="isi.png"')
-            isi_er.add_header('Content-Disposition', 'inline; filename="isi.png"')
-
-        with open('utils/htmls/assets/logo.png', 'rb') as logo_file:
-            logo = MIMEImage(logo_file.read(), _subtype='png')
-            logo.add_header('Content-ID', '<logo>')
-            logo.add_header('Content-Type', 'image/png; name="logo.png"')
-            logo.add_header('Content-Disposition', 'inline; filename="logo.png"')
-
-        default_images = [state, isi_er, logo]
-        return cls(subject=subject, to_email=to_email, html_content=html_content, images=default_images)
+        return cls(subject=subject, to_email=to_email, html_content=html_content, images=list(load_default_logo_images()))
@@ -13,3 +13,5 @@ class LayerCreate(BaseModel):
     subtitle: str | None = None
     activated: bool = False
     layer_group_id: str
+    properties_schema: dict | None = None
+    ingest_status: str | None = None
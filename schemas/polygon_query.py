@@ -0,0 +1,75 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+# Simplification tolerances in meters of the geometry levels stored at import, coarsest first
+SIMPLIFICATION_TOLERANCES = {'low': 1000.0, 'medium': 100.0, 'high': 10.0}
+# Ground size in meters of one pixel of a 256px web tile at zoom 0
+ZOOM_0_PIXEL_SIZE = 156543.03392804097
+
+
+class AttributeFilter(BaseModel):
+
+    """
+    Attribute filter of the polygon API written as column:operator:value,
+    'in' takes the values separated by |
+    """
+
+    column: str
+    operator: Literal['eq', 'ne', 'lt', 'lte', 'gt', 'gte', 'like', 'in']
+    value: str
+
+    @classmethod
+    def parse(cls, expression: str) -> "AttributeFilter":
+
+        parts = expression.split(":", 2)
+        if len(parts) != 3 or not parts[0]:
+            raise ValueError(f"Filtro inválido '{expression}', use coluna:operador:valor")
+
+        column, operator, value = parts
+        if operator not in cls.model_fields['operator'].annotation.__args__:
+            raise ValueError(f"Operador '{operator}' inválido")
+
+        return cls(column=column, operator=operator, value=value)
+
+
+class PolygonQuery(BaseModel):
+    bbox: tuple[float, float, float, float] | None = None
+    columns: list[str] | None = None
+    filters: list[AttributeFilter] = []
+    limit: int | None = None
+    cursor: str | None = None
+    resolution: Literal['full', 'high', 'medium', 'low'] = 'full'
+
+    def is_whole_table(self) -> bool:
+
+        return not (self.bbox or self.columns is not None or self.filters or self.limit or self.cursor)
+
+    @staticmethod
+    def resolution_for_zoom(zoom: float) -> str:
+
+        """
+            Coarsest level whose tolerance is still smaller than a pixel at the zoom
+        """
+
+        pixel_size = ZOOM_0_PIXEL_SIZE / 2 ** zoom
+        for level, tolerance in SIMPLIFICATION_TOLERANCES.items():
+            if tolerance <= pixel_size:
+                return level
+        return 'full'
+
+    @staticmethod
+    def parse_bbox(bbox: str | None) -> tuple[float, float, float, float] | None:
+
+        if not bbox:
+            return None
+
+        try:
+            min_x, min_y, max_x, max_y = (float(value) for value in bbox.split(","))
+        except ValueError:
+            raise ValueError("bbox inválido, use minx,miny,maxx,maxy em EPSG:4326")
+
+        if min_x > max_x or min_y > max_y:
+            raise ValueError("bbox inválido, o mínimo é maior que o máximo")
+
+        return min_x, min_y, max_x, max_y
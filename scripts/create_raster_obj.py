@@ -1,24 +1,49 @@
 import numpy as np
-from typing import TYPE_CHECKING
+import orjson
+from typing import TYPE_CHECKING, Iterator
 
 if TYPE_CHECKING:
     from osgeo.gdal import Dataset
 
+ROWS_PER_BLOCK = 256
+NODATA = -9999
+
+
+def read_bands(ds: "Dataset", x_offset: int = 0, y_offset: int = 0, x_size: int | None = None, y_size: int | None = None) -> np.ndarray:
+
+    """
+        Every band of the window in a single read, shaped (bands, rows, columns) also for one band
+    """
+
+    values = ds.ReadAsArray(x_offset, y_offset, x_size, y_size)
+    return values.reshape(-1, *values.shape[-2:])
+
+
+def pixel_values(values: np.ndarray) -> list:
+
+    """
+        JSON value of each pixel of a (bands, pixels) array, the value itself for one band and the list
+        of the band values, None where a band has no data, for many
+    """
+
+    if len(values) == 1:
+        return [round(float(val), 2) for val in values[0]]
+    return [[None if val == NODATA else round(float(val), 2) for val in pixel] for pixel in values.T]
+
 
 async def read_raster_as_json(ds: "Dataset"):
 
     if not ds:
         raise FileNotFoundError("Failed to open file")
 
-    # Get the first band
-    band = ds.GetRasterBand(1)
-    data = band.ReadAsArray()
+    # Read all the bands at once
+    data = read_bands(ds)
 
     # Get transform to calculate geographic coordinates
     transform = ds.GetGeoTransform()
 
     # Prepare meshgrid for coordinates
-    x_size, y_size = band.XSize, band.YSize
+    x_size, y_size = ds.RasterXSize, ds.RasterYSize
     x_index, y_index = np.meshgrid(np.arange(x_size), np.arange(y_size))
 
     # Calculate the geographic coordinates of the center of each pixel
@@ -28,13 +53,13 @@ async def read_raster_as_json(ds: "Dataset"):
     # Flatten arrays
     lons = lons.flatten()
     lats = lats.flatten()
-    values = data.flatten()
+    values = data.reshape(len(data), -1)
 
-    # Filter out no-data values (assuming -9999 as no-data value)
-    valid_mask = (values != -9999)
+    # Filter out pixels without data in any band (assuming -9999 as no-data value)
+    valid_mask = (values != NODATA).any(axis=0)
     lons = lons[valid_mask]
     lats = lats[valid_mask]
-    values = values[valid_mask]
+    values = values[:, valid_mask]
 
     # Use the first valid pixel's coordinates as the origin
     origin = {
@@ -49,10 +74,49 @@ async def read_raster_as_json(ds: "Dataset"):
     }
 
     # Round the coordinates and values, and create dictionary
-    data_dict = {f"{lat:.5f} {lon:.5f}": round(float(val), 2) for lat, lon, val in zip(lats, lons, values)}
+    data_dict = {f"{lat:.5f} {lon:.5f}": val for lat, lon, val in zip(lats, lons, pixel_values(values))}
 
     return {
         'data': data_dict,
         'origin': origin,
         'pixel_size': pixel_size
     }
+
+
+def iter_raster_json(ds: "Dataset", rows_per_block: int = ROWS_PER_BLOCK) -> Iterator[bytes]:
+
+    """
+        Same document as read_raster_as_json written piece by piece, the bands are read rows_per_block
+        rows at a time so memory does not grow with the raster size
+    """
+
+    if not ds:
+        raise FileNotFoundError("Failed to open file")
+
+    transform = ds.GetGeoTransform()
+    x_size, y_size = ds.RasterXSize, ds.RasterYSize
+
+    header = {
+        'origin': {'lat': transform[3], 'lng': transform[0]},
+        'pixel_size': {'lat': -transform[5], 'lng': -transform[1]}
+    }
+    yield orjson.dumps(header)[:-1] + b',"data":{'
+
+    lons = transform[0] + (np.arange(x_size) + 0.5) * transform[1]
+    first = True
+    for row in range(0, y_size, rows_per_block):
+        rows = min(rows_per_block, y_size - row)
+        values = read_bands(ds, 0, row, x_size, rows)
+        lats = transform[3] + (np.arange(row, row + rows) + 0.5) * transform[5]
+
+        # Filter out pixels without data in any band (assuming -9999 as no-data value)
+        y_index, x_index = np.nonzero((values != NODATA).any(axis=0))
+        block = {
+            f"{lat:.5f} {lon:.5f}": val
+            for lat, lon, val in zip(lats[y_index], lons[x_index], pixel_values(values[:, y_index, x_index]))
+        }
+        if block:
+            yield (b"" if first else b",") + orjson.dumps(block)[1:-1]
+            first = False
+
+    yield b"}}"
@@ -5,64 +5,209 @@ import numpy as np
 from asyncer import asyncify
 
 from schemas.feature import Feature
+from scripts.create_raster_obj import NODATA, read_bands
 
 if TYPE_CHECKING:
     from osgeo.gdal import Dataset
+    from osgeo.ogr import Geometry
 
+# .35356 = .25 * sqrt(2) ; .25 = distancia entre pixels / 2 ; sqrt(2) = diagonal do quadrado
+BUFFER_DISTANCES = {'wind': .35356/111.11, 'ghi': .35356/111.11}
 
-async def clip_and_get_pixel_values(feature: Feature, src_ds: "Dataset", raster_name: str):
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+HISTOGRAM_BINS = 20
+# Duration curve sampled at every 1% of exceedance
+DURATION_CURVE_POINTS = 101
+STATISTICS_DECIMALS = 4
 
-    from osgeo import gdal, ogr, osr
+
+async def clip_and_get_pixel_values(
+    feature: Feature,
+    src_ds: "Dataset",
+    raster_name: str,
+    statistics: bool = False,
+    include_values: bool = False
+):
+
+    """
+        Pixel values of each band inside the buffered geometry. By default the raw values sorted descending,
+        with statistics the zonal statistics of each band instead, plus the raw values when include_values
+    """
 
     if not src_ds:
         raise RuntimeError("Could not open source dataset")
 
-    srcband = src_ds.GetRasterBand(1)
+    geom = await asyncify(geometry_from_feature)(feature)
+    mask_array = await asyncify(rasterize_mask)(geom, buffer_distance(raster_name), src_ds)
+
+    # One value per band and pixel, the bands are only read inside the bounding box of the mask
+    band_values = await asyncify(masked_band_values)(src_ds, mask_array)
+
+    properties = {'name': feature.properties.name}
+    properties.update(await asyncify(zonal_properties)(band_values, statistics, include_values))
+    return {'type': 'ResponseData', 'properties': properties}
+
+
+class ZonalBatch:
+
+    """
+        Zonal statistics of one geometry over many rasters, summarized one raster at a time so the caller
+        can close each raster before loading the next. The geometry is parsed once and its mask is
+        rasterized once per distinct grid and buffer
+    """
+
+    def __init__(self, feature: Feature, include_values: bool = False):
+        self.feature = feature
+        self.include_values = include_values
+        self.masks: dict[tuple, np.ndarray] = {}
+        self._geom = None
+
+    async def summarize(self, raster_name: str, src_ds: "Dataset") -> dict:
+
+        if not src_ds:
+            raise RuntimeError("Could not open source dataset")
+
+        distance = buffer_distance(raster_name)
+        if self._geom is None:
+            self._geom = await asyncify(geometry_from_feature)(self.feature)
+        key = (distance, raster_grid(src_ds))
+        if key not in self.masks:
+            self.masks[key] = await asyncify(rasterize_mask)(self._geom, distance, src_ds)
+
+        band_values = await asyncify(masked_band_values)(src_ds, self.masks[key])
+        return await asyncify(zonal_properties)(band_values, True, self.include_values)
+
+    def response(self, summaries: dict[str, dict]) -> dict:
+
+        return {'type': 'ResponseData', 'properties': {'name': self.feature.properties.name, 'rasters': summaries}}
+
+
+def buffer_distance(raster_name: str) -> float:
 
-    pixel_values_list = []
+    # Distance of the buffer in the units of the spatial reference
+    distance = BUFFER_DISTANCES.get(raster_name.split('_')[0])
+    if distance is None:
+        raise ValueError(f"Raster não suportado no processamento: {raster_name}")
+    return distance
+
+
+def geometry_from_feature(feature: Feature) -> "Geometry":
+
+    from osgeo import ogr
 
-    geometry = json.dumps(feature.geometry.model_dump())
     # Convert GeoJSON to an OGR geometry
-    geom = await asyncify(ogr.CreateGeometryFromJson)(geometry)
+    return ogr.CreateGeometryFromJson(json.dumps(feature.geometry.model_dump()))
+
+
+def raster_grid(src_ds: "Dataset") -> tuple:
+
+    # Rasters with the same grid share the mask of a geometry
+    return (src_ds.RasterXSize, src_ds.RasterYSize, tuple(src_ds.GetGeoTransform()), src_ds.GetProjection())
+
+
+def rasterize_mask(geom: "Geometry", distance: float, src_ds: "Dataset") -> np.ndarray:
+
+    """
+        1 where the geometry buffered by distance covers a pixel of the grid of src_ds, 0 elsewhere
+    """
+
+    from osgeo import gdal, ogr, osr
+
+    # Apply a buffer to the geometry
+    buffered_geom = geom.Buffer(distance)
 
-    # Apply a buffer to the geometry, specify the distance of the buffer in the units of the spatial reference
-    if raster_name.split('_')[0] == 'wind':
-        buffered_geom = await asyncify(geom.Buffer)(.35356/111.11) # .35356 = .25 * sqrt(2) ; .25 = distancia entre pixels / 2 ; sqrt(2) = diagonal do quadrado
-    elif raster_name.split('_')[0] == 'ghi':
-        buffered_geom = await asyncify(geom.Buffer)(.35356/111.11)
     # Prepare an in-memory raster for the mask
-    mem_driver = await asyncify(gdal.GetDriverByName)('MEM')
+    mem_driver = gdal.GetDriverByName('MEM')
     mask_ds = mem_driver.Create('', src_ds.RasterXSize, src_ds.RasterYSize, 1, gdal.GDT_Byte)
     mask_ds.SetGeoTransform(src_ds.GetGeoTransform())
     mask_ds.SetProjection(src_ds.GetProjection())
 
     # Prepare an in-memory vector layer to hold the buffered geometry
     geom_srs = osr.SpatialReference()
-    await asyncify(geom_srs.ImportFromEPSG)(4674)  # adjust as needed
-    driver = await asyncify(ogr.GetDriverByName)('Memory')
-    geom_ds = await asyncify(driver.CreateDataSource)('geom_ds')
-    geom_layer = await asyncify(geom_ds.CreateLayer)('geom_layer', srs=geom_srs)
+    geom_srs.ImportFromEPSG(4674)  # adjust as needed
+    driver = ogr.GetDriverByName('Memory')
+    geom_ds = driver.CreateDataSource('geom_ds')
+    geom_layer = geom_ds.CreateLayer('geom_layer', srs=geom_srs)
     geom_defn = geom_layer.GetLayerDefn()
     geom_feature = ogr.Feature(geom_defn)
     geom_feature.SetGeometry(buffered_geom)
-    await asyncify(geom_layer.CreateFeature)(geom_feature)
+    geom_layer.CreateFeature(geom_feature)
 
     # Rasterize directly using the buffered geometry
-    await asyncify(gdal.RasterizeLayer)(mask_ds, [1], geom_layer, burn_values=[1])
-
-    # Create a masked array
-    src_array = await asyncify(srcband.ReadAsArray)()
-    raster_band = await asyncify(mask_ds.GetRasterBand)(1)
-    mask_array = await asyncify(raster_band.ReadAsArray)()
-    masked_array = np.ma.masked_where(mask_array == 0, src_array)
-
-    # Filter out specific pixel values, e.g., -9999
-    filtered_array = np.ma.masked_equal(masked_array, -9999)
-
-    # Extract pixel values excluding -9999
-    pixel_values = filtered_array.compressed().tolist()
-    pixel_values_sorted_desc = sorted(pixel_values, reverse=True)
-    pixel_values_list.append(pixel_values_sorted_desc)
-
-    return {'type': 'ResponseData', 'properties': {
-        'pixelValues': pixel_values_list, 'size': len(pixel_values_list[0])/4, 'name': feature.properties.name}}
\ No newline at end of file
+    gdal.RasterizeLayer(mask_ds, [1], geom_layer, burn_values=[1])
+
+    return mask_ds.GetRasterBand(1).ReadAsArray()
+
+
+def zonal_properties(band_values: list[np.ndarray], statistics: bool, include_values: bool) -> dict:
+
+    # Each band is sorted once, for the statistics and for the raw values
+    ordered = [np.sort(values) for values in band_values]
+    properties = {'size': len(band_values[0])/4}
+    if statistics:
+        properties['statistics'] = [zonal_statistics(values, is_sorted=True) for values in ordered]
+    if include_values or not statistics:
+        properties['pixelValues'] = [values[::-1].tolist() for values in ordered]
+    return properties
+
+
+def masked_band_values(src_ds: "Dataset", mask_array: np.ndarray) -> list[np.ndarray]:
+
+    """
+        Values of each band under the mask without -9999. All the bands are read in one pass over the
+        window the mask covers instead of the whole raster
+    """
+
+    rows, columns = np.nonzero(mask_array)
+    if not len(rows):
+        return [np.empty(0) for _ in range(src_ds.RasterCount)]
+
+    y_offset, x_offset = int(rows.min()), int(columns.min())
+    y_size, x_size = int(rows.max()) - y_offset + 1, int(columns.max()) - x_offset + 1
+    window = read_bands(src_ds, x_offset, y_offset, x_size, y_size)
+    values = window[:, rows - y_offset, columns - x_offset]
+
+    return [band_values[band_values != NODATA] for band_values in values]
+
+
+def zonal_statistics(values: np.ndarray, is_sorted: bool = False) -> dict:
+
+    """
+        Count, min, max, mean, PERCENTILES, histogram and duration curve of the values of a band. The values
+        are sorted once with np.sort, which beats partitioning around the hundred ranks the curve needs, and
+        every order statistic is read from them. The percentiles interpolate like np.percentile, the duration
+        curve gives the value exceeded at each percentage of the pixels, from the maximum at 0% down to the
+        minimum at 100%. Values already sorted ascending are passed with is_sorted
+    """
+
+    count = len(values)
+    if not count:
+        return {
+            'count': 0, 'min': None, 'max': None, 'mean': None,
+            'percentiles': {str(percentile): None for percentile in PERCENTILES},
+            'histogram': {'counts': [], 'edges': []},
+            'durationCurve': {'exceedance': [], 'values': []}
+        }
+
+    exceedance = np.linspace(0, 100, DURATION_CURVE_POINTS)
+    percentile_ranks = np.asarray(PERCENTILES) / 100 * (count - 1)
+    curve_ranks = np.rint((1 - exceedance / 100) * (count - 1)).astype(np.intp)
+    ordered = values if is_sorted else np.sort(values)
+
+    lower = ordered[np.floor(percentile_ranks).astype(np.intp)].astype(np.float64)
+    upper = ordered[np.ceil(percentile_ranks).astype(np.intp)].astype(np.float64)
+    percentiles = lower + (upper - lower) * (percentile_ranks - np.floor(percentile_ranks))
+    histogram, edges = np.histogram(ordered, bins=HISTOGRAM_BINS, range=(ordered[0], ordered[count - 1]))
+
+    def rounded(array) -> list[float]:
+        return np.round(np.asarray(array, dtype=np.float64), STATISTICS_DECIMALS).tolist()
+
+    return {
+        'count': count,
+        'min': round(float(ordered[0]), STATISTICS_DECIMALS),
+        'max': round(float(ordered[count - 1]), STATISTICS_DECIMALS),
+        'mean': round(float(values.mean(dtype=np.float64)), STATISTICS_DECIMALS),
+        'percentiles': dict(zip(map(str, PERCENTILES), rounded(percentiles))),
+        'histogram': {'counts': histogram.tolist(), 'edges': rounded(edges)},
+        'durationCurve': {'exceedance': exceedance.tolist(), 'values': rounded(ordered[curve_ranks])}
+    }
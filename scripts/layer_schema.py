@@ -0,0 +1,129 @@
+import json
+from typing import Iterator, TextIO
+
+CHUNK_SIZE = 1024 * 1024
+MAX_SAMPLE_VALUES = 20
+
+
+def _read_until(file: TextIO, buffer: str, token: str) -> tuple[str, int]:
+
+    while (position := buffer.find(token)) < 0:
+        chunk = file.read(CHUNK_SIZE)
+        if not chunk:
+            raise ValueError(f"GeoJSON inválido: '{token}' não encontrado")
+        buffer += chunk
+
+    return buffer, position
+
+
+def iter_geojson_features(file: TextIO) -> Iterator[dict]:
+
+    """
+        Yield the features of a FeatureCollection one by one, keeping in memory only the current
+        feature and one read chunk instead of the whole document
+    """
+
+    decoder = json.JSONDecoder()
+    buffer, position = _read_until(file, file.read(CHUNK_SIZE), '"features"')
+    buffer, position = _read_until(file, buffer[position:], '[')
+    buffer = buffer[position + 1:]
+    position = 0
+    eof = False
+
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+
+        if position >= len(buffer):
+            if eof:
+                raise ValueError("GeoJSON inválido: lista de features incompleta")
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        if buffer[position] == ']':
+            return
+
+        try:
+            feature, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield feature
+        position = end
+        # Drop what was already decoded so the buffer does not grow with the file
+        if position > CHUNK_SIZE:
+            buffer = buffer[position:]
+            position = 0
+
+
+def _json_type(value) -> str:
+
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, float):
+        return 'number'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, list):
+        return 'array'
+    return 'object'
+
+
+def _merge_types(current: str | None, new: str) -> str:
+
+    if current is None or current == 'null' or current == new:
+        return new
+    if new == 'null':
+        return current
+    if {current, new} == {'integer', 'number'}:
+        return 'number'
+    return 'mixed'
+
+
+def extract_property_schema(path: str) -> dict:
+
+    """
+        Stream the layer GeoJSON once and describe its properties: JSON type, how many features
+        have a value, min/max for numbers and strings, and up to MAX_SAMPLE_VALUES distinct values
+    """
+
+    fields = {}
+    feature_count = 0
+
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for feature in iter_geojson_features(file):
+            feature_count += 1
+            for key, value in (feature.get('properties') or {}).items():
+                field = fields.setdefault(key, {'type': None, 'count': 0, 'min': None, 'max': None, 'values': []})
+                field['type'] = _merge_types(field['type'], _json_type(value))
+
+                if value is None:
+                    continue
+
+                field['count'] += 1
+                if field['type'] not in {'integer', 'number', 'string'}:
+                    field['min'] = field['max'] = None
+                    continue
+
+                field['min'] = value if field['min'] is None or value < field['min'] else field['min']
+                field['max'] = value if field['max'] is None or value > field['max'] else field['max']
+                if len(field['values']) < MAX_SAMPLE_VALUES and value not in field['values']:
+                    field['values'].append(value)
+
+    for field in fields.values():
+        field['type'] = field['type'] or 'null'
+
+    return {'feature_count': feature_count, 'fields': fields}
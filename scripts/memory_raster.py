@@ -0,0 +1,58 @@
+from typing import TYPE_CHECKING
+from uuid import uuid4
+
+if TYPE_CHECKING:
+    from osgeo.gdal import Dataset
+
+
+class MemoryRaster:
+
+    """
+        GDAL dataset opened from raster bytes returned by PostGIS, kept in GDAL's /vsimem/ filesystem so
+        nothing touches the disk. The dataset is only valid until close, which closes it before the memory
+        file is unlinked, use it in a with block or close it where the reads end.
+    """
+
+    def __init__(self, data: bytes, extension: str = "tif"):
+
+        from osgeo import gdal
+
+        self.path: str | None = f"/vsimem/{uuid4().hex}.{extension}"
+        gdal.FileFromMemBuffer(self.path, bytes(data))
+        self.dataset: "Dataset | None" = gdal.Open(self.path)
+
+    def close(self) -> None:
+
+        from osgeo import gdal
+
+        self.dataset = None
+        if self.path is not None:
+            gdal.Unlink(self.path)
+            self.path = None
+
+    def __enter__(self) -> "MemoryRaster":
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+
+        self.close()
+
+    def __del__(self):
+
+        # Safety net for a raster nobody closed, the memory file would otherwise live as long as the process
+        if getattr(self, "path", None) is not None:
+            self.close()
+
+
+def open_raster_bytes(data: bytes, extension: str = "tif") -> MemoryRaster | None:
+
+    """
+        The raster bytes opened in memory, None when GDAL cannot read them
+    """
+
+    raster = MemoryRaster(data, extension)
+    if raster.dataset is None:
+        raster.close()
+        return None
+    return raster
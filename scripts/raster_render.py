@@ -0,0 +1,258 @@
+import struct
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from uuid import uuid4
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Index 0 of the lookup table is the transparent nodata color, the values spread over the other 255
+COLOR_LEVELS = 255
+
+# Media type of each tile format, png8 is the 8-bit palette PNG of the lookup table, same pixels in a third of the bytes
+TILE_FORMATS = {"png": "image/png", "png8": "image/png", "webp": "image/webp"}
+WEBP_QUALITY = 85
+
+# Named like the ST_ColorMap presets, stops evenly spread over the value range
+PRESETS = {
+    "bluered": [
+        "#053061", "#2166ac", "#4393c3", "#92c5de", "#d1e5f0", "#f7f7f7",
+        "#fddbc7", "#f4a582", "#d6604d", "#b2182b", "#67001f"
+    ],
+    "grayscale": ["#000000", "#ffffff"],
+    "greyscale": ["#000000", "#ffffff"],
+    "pseudocolor": ["#0000ff", "#00ff00", "#ff0000"],
+    "fire": ["#000000", "#ff0000", "#ffff00", "#ffffff"],
+}
+DEFAULT_PRESET = "bluered"
+
+
+def parse_color(color) -> tuple[int, int, int, int]:
+
+    if isinstance(color, str):
+        hex_color = color.lstrip("#")
+        if len(hex_color) not in (6, 8):
+            raise ValueError(f"Cor inválida: {color}")
+        channels = [int(hex_color[i:i + 2], 16) for i in range(0, len(hex_color), 2)]
+    else:
+        channels = [int(channel) for channel in color]
+        if len(channels) not in (3, 4):
+            raise ValueError(f"Cor inválida: {color}")
+    if len(channels) == 3:
+        channels.append(255)
+    return tuple(max(0, min(255, channel)) for channel in channels)
+
+
+@dataclass(frozen=True)
+class ColorMap:
+
+    """
+        Color stops of a raster layer. Relative stops are fractions of the value range of the raster, so
+        the same colors apply to every tile, absolute stops are raster values.
+    """
+
+    values: tuple[float, ...]
+    colors: tuple[tuple[int, int, int, int], ...]
+    relative: bool = True
+    interpolate: bool = True
+
+    @classmethod
+    def preset(cls, name: str) -> "ColorMap":
+
+        if name not in PRESETS:
+            raise ValueError(f"Mapa de cores desconhecido: {name}")
+        colors = PRESETS[name]
+        return cls(
+            values=tuple(index / (len(colors) - 1) for index in range(len(colors))),
+            colors=tuple(parse_color(color) for color in colors)
+        )
+
+    @classmethod
+    def from_style(cls, style: dict | None) -> "ColorMap":
+
+        """
+            The colormap entry of a layer style, a preset name, a list of [value, color] stops or
+            {"stops": [...], "interpolate": false}. Values ending in % are relative to the raster range
+        """
+
+        colormap = (style or {}).get("colormap", DEFAULT_PRESET)
+        if isinstance(colormap, str):
+            return cls.preset(colormap)
+
+        interpolate = True
+        if isinstance(colormap, dict):
+            interpolate = bool(colormap.get("interpolate", True))
+            colormap = colormap.get("stops")
+        if not isinstance(colormap, list) or len(colormap) < 2:
+            raise ValueError("O mapa de cores precisa de ao menos duas cores.")
+
+        relative = [isinstance(value, str) and value.strip().endswith("%") for value, _ in colormap]
+        if any(relative) and not all(relative):
+            raise ValueError("Os valores do mapa de cores devem ser todos absolutos ou todos em %.")
+
+        stops = sorted(
+            (float(value.strip()[:-1]) / 100 if relative[0] else float(value), parse_color(color))
+            for value, color in colormap
+        )
+        return cls(
+            values=tuple(value for value, _ in stops),
+            colors=tuple(color for _, color in stops),
+            relative=relative[0],
+            interpolate=interpolate
+        )
+
+    def value_range(self, raster_range: tuple[float, float] | None) -> tuple[float, float]:
+
+        if not self.relative:
+            return self.values[0], self.values[-1]
+        low, high = raster_range or (0.0, 1.0)
+        span = high - low
+        return low + self.values[0] * span, low + self.values[-1] * span
+
+
+@lru_cache(maxsize=64)
+def lookup_table(colormap: ColorMap) -> np.ndarray:
+
+    """
+        256 RGBA colors, the transparent nodata color followed by the stops sampled at 255 levels
+    """
+
+    stops = np.asarray(colormap.values, dtype=np.float64)
+    colors = np.asarray(colormap.colors, dtype=np.float64)
+    levels = np.linspace(stops[0], stops[-1], COLOR_LEVELS)
+
+    if colormap.interpolate:
+        table = np.column_stack([np.interp(levels, stops, colors[:, channel]) for channel in range(4)])
+    else:
+        table = colors[np.clip(np.searchsorted(stops, levels, side="right") - 1, 0, len(stops) - 1)]
+
+    return np.vstack([np.zeros((1, 4)), np.rint(table)]).astype(np.uint8)
+
+
+def color_indices(values: np.ma.MaskedArray, value_range: tuple[float, float]) -> np.ndarray:
+
+    """
+        Lookup table index of every pixel, 0 where there is no data
+    """
+
+    low, high = value_range
+    data = np.ma.getdata(values).astype(np.float64, copy=False)
+    invalid = np.ma.getmaskarray(values) | ~np.isfinite(data)
+
+    scale = (COLOR_LEVELS - 1) / (high - low) if high > low else 0.0
+    indices = np.clip(np.nan_to_num((data - low) * scale), 0, COLOR_LEVELS - 1).astype(np.uint8) + 1
+    indices[invalid] = 0
+    return indices
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def encode_png(rgba: np.ndarray, compression: int = 6) -> bytes:
+
+    """
+        RGBA PNG of a (height, width, 4) uint8 array. Every row uses the Up filter, a numpy subtraction,
+        which compresses the smooth color ramps of a colormap well
+    """
+
+    height, width, _ = rgba.shape
+    rows = rgba.reshape(height, width * 4)
+    filtered = rows.copy()
+    filtered[1:] -= rows[:-1]
+
+    scanlines = np.empty((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 0] = 2
+    scanlines[:, 1:] = filtered
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"".join([
+        PNG_SIGNATURE,
+        _png_chunk(b"IHDR", header),
+        _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression)),
+        _png_chunk(b"IEND", b"")
+    ])
+
+
+def encode_palette_png(indices: np.ndarray, palette: np.ndarray, compression: int = 6) -> bytes:
+
+    """
+        8-bit palette PNG of the lookup table indices, the alpha of each color goes in the tRNS chunk. The
+        indices follow the value order of the lookup table, so the Up filter works on them as on the colors
+    """
+
+    height, width = indices.shape
+    filtered = indices.astype(np.uint8)
+    filtered[1:] -= indices[:-1]
+
+    scanlines = np.empty((height, width + 1), dtype=np.uint8)
+    scanlines[:, 0] = 2
+    scanlines[:, 1:] = filtered
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return b"".join([
+        PNG_SIGNATURE,
+        _png_chunk(b"IHDR", header),
+        _png_chunk(b"PLTE", palette[:, :3].tobytes()),
+        _png_chunk(b"tRNS", palette[:, 3].tobytes()),
+        _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), compression)),
+        _png_chunk(b"IEND", b"")
+    ])
+
+
+@lru_cache(maxsize=1)
+def webp_supported() -> bool:
+
+    try:
+        from osgeo import gdal
+    except ImportError:
+        return False
+    return gdal.GetDriverByName("WEBP") is not None
+
+
+def encode_webp(rgba: np.ndarray, quality: int = WEBP_QUALITY) -> bytes:
+
+    """
+        WebP with alpha of a (height, width, 4) uint8 array, through the GDAL WEBP driver and /vsimem/
+    """
+
+    from osgeo import gdal
+
+    height, width, bands = rgba.shape
+    source = gdal.GetDriverByName("MEM").Create("", width, height, bands, gdal.GDT_Byte)
+    for band in range(bands):
+        source.GetRasterBand(band + 1).WriteArray(rgba[:, :, band])
+
+    path = f"/vsimem/{uuid4().hex}.webp"
+    try:
+        gdal.GetDriverByName("WEBP").CreateCopy(path, source, options=[f"QUALITY={quality}"])
+        size = gdal.VSIStatL(path).size
+        handle = gdal.VSIFOpenL(path, "rb")
+        try:
+            return bytes(gdal.VSIFReadL(1, size, handle))
+        finally:
+            gdal.VSIFCloseL(handle)
+    finally:
+        gdal.Unlink(path)
+
+
+def render_tile(
+    values: np.ma.MaskedArray,
+    colormap: ColorMap,
+    raster_range: tuple[float, float] | None,
+    tile_format: str = "png"
+) -> bytes:
+
+    """
+        Image of a tile of raw raster values in one of TILE_FORMATS, run in the tile renderer processes
+    """
+
+    indices = color_indices(values, colormap.value_range(raster_range))
+    palette = lookup_table(colormap)
+    if tile_format == "png8":
+        return encode_palette_png(indices, palette)
+    if tile_format == "webp":
+        return encode_webp(palette[indices])
+    return encode_png(palette[indices])
@@ -0,0 +1,30 @@
+import asyncio
+import sys
+
+from repositories.geo_repository import GeoRepository
+from sql_app.database import IngestSessionLocal
+
+
+async def store_simplification_levels(table_names: list[str]) -> None:
+
+    """
+        Backfills the simplification levels of polygon tables loaded before ingest_geojson_layer stored them,
+        every polygon table listed on Geodata when no table is given. Runs on the ingest session, which has no
+        statement timeout. The app workers read the new columns when they start, until then they keep
+        simplifying those tables on the fly. Usage: python -m scripts.store_simplification_levels [table ...]
+    """
+
+    async with IngestSessionLocal() as db:
+        repository = GeoRepository(db=db)
+        for table_name in table_names or await repository.get_polygon_table_names():
+            try:
+                levels = await repository.store_simplification_levels(table_name)
+            except ValueError as error:
+                await db.rollback()
+                print(f"{table_name}: {error}")
+                continue
+            print(f"{table_name}: {', '.join(levels)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(store_simplification_levels(sys.argv[1:]))
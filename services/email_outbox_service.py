@@ -0,0 +1,167 @@
+import asyncio
+from datetime import datetime, timedelta
+from os import getenv
+
+from asyncer import asyncify
+from sentry_sdk import capture_exception
+
+from repositories.email_outbox_repository import EmailOutboxRepository
+from schemas.email import EmailMessage
+from services.email_service import EmailService
+from sql_app import models
+from sql_app.database import SessionLocal
+
+
+class EmailOutboxWorker:
+
+    """
+        Delivers the emails stored in Email_Outbox in batches over a single reused SMTP session.
+        Every uvicorn worker runs one of these, rows are claimed with SKIP LOCKED so they never overlap.
+    """
+
+    def __init__(self):
+        self.email_service: EmailService | None = None
+        self.batch_size = 20
+        self.poll_interval = 30.0
+        self.idle_timeout = 60.0
+        self.max_attempts = 5
+        self.retry_base_seconds = 30
+        self.retry_max_seconds = 3600
+        self._wake_up = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+
+        if self._task is not None:
+            return
+
+        self.email_service = EmailService(
+            host=getenv('SMTP_HOST'),
+            port=getenv('SMTP_PORT'),
+            email=getenv('EMAIL_SMTP'),
+            password=getenv('PASSWORD_SMTP')
+        )
+        self.batch_size = int(getenv('EMAIL_BATCH_SIZE', self.batch_size))
+        self.poll_interval = float(getenv('EMAIL_POLL_INTERVAL_SECONDS', self.poll_interval))
+        self.max_attempts = int(getenv('EMAIL_MAX_ATTEMPTS', self.max_attempts))
+        self._wake_up = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._task = None
+            await asyncify(self.email_service.close)()
+
+    def notify(self) -> None:
+
+        self._wake_up.set()
+
+    def _next_attempt_at(self, attempts: int) -> datetime | None:
+
+        if attempts >= self.max_attempts:
+            return None
+
+        delay = min(self.retry_base_seconds * 2 ** (attempts - 1), self.retry_max_seconds)
+        return datetime.now() + timedelta(seconds=delay)
+
+    async def _run(self) -> None:
+
+        idle_since = None
+        while True:
+            try:
+                delivered = await self.deliver_pending()
+            except Exception as e:
+                capture_exception(e)
+                delivered = 0
+
+            if delivered:
+                idle_since = None
+                continue
+
+            # Release the SMTP session once nothing was sent for idle_timeout seconds
+            idle_since = idle_since or asyncio.get_running_loop().time()
+            if asyncio.get_running_loop().time() - idle_since >= self.idle_timeout:
+                await asyncify(self.email_service.close)()
+
+            try:
+                await asyncio.wait_for(self._wake_up.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_up.clear()
+
+    async def deliver_pending(self) -> int:
+
+        """
+            Send one batch of due emails and return how many rows were processed
+        """
+
+        async with SessionLocal() as db:
+            repository = EmailOutboxRepository(db=db)
+            outbox_emails = await repository.claim_pending_emails(self.batch_size)
+            if not outbox_emails:
+                return 0
+
+            email_messages = [self._to_email_message(outbox_email) for outbox_email in outbox_emails]
+            errors = await asyncify(self.email_service.send_batch)(email_messages)
+
+            sent_ids, failures, logs = [], [], []
+            for outbox_email, error in zip(outbox_emails, errors):
+                if error is None:
+                    sent_ids.append(outbox_email.id)
+                else:
+                    failures.append((outbox_email.id, error, self._next_attempt_at(outbox_email.attempts)))
+
+                logs.append({
+                    'subject': outbox_email.subject,
+                    'content': outbox_email.content,
+                    'to': outbox_email.to,
+                    'sender': self.email_service.email,
+                    'has_error': error is not None,
+                    'error_message': error
+                })
+
+            await repository.mark_emails_sent(sent_ids)
+            await repository.mark_emails_failed(failures)
+            await repository.create_logs_email(logs)
+
+            return len(outbox_emails)
+
+    def _to_email_message(self, outbox_email: models.EmailOutbox) -> EmailMessage:
+
+        if outbox_email.with_default_images:
+            return EmailMessage.with_default_logo_images(
+                subject=outbox_email.subject,
+                to_email=outbox_email.to,
+                html_content=outbox_email.content
+            )
+
+        return EmailMessage(subject=outbox_email.subject, to_email=outbox_email.to, html_content=outbox_email.content, images=[])
+
+
+email_outbox_worker = EmailOutboxWorker()
+
+
+class EmailOutboxService:
+
+    """
+        Entry point used by the controllers, the email is persisted on the outbox and sent later by the worker
+    """
+
+    def __init__(self, repository: EmailOutboxRepository, worker: EmailOutboxWorker = email_outbox_worker):
+        self.repository = repository
+        self.worker = worker
+
+    async def send_email(self, email_message: EmailMessage) -> models.EmailOutbox:
+
+        outbox_email = await self.repository.enqueue_email(email_message)
+        self.worker.notify()
+        return outbox_email
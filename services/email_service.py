@@ -13,35 +13,96 @@ class EmailService:
         self.port = port
         self.email = email
         self.password = password
+        self._server: smtplib.SMTP | None = None
 
     def _replace_safety_url_for_sender_pattern(self, url: str) -> str:
         return url.replace("&", "&amp;").replace("?", "&quest;")
 
-    def _send_email(self, to_email: str, subject: str, content_html: str, images: list[MIMEImage] = []) -> None:
+    def _connect(self) -> smtplib.SMTP:
 
         """
-            If has error raise exeception to be handled on controller layer , but try catch is used to enforce quit connection SMTP
+            Reuse the open SMTP session while the server still answers NOOP, otherwise open a new one
         """
 
+        if self._server is not None:
+            try:
+                if self._server.noop()[0] == 250:
+                    return self._server
+            except smtplib.SMTPException:
+                pass
+            self.close()
+
         server = smtplib.SMTP(host=self.host, port=self.port)
         try:
             context = ssl.create_default_context()
             server.ehlo()
             server.starttls(context=context)
             server.login(self.email, self.password)
+        except Exception as e:
+            server.close()
+            raise e
+
+        self._server = server
+        return server
+
+    def close(self) -> None:
 
-            email_msg = MIMEMultipart('related')
-            email_msg['From'] = self.email
-            email_msg['To'] = to_email
-            email_msg['Subject'] = subject
-            email_msg.attach(MIMEText(content_html, 'html'))
-            for image in images:
-                email_msg.attach(image)
+        if self._server is None:
+            return
+
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            self._server.close()
+        finally:
+            self._server = None
+
+    def _build_message(self, to_email: str, subject: str, content_html: str, images: list[MIMEImage]) -> MIMEMultipart:
+
+        email_msg = MIMEMultipart('related')
+        email_msg['From'] = self.email
+        email_msg['To'] = to_email
+        email_msg['Subject'] = subject
+        email_msg.attach(MIMEText(content_html, 'html'))
+        for image in images:
+            email_msg.attach(image)
+
+        return email_msg
+
+    def _send_email(self, to_email: str, subject: str, content_html: str, images: list[MIMEImage] = []) -> None:
 
+        """
+            If has error raise exeception to be handled on controller layer , but try catch is used to enforce quit connection SMTP
+        """
+
+        try:
+            server = self._connect()
+            email_msg = self._build_message(to_email, subject, content_html, images)
             server.sendmail(email_msg['From'], email_msg['To'], email_msg.as_string())
-        except Exception as e:
-            server.quit()
-            raise e
+        finally:
+            self.close()
+
+    def send_batch(self, email_messages: list[EmailMessage]) -> list[str | None]:
+
+        """
+            Send all messages over a single SMTP session, returning the error of each message or None when delivered.
+            The session is kept open to be reused by the next batch, call close() when the sender becomes idle.
+        """
+
+        errors = []
+        for email_message in email_messages:
+            try:
+                server = self._connect()
+                email_msg = self._build_message(email_message.to_email, email_message.subject, email_message.html_content, email_message.images)
+                server.sendmail(email_msg['From'], email_msg['To'], email_msg.as_string())
+                errors.append(None)
+            except smtplib.SMTPServerDisconnected as e:
+                self._server = None
+                errors.append(str(e))
+            except Exception as e:
+                errors.append(str(e) or e.__class__.__name__)
+
+        return errors
 
     def send_email_account_confirmation(self, email_message: EmailMessage) -> None:
 
@@ -0,0 +1,142 @@
+import base64
+import gzip
+import os
+import zlib
+from typing import AsyncIterator
+
+import numpy
+import orjson
+from asyncer import asyncify
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+STREAM_FRAME_SIZE = 256 * 1024
+
+
+def _default(value):
+
+    # Arrays orjson does not serialize natively, e.g. non contiguous slices or object dtypes
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError(f"Tipo {type(value).__name__} não é serializável")
+
+
+class EncryptionService:
+
+    """
+        Encrypts the process results sent to the front end. The key is read from ENCRYPTION_KEY once,
+        at lifespan startup, and the serialization and encryption run in a worker thread so big results
+        do not block the event loop.
+    """
+
+    def __init__(self):
+        self._key: bytes | None = None
+
+    def load_key(self) -> None:
+
+        key_hex = os.getenv("ENCRYPTION_KEY")
+        if key_hex is None:
+            raise ValueError("ENCRYPTION_KEY não está definida no ambiente.")
+        self._key = bytes.fromhex(key_hex)
+
+    @property
+    def key(self) -> bytes:
+
+        if self._key is None:
+            self.load_key()
+        return self._key
+
+    @staticmethod
+    def serialize(data, payload_encoding: str | None = None) -> bytes:
+
+        plaintext = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        # Ciphertext does not compress, so the plaintext is compressed before the encryption
+        if payload_encoding == "gzip":
+            plaintext = gzip.compress(plaintext, compresslevel=6)
+        return plaintext
+
+    def _encrypt_cbc(self, data, payload_encoding: str | None) -> str:
+
+        iv = get_random_bytes(16)
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
+        ciphertext = cipher.encrypt(pad(self.serialize(data, payload_encoding), AES.block_size))
+        return base64.b64encode(iv + ciphertext).decode('utf-8')
+
+    def _encrypt_gcm(self, data, payload_encoding: str | None) -> bytes:
+
+        nonce = get_random_bytes(12)
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+        ciphertext, tag = cipher.encrypt_and_digest(self.serialize(data, payload_encoding))
+        return nonce + ciphertext + tag
+
+    async def encrypt(self, data, payload_encoding: str | None = None) -> str:
+
+        """
+            Base64 of the AES-CBC IV and ciphertext
+        """
+
+        return await asyncify(self._encrypt_cbc)(data, payload_encoding)
+
+    async def encrypt_envelope(self, data, payload_encoding: str | None = None) -> bytes:
+
+        """
+            Raw AES-GCM envelope: 12 bytes nonce, ciphertext and 16 bytes authentication tag
+        """
+
+        return await asyncify(self._encrypt_gcm)(data, payload_encoding)
+
+    def _encrypt_frame(self, nonce_prefix: bytes, index: int, plaintext: bytes, final: bool) -> bytes:
+
+        # The counter in the nonce and the final flag in the associated data make reordered or truncated streams fail
+        nonce = nonce_prefix + index.to_bytes(4, "big")
+        cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(b"final" if final else b"frame")
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        return len(ciphertext).to_bytes(4, "big") + nonce + ciphertext + tag
+
+    async def encrypt_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        payload_encoding: str | None = None,
+        frame_size: int = STREAM_FRAME_SIZE
+    ) -> AsyncIterator[bytes]:
+
+        """
+            Encrypts a serialized document as it is produced, in AES-GCM frames of frame_size plaintext bytes.
+            Each frame is 4 bytes ciphertext length, 12 bytes nonce, ciphertext and 16 bytes tag, the
+            decrypted frames concatenated are the document (gzipped when payload_encoding is gzip)
+        """
+
+        nonce_prefix = get_random_bytes(8)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if payload_encoding == "gzip" else None
+        buffer = bytearray()
+        index = 0
+
+        async for chunk in chunks:
+            buffer += compressor.compress(chunk) if compressor else chunk
+            while len(buffer) >= frame_size:
+                frame = bytes(buffer[:frame_size])
+                del buffer[:frame_size]
+                yield await asyncify(self._encrypt_frame)(nonce_prefix, index, frame, False)
+                index += 1
+
+        if compressor:
+            buffer += compressor.flush()
+        yield await asyncify(self._encrypt_frame)(nonce_prefix, index, bytes(buffer), True)
+
+    def decrypt(self, encrypted_data: bytes):
+
+        iv = encrypted_data[:16]
+        ciphertext = encrypted_data[16:]
+
+        cipher = AES.new(self.key, AES.MODE_CBC, iv)
+        plaintext = unpad(cipher.decrypt(ciphertext), AES.block_size)
+
+        return orjson.loads(plaintext)
+
+
+encryption_service = EncryptionService()
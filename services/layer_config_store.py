@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from asyncer import asyncify
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines only get the in-process lock
+    fcntl = None
+
+
+class LayerConfigStore:
+
+    """
+        In-memory index of a layer configuration JSON file (popups or styles) served to the front end.
+        Reads are dict lookups, the file is stat'ed at most once every revalidate_seconds to pick up
+        writes made by other uvicorn workers. Writes hold an exclusive flock, merge over the latest
+        file content and replace the file atomically so concurrent workers never lose or corrupt entries.
+    """
+
+    def __init__(self, path: Path, revalidate_seconds: float = 2.0):
+        self.path = Path(path)
+        self.revalidate_seconds = revalidate_seconds
+        self._data: dict | None = None
+        self._signature = None
+        self._checked_at = 0.0
+        self._thread_lock = threading.Lock()
+
+    def _file_signature(self):
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_file(self) -> dict:
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _refresh(self) -> dict:
+
+        now = time.monotonic()
+        if self._data is not None and now - self._checked_at < self.revalidate_seconds:
+            return self._data
+
+        signature = self._file_signature()
+        if self._data is None or signature != self._signature:
+            self._data = self._read_file()
+            self._signature = signature
+        self._checked_at = now
+        return self._data
+
+    @contextmanager
+    def _exclusive_lock(self):
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._thread_lock, open(f"{self.path}.lock", "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, change) -> dict:
+
+        with self._exclusive_lock():
+            data = self._read_file()
+            if not change(data):
+                self._data, self._signature = data, self._file_signature()
+                return data
+
+            fd, temp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+
+            self._data, self._signature = data, self._file_signature()
+            return data
+
+    async def get(self, layer_name: str):
+
+        return self._refresh().get(layer_name)
+
+    async def set(self, layer_name: str, value) -> dict:
+
+        def change(data: dict) -> bool:
+            data[layer_name] = value
+            return True
+
+        return dict(await asyncify(self._write)(change))
+
+    async def delete(self, layer_name: str) -> None:
+
+        def change(data: dict) -> bool:
+            return data.pop(layer_name, None) is not None
+
+        await asyncify(self._write)(change)
+
+
+popup_store = LayerConfigStore(Path("assets/public/jsons/popups_fields.json"))
+style_store = LayerConfigStore(Path("assets/public/jsons/layers_style.json"))
@@ -0,0 +1,52 @@
+from uuid import UUID
+
+from sentry_sdk import capture_exception
+
+from repositories.geo_repository import GeoRepository
+from repositories.layers_repository import LayersRepository
+from services.layer_tree_cache import layer_tree_cache
+from services.tile_cache import vector_tile_cache
+from sql_app.database import IngestSessionLocal
+
+
+class LayerIngestService:
+
+    """
+        Loads the GeoJSON of an uploaded layer into its own PostGIS table after the upload response was sent.
+        Background tasks run after the request session is closed, so every run opens its own session.
+    """
+
+    READY = 'ready'
+    FAILED = 'failed'
+    PENDING = 'pending'
+
+    @staticmethod
+    def table_name_for(layer_id: UUID) -> str:
+
+        return f"layer_{UUID(str(layer_id)).hex}"
+
+    async def ingest(self, layer_id: UUID, path: str, properties_schema: dict | None) -> None:
+
+        table_name = self.table_name_for(layer_id)
+        async with IngestSessionLocal() as db:
+            layers_repository = LayersRepository(db=db)
+            try:
+                await GeoRepository(db=db).ingest_geojson_layer(table_name, path, properties_schema)
+            except Exception as error:
+                capture_exception(error)
+                await db.rollback()
+                await layers_repository.update_layer_ingest_status(layer_id, self.FAILED, ingest_error=str(error)[:500])
+            else:
+                await layers_repository.update_layer_ingest_status(layer_id, self.READY, table_name=table_name)
+
+        vector_tile_cache.invalidate(table_name)
+        layer_tree_cache.invalidate()
+
+    async def drop(self, table_name: str) -> None:
+
+        async with IngestSessionLocal() as db:
+            await GeoRepository(db=db).drop_layer_table(table_name)
+        vector_tile_cache.invalidate(table_name)
+
+
+layer_ingest_service = LayerIngestService()
@@ -0,0 +1,51 @@
+import asyncio
+import hashlib
+
+import orjson
+
+from repositories.layers_repository import LayersRepository
+from sql_app.database import session_router
+
+
+class LayerTreeCache:
+
+    """
+        Keeps the /layer-group tree already serialized to JSON bytes with its ETag.
+        The version stored on Cache_Versions is checked at most once every revalidate_seconds,
+        so changes made by another uvicorn worker are picked up without rebuilding the tree on every request.
+    """
+
+    def __init__(self, revalidate_seconds: float = 2.0):
+        self.revalidate_seconds = revalidate_seconds
+        self.body: bytes | None = None
+        self.etag: str | None = None
+        self.version: int | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+
+        self.body = None
+        self.etag = None
+        self.version = None
+
+    async def get(self, repository: LayersRepository) -> tuple[bytes, str]:
+
+        if self.body is not None and asyncio.get_running_loop().time() - self._checked_at < self.revalidate_seconds:
+            return self.body, self.etag
+
+        # Version and tree come from the same server, a replica behind the version would cache an old tree under it
+        async with self._lock, session_router.route(repository) as reader:
+            # The version is read before the tree, a change in between only causes an extra rebuild later
+            version = await reader.get_layers_version()
+            if self.body is None or version != self.version:
+                body = orjson.dumps(await reader.get_all_groups_and_layers())
+                self.body = body
+                self.etag = f'"{hashlib.sha1(body).hexdigest()}"'  # nosec B324 - used only as a cache validator
+                self.version = version
+
+            self._checked_at = asyncio.get_running_loop().time()
+            return self.body, self.etag
+
+
+layer_tree_cache = LayerTreeCache()
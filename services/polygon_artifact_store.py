@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+from asyncer import asyncify
+
+try:
+    import brotli
+except ImportError:  # Without Brotli the artifacts are only gzipped
+    brotli = None
+
+
+@dataclass
+class PolygonArtifact:
+    signature: str
+    etag: str
+    files: dict[str, str]
+
+
+class PolygonArtifactStore:
+
+    """
+        Whole polygon tables materialized once as GeoJSON compressed with gzip and brotli on disk,
+        shared by all the uvicorn workers. The artifact is tagged with the table signature it was built
+        from and rebuilt only when the signature changes, the ETag is the hash of the uncompressed GeoJSON.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    @property
+    def encodings(self) -> list[str]:
+
+        return ["br", "gzip"] if brotli else ["gzip"]
+
+    def _metadata_path(self, key: str) -> Path:
+
+        return self.directory / f"{key}.json"
+
+    def _read_metadata(self, key: str) -> PolygonArtifact | None:
+
+        try:
+            with open(self._metadata_path(key), "r", encoding="utf-8") as f:
+                return PolygonArtifact(**json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None
+
+    def get(self, key: str, signature: str) -> PolygonArtifact | None:
+
+        artifact = self._read_metadata(key)
+        if artifact is None or artifact.signature != signature or not all(os.path.exists(path) for path in artifact.files.values()):
+            return None
+        return artifact
+
+    async def get_or_build(self, key: str, signature: str, build: Callable[[], AsyncIterator[bytes]]) -> PolygonArtifact:
+
+        artifact = self.get(key, signature)
+        if artifact:
+            return artifact
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another request of this worker may have built it while we waited
+            artifact = self.get(key, signature)
+            if artifact:
+                return artifact
+            return await self._build(key, signature, build())
+
+    async def _build(self, key: str, signature: str, chunks: AsyncIterator[bytes]) -> PolygonArtifact:
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        compressors = {"gzip": zlib.compressobj(9, zlib.DEFLATED, 31)}
+        if brotli:
+            compressors["br"] = brotli.Compressor(mode=brotli.MODE_TEXT, quality=9)
+
+        temp_files = {
+            encoding: tempfile.NamedTemporaryFile(dir=self.directory, prefix=f".{key}.", suffix=".tmp", delete=False)
+            for encoding in compressors
+        }
+        content_hash = hashlib.sha256()
+
+        def compress(chunk: bytes) -> None:
+            content_hash.update(chunk)
+            for encoding, compressor in compressors.items():
+                temp_files[encoding].write(compressor.process(chunk) if encoding == "br" else compressor.compress(chunk))
+
+        def finish() -> dict[str, str]:
+            etag = content_hash.hexdigest()[:32]
+            files = {}
+            for encoding, compressor in compressors.items():
+                temp_file = temp_files[encoding]
+                temp_file.write(compressor.finish() if encoding == "br" else compressor.flush())
+                temp_file.close()
+                path = self.directory / f"{key}.{etag}.geojson.{'br' if encoding == 'br' else 'gz'}"
+                os.replace(temp_file.name, path)
+                files[encoding] = str(path)
+            return files
+
+        try:
+            async for chunk in chunks:
+                await asyncify(compress)(chunk)
+            files = await asyncify(finish)()
+        except Exception:
+            for temp_file in temp_files.values():
+                temp_file.close()
+                if os.path.exists(temp_file.name):
+                    os.unlink(temp_file.name)
+            raise
+
+        artifact = PolygonArtifact(signature=signature, etag=f'"{content_hash.hexdigest()[:32]}"', files=files)
+        previous = self._read_metadata(key)
+        self._write_metadata(key, artifact)
+        self._remove_stale_files(key, keep={*files.values(), *(previous.files.values() if previous else [])})
+        return artifact
+
+    def _write_metadata(self, key: str, artifact: PolygonArtifact) -> None:
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(artifact.__dict__, f)
+        os.replace(temp_path, self._metadata_path(key))
+
+    def _remove_stale_files(self, key: str, keep: set[str]) -> None:
+
+        # The previous generation is kept for responses of other workers that may still be reading it
+        for path in self.directory.glob(f"{key}.*.geojson.*"):
+            if str(path) not in keep:
+                path.unlink(missing_ok=True)
+
+
+polygon_artifact_store = PolygonArtifactStore(Path("assets/cache/polygons"))
@@ -0,0 +1,60 @@
+import time
+from collections import OrderedDict
+
+
+class TileCache:
+
+    """
+        LRU cache of encoded tiles bounded by total size in bytes, entries expire after ttl_seconds
+        so changes made through another uvicorn worker are eventually served
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._tiles: OrderedDict[tuple, tuple[float, bytes]] = OrderedDict()
+        self._size = 0
+
+    def get(self, key: tuple) -> bytes | None:
+
+        entry = self._tiles.get(key)
+        if entry is None:
+            return None
+
+        created_at, tile = entry
+        if time.monotonic() - created_at > self.ttl_seconds:
+            self._remove(key)
+            return None
+
+        self._tiles.move_to_end(key)
+        return tile
+
+    def set(self, key: tuple, tile: bytes) -> None:
+
+        if len(tile) > self.max_bytes:
+            return
+
+        self._remove(key)
+        self._tiles[key] = (time.monotonic(), tile)
+        self._size += len(tile)
+        while self._size > self.max_bytes:
+            oldest_key = next(iter(self._tiles))
+            self._remove(oldest_key)
+
+    def invalidate(self, table_name: str) -> None:
+
+        """
+            Drop every tile of table_name, keys always start with the table name
+        """
+
+        for key in [key for key in self._tiles if key[0] == table_name]:
+            self._remove(key)
+
+    def _remove(self, key: tuple) -> None:
+
+        entry = self._tiles.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+vector_tile_cache = TileCache()
@@ -0,0 +1,57 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from scripts.raster_render import ColorMap, render_tile
+
+
+class TileRenderer:
+
+    """
+        Colors and encodes raster tiles in a pool of processes, so the rendering scales with the app
+        nodes and does not hold the event loop or the GIL of the uvicorn worker. The pool is started on
+        the first tile and spawns its processes, forking a worker with a running event loop is not safe.
+        A pool broken by a process that died is replaced and the tile rendered again once.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def render(
+        self,
+        values: np.ma.MaskedArray,
+        colormap: ColorMap,
+        raster_range: tuple[float, float] | None,
+        tile_format: str = "png"
+    ) -> bytes:
+
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            return await loop.run_in_executor(executor, render_tile, values, colormap, raster_range, tile_format)
+        except BrokenProcessPool:
+            # Tiles waiting on the same broken pool all land here, only the first one replaces it
+            if self._executor is executor:
+                self.shutdown()
+            return await loop.run_in_executor(self.executor, render_tile, values, colormap, raster_range, tile_format)
+
+    def shutdown(self) -> None:
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+tile_renderer = TileRenderer(int(os.getenv("TILE_RENDER_PROCESSES") or 2))
@@ -38,6 +38,24 @@ class Layer(SQLModel, table=True):
     path: str
     activated: bool = False
     layer_group_id: UUID = Field(foreign_key="layer_group.id")
+    properties_schema: dict | None = Field(default=None, sa_column=Column(pg.JSON, nullable=True))
+    table_name: str | None = Field(default=None, nullable=True)
+    ingest_status: str | None = Field(default=None, nullable=True)
+    ingest_error: str | None = Field(default=None, nullable=True)
+
+class CacheVersion(SQLModel, table=True):
+
+    """
+    This class represents the version of a cached resource, bumped on every change so
+    all the uvicorn workers can tell when their in-memory copy is stale
+    """
+
+    __tablename__ = "Cache_Versions"
+
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+
 
 class GroupPermissionLink(SQLModel, table=True):
     group_id: UUID | None = Field(default=None, foreign_key="Groups.id", primary_key=True)
@@ -199,6 +217,31 @@ class LogsEmail(SQLModel, table=True):
     error_message: str | None = Field(default=None)
 
 
+class EmailOutbox(SQLModel, table=True):
+
+    """
+    This class represents an email waiting to be delivered by the outbox worker
+    """
+
+    __tablename__ = "Email_Outbox"
+
+    id: UUID = Field(
+        sa_column=Column(pg.UUID, primary_key=True, unique=True, default=uuid4)
+    )
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    updated_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now))
+    deleted_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=None, nullable=True))
+    to: str
+    subject: str
+    content: str
+    with_default_images: bool = Field(default=True)
+    status: str = Field(default='pending', index=True)
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, default=datetime.now, index=True))
+    sent_at: datetime | None = Field(sa_column=Column(pg.TIMESTAMP, default=None, nullable=True))
+    error_message: str | None = Field(default=None)
+
+
 class PdfFile(SQLModel, table=True):
 
     """
@@ -0,0 +1,98 @@
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# Upper bounds in seconds of the checkout wait histogram, the last bucket takes everything above
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics:
+
+    """
+        Checkout counters of the connection pools of this worker. Each uvicorn worker has its own pools,
+        so the numbers are per process and the pool usage is read from the pools when the snapshot is taken.
+    """
+
+    def __init__(self):
+        self.pools: dict[str, "InstrumentedQueuePool"] = {}
+        self.reset()
+
+    def reset(self) -> None:
+
+        self.checkouts: dict[str, int] = {}
+        self.timeouts: dict[str, int] = {}
+        self.wait_total: dict[str, float] = {}
+        self.wait_max: dict[str, float] = {}
+        self.wait_histogram: dict[str, list[int]] = {}
+
+    def register(self, name: str, pool: "InstrumentedQueuePool") -> None:
+
+        pool.metrics_name = name
+        self.pools[name] = pool
+
+    def record_checkout(self, name: str, wait: float) -> None:
+
+        self.checkouts[name] = self.checkouts.get(name, 0) + 1
+        self.wait_total[name] = self.wait_total.get(name, 0.0) + wait
+        self.wait_max[name] = max(self.wait_max.get(name, 0.0), wait)
+        histogram = self.wait_histogram.setdefault(name, [0] * (len(WAIT_BUCKETS) + 1))
+        histogram[next((i for i, bound in enumerate(WAIT_BUCKETS) if wait <= bound), len(WAIT_BUCKETS))] += 1
+
+    def record_timeout(self, name: str) -> None:
+
+        self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+    def snapshot(self) -> dict:
+
+        snapshot = {}
+        for name, pool in self.pools.items():
+            checkouts = self.checkouts.get(name, 0)
+            histogram = self.wait_histogram.get(name, [0] * (len(WAIT_BUCKETS) + 1))
+            snapshot[name] = {
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "checkouts": checkouts,
+                "checkout_timeouts": self.timeouts.get(name, 0),
+                "checkout_wait_mean_ms": round(self.wait_total.get(name, 0.0) / checkouts * 1000, 3) if checkouts else 0.0,
+                "checkout_wait_max_ms": round(self.wait_max.get(name, 0.0) * 1000, 3),
+                "checkout_wait_histogram": dict(zip([*(f"le_{bound}" for bound in WAIT_BUCKETS), "inf"], histogram))
+            }
+        return snapshot
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+
+    """
+        Queue pool that records how long each checkout waited for a connection, including the time
+        to open a new one, and the checkouts that gave up after pool_timeout.
+    """
+
+    metrics_name: str | None = None
+
+    def recreate(self) -> "InstrumentedQueuePool":
+
+        # Engine.dispose replaces the pool, the new one keeps reporting under the same name
+        pool = super().recreate()
+        if self.metrics_name:
+            pool_metrics.register(self.metrics_name, pool)
+        return pool
+
+    def _do_get(self):
+
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics_name:
+                pool_metrics.record_timeout(self.metrics_name)
+            raise
+        if self.metrics_name:
+            pool_metrics.record_checkout(self.metrics_name, time.perf_counter() - started)
+        return connection
@@ -0,0 +1,131 @@
+import asyncio
+import copy
+import itertools
+import math
+from contextlib import asynccontextmanager
+from functools import wraps
+from typing import AsyncIterator
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Seconds since the last replayed transaction, 0 when everything received was replayed or on a primary
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class SessionRouter:
+
+    """
+        Sends read only repository methods to the replica engines, round robin between the replicas
+        whose replay lag is under max_lag_seconds. The lag of each replica is measured at most once every
+        check_interval seconds, a replica that fails the check counts as lagging, and without any replica
+        in time the reads stay on the primary.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: list[AsyncEngine],
+        session_maker: async_sessionmaker,
+        max_lag_seconds: float = 5.0,
+        check_interval: float = 2.0,
+        check_timeout: float = 1.0
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.session_maker = session_maker
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.lags: dict[AsyncEngine, float] = {}
+        self._checked_at: float | None = None
+        self._lock = asyncio.Lock()
+        self._round_robin = itertools.count()
+
+    async def _measure_lag(self, engine: AsyncEngine) -> float:
+
+        try:
+            async with asyncio.timeout(self.check_timeout):
+                async with engine.connect() as connection:
+                    lag = (await connection.execute(REPLICA_LAG_QUERY)).scalar()
+        except Exception:
+            return math.inf
+        return math.inf if lag is None else float(lag)
+
+    async def _refresh_lags(self) -> None:
+
+        now = asyncio.get_running_loop().time()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+
+        async with self._lock:
+            # Requests that waited on the lock use the lags measured by the first one
+            if self._checked_at is not None and asyncio.get_running_loop().time() - self._checked_at < self.check_interval:
+                return
+            lags = await asyncio.gather(*(self._measure_lag(engine) for engine in self.replicas))
+            self.lags = dict(zip(self.replicas, lags))
+            self._checked_at = asyncio.get_running_loop().time()
+
+    async def read_engine(self) -> AsyncEngine:
+
+        if not self.replicas:
+            return self.primary
+
+        await self._refresh_lags()
+        healthy = [engine for engine in self.replicas if self.lags.get(engine, math.inf) <= self.max_lag_seconds]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._round_robin) % len(healthy)]
+
+    @asynccontextmanager
+    async def read_session(self) -> AsyncIterator[AsyncSession]:
+
+        """
+            Session of its own on the chosen engine, for reads outside a request session like streamed bodies
+        """
+
+        async with self.session_maker(bind=await self.read_engine()) as db:
+            yield db
+
+    @asynccontextmanager
+    async def route(self, repository):
+
+        """
+            The repository itself when the reads stay on the primary, otherwise a copy of it bound to a
+            replica session. Reads that must agree with each other are made inside the same route.
+        """
+
+        if getattr(repository, "read_routed", False):
+            yield repository
+            return
+
+        engine = await self.read_engine()
+        if engine is self.primary:
+            yield repository
+            return
+
+        async with self.session_maker(bind=engine) as db:
+            routed = copy.copy(repository)
+            routed.db = db
+            routed.read_routed = True
+            yield routed
+
+    def read_only(self, method):
+
+        """
+            Decorator of repository methods that only read, they run on a replica when one is in time
+        """
+
+        @wraps(method)
+        async def routed_method(repository, *args, **kwargs):
+            async with self.route(repository) as routed:
+                return await method(routed, *args, **kwargs)
+
+        return routed_method
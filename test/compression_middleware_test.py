@@ -0,0 +1,77 @@
+import gzip
+
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils.compression_middleware import CompressionMiddleware
+
+geojson = b'{"type":"FeatureCollection","features":[' + b",".join([b'{"type":"Feature","properties":{"uf":"RN"}}'] * 200) + b"]}"
+
+
+async def polygon(request):
+    return Response(geojson, media_type="application/geo+json")
+
+
+async def streamed_polygon(request):
+    async def chunks():
+        yield geojson[:1000]
+        yield geojson[1000:]
+    return StreamingResponse(chunks(), media_type="application/geo+json")
+
+
+async def tile(request):
+    return Response(b"\x89PNG" + b"\x00" * 4096, media_type="image/png")
+
+
+async def small(request):
+    return Response(b'{"detail":"ok"}', media_type="application/json")
+
+
+app = CompressionMiddleware(
+    Starlette(routes=[Route("/polygon", polygon), Route("/stream", streamed_polygon), Route("/tile", tile), Route("/small", small)])
+)
+client = TestClient(app)
+
+
+def test_compresses_json_with_accepted_encoding():
+
+    # Act
+    response = client.get("/polygon", headers={"Accept-Encoding": "gzip"})
+    raw = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    # Assert
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(geojson)
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.content == geojson
+    assert raw.headers["content-encoding"] == "gzip"
+    assert raw.content == geojson
+
+
+def test_skips_png_small_bodies_and_identity_clients():
+
+    # Act
+    png = client.get("/tile", headers={"Accept-Encoding": "gzip"})
+    small_response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    identity = client.get("/polygon", headers={"Accept-Encoding": "identity"})
+
+    # Assert
+    assert "content-encoding" not in png.headers
+    assert "content-encoding" not in small_response.headers
+    assert "content-encoding" not in identity.headers
+    assert identity.content == geojson
+
+
+def test_gzip_members_decompress_to_the_body():
+
+    # Arrange
+    from utils.compression_middleware import _Compressor
+    compressor = _Compressor("gzip")
+
+    # Act
+    compressed = compressor.compress(geojson[:500]) + compressor.finish(geojson[500:])
+
+    # Assert
+    assert gzip.decompress(compressed) == geojson
@@ -0,0 +1,57 @@
+from unittest.mock import MagicMock
+
+import numpy
+import orjson
+import pytest
+
+from scripts.create_raster_obj import iter_raster_json, read_raster_as_json
+
+
+def fake_dataset(values):
+    bands = values.reshape(-1, *values.shape[-2:])
+    dataset = MagicMock()
+    dataset.RasterCount = len(bands)
+    dataset.RasterYSize, dataset.RasterXSize = bands.shape[1:]
+    dataset.ReadAsArray = lambda x_offset=0, y_offset=0, x_size=None, y_size=None: (
+        values if y_size is None else values[..., y_offset:y_offset + y_size, x_offset:x_offset + x_size]
+    )
+    dataset.GetGeoTransform.return_value = (-38.5, 0.01, 0, -4.8, 0, -0.01)
+    return dataset
+
+
+@pytest.mark.asyncio
+async def test_iter_raster_json_matches_read_raster_as_json():
+
+    # Arrange
+    values = numpy.arange(35, dtype=numpy.float32).reshape(7, 5) / 3
+    values[2, 3] = -9999
+    values[4, :] = -9999
+    dataset = fake_dataset(values)
+
+    # Act
+    streamed = orjson.loads(b"".join(iter_raster_json(dataset, rows_per_block=2)))
+    expected = await read_raster_as_json(dataset)
+
+    # Assert
+    assert streamed == expected
+    assert len(streamed["data"]) == 29
+
+
+@pytest.mark.asyncio
+async def test_multi_band_rasters_list_every_band_per_pixel():
+
+    # Arrange
+    values = numpy.arange(2 * 3 * 4, dtype=numpy.float32).reshape(2, 3, 4)
+    values[:, 0, 0] = -9999
+    values[1, 2, 3] = -9999
+    dataset = fake_dataset(values)
+
+    # Act
+    streamed = orjson.loads(b"".join(iter_raster_json(dataset, rows_per_block=2)))
+    expected = await read_raster_as_json(dataset)
+
+    # Assert
+    assert streamed == expected
+    assert len(expected["data"]) == 11
+    assert expected["data"]["-4.80500 -38.48500"] == [1.0, 13.0]
+    assert expected["data"]["-4.82500 -38.46500"] == [11.0, None]
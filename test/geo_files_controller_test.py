@@ -1,15 +1,20 @@
 from unittest.mock import AsyncMock, MagicMock
 from io import BytesIO
+import json
 import os
 import tempfile
 
+import numpy as np
 import pytest
-from fastapi import status
+from fastapi import Response, status
 from fastapi.exceptions import HTTPException
-from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import DataError, OperationalError
 from starlette.datastructures import UploadFile
 
 from controllers.geo_files_controller import GeoFilesController
+from repositories.geo_repository import GeoRepository
+from scripts.raster_render import ColorMap
+from schemas.polygon_query import AttributeFilter, PolygonQuery
 
 test_validate_geofile_parameters = [
     (
@@ -61,20 +66,32 @@ test_get_polygon_parameters = [
 
 
 @pytest.mark.asyncio
-async def test_get_polygon():
+async def test_get_polygon(monkeypatch):
 
     # Arrange
-    polygon = {'name': 'test_table', 'geotype': None}
+    features = [(str(key), f'{{"type":"Feature","id":"{key}","geometry":null,"properties":{{}}}}') for key in range(1, 4)]
+
+    async def stream_polygon_features(self, sql_query, parameters):
+        yield features[:2]
+        yield features[2:]
+
+    monkeypatch.setattr("controllers.geo_files_controller.session_router.read_session", MagicMock())
+    monkeypatch.setattr("controllers.geo_files_controller.GeoRepository.stream_polygon_features", stream_polygon_features)
     mock_repository = MagicMock()
+    mock_repository.build_polygon_features_query = AsyncMock(return_value=("SELECT", {"limit": 3}))
     geo_controller = GeoFilesController(repository=mock_repository)
-    mock_repository.get_polygon_by_name = AsyncMock(return_value=polygon)
-    geo_controller._validate_geofile = AsyncMock(return_value=None)
+    geo_controller._validate_vector_table = AsyncMock(return_value=None)
+    query = PolygonQuery(filters=[AttributeFilter.parse("uf:eq:BA")], limit=2)
 
     # Act
-    raster_data = await geo_controller.get_polygon('table_name')
+    response = await geo_controller.get_polygon('table_name', query)
+    body = b"".join([chunk async for chunk in response.body_iterator])
 
     # Assert
-    assert raster_data == polygon
+    collection = json.loads(body)
+    assert [feature["id"] for feature in collection["features"]] == ["1", "2"]
+    assert collection["next_cursor"] == GeoRepository.encode_cursor("2")
+    mock_repository.build_polygon_features_query.assert_awaited_once_with('table_name', query)
 
 
 @pytest.mark.asyncio
@@ -82,7 +99,7 @@ async def test_get_polygon_wrong():
 
     # Arrange
     geo_controller = GeoFilesController(repository=MagicMock())
-    geo_controller._validate_geofile = AsyncMock(return_value=None)
+    geo_controller._validate_vector_table = AsyncMock(return_value=None)
     geo_controller.repository.get_polygon = lambda: (_ for _ in ()).throw(Exception(""))
 
     # Act
@@ -94,23 +111,203 @@ async def test_get_polygon_wrong():
 
 
 @pytest.mark.asyncio
-async def test_get_raster():
+async def test_get_polygon_invalid_filter():
+
+    # Arrange
+    geo_controller = GeoFilesController(repository=MagicMock())
+    geo_controller._validate_vector_table = AsyncMock(return_value=None)
+    geo_controller.repository.build_polygon_features_query = AsyncMock(side_effect=ValueError("Coluna 'x' não existe."))
+
+    # Act
+    with pytest.raises(HTTPException, match="Coluna") as error:
+        await geo_controller.get_polygon('table_name', PolygonQuery(columns=['x']))
+
+    # Assert
+    assert error.value.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error, status_code", [
+    (DataError("SELECT", {}, Exception('invalid input syntax for type bigint: "abc"')), status.HTTP_400_BAD_REQUEST),
+    (OperationalError("SELECT", {}, Exception("canceling statement due to statement timeout")), status.HTTP_500_INTERNAL_SERVER_ERROR),
+])
+async def test_get_polygon_query_error_before_the_response(monkeypatch, error, status_code):
+
+    # Arrange
+    async def stream_polygon_features(self, sql_query, parameters):
+        raise error
+        yield
+
+    monkeypatch.setattr("controllers.geo_files_controller.session_router.read_session", MagicMock())
+    monkeypatch.setattr("controllers.geo_files_controller.GeoRepository.stream_polygon_features", stream_polygon_features)
+    monkeypatch.setattr("controllers.geo_files_controller.capture_exception", MagicMock())
+    geo_controller = GeoFilesController(repository=MagicMock())
+    geo_controller.repository.build_polygon_features_query = AsyncMock(return_value=("SELECT", {"filter_0": "abc"}))
+    geo_controller._validate_vector_table = AsyncMock(return_value=None)
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await geo_controller.get_polygon('table_name', PolygonQuery(filters=[AttributeFilter.parse("gid:gt:abc")], limit=10))
+
+    # Assert
+    assert exception.value.status_code == status_code
+
+
+def test_attribute_filter_parse():
+
+    # Act
+    attribute_filter = AttributeFilter.parse("nome:like:%Sol:ar%")
+
+    # Assert
+    assert (attribute_filter.column, attribute_filter.operator, attribute_filter.value) == ("nome", "like", "%Sol:ar%")
+    with pytest.raises(ValueError):
+        AttributeFilter.parse("nome:between:1")
+    with pytest.raises(ValueError):
+        PolygonQuery.parse_bbox("-40,-10,-41")
+
+
+@pytest.mark.asyncio
+async def test_get_raster(monkeypatch):
 
     # Arrange
     file = b"\x00\x01"
+    values = np.ma.MaskedArray(np.arange(4, dtype=np.float32).reshape(2, 2), mask=[[True, False], [False, False]])
     geo_files_controller = GeoFilesController(repository=MagicMock())
-    geo_files_controller.repository.get_raster = AsyncMock(return_value=file)
-    raster_response = StreamingResponse(
-        file,
-        media_type="image/png",
-        headers={"Content-Disposition": "attachment; filename=raster.png"}
-    )
+    geo_files_controller.repository.get_raster_pyramid = AsyncMock(return_value=[('solar', 0.01)])
+    geo_files_controller.repository.get_raster_tile = AsyncMock(return_value=values)
+    geo_files_controller.repository.get_raster_value_range = AsyncMock(return_value=(0.0, 3.0))
+    monkeypatch.setattr("controllers.geo_files_controller.style_store.get", AsyncMock(return_value={"colormap": "fire"}))
+    render = AsyncMock(return_value=file)
+    monkeypatch.setattr("controllers.geo_files_controller.tile_renderer.render", render)
 
     # Act
     raster_data = await geo_files_controller.get_raster('table', 1, 1, 1)
 
     # Assert
-    assert type(raster_data) is type(raster_response)
+    assert type(raster_data) is Response
+    assert raster_data.body == file
+    assert raster_data.media_type == "image/png"
+    assert raster_data.headers["cache-control"] == "private, max-age=3600"
+    assert raster_data.headers["vary"] == "Accept"
+    assert "content-disposition" not in raster_data.headers
+    rendered_values, colormap, raster_range, tile_format = render.await_args.args
+    assert rendered_values is values
+    assert colormap == ColorMap.preset("fire")
+    assert raster_range == (0.0, 3.0)
+    assert tile_format == "png8"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("table_name, accept, webp, tile_format, media_type", [
+    ("solar", "image/webp,image/*", True, "webp", "image/webp"),
+    ("solar", "image/webp,image/*", False, "png8", "image/png"),
+    ("solar.png", "image/webp", True, "png", "image/png"),
+    ("solar.PNG8", None, True, "png8", "image/png"),
+    ("solar.webp", None, True, "webp", "image/webp"),
+])
+async def test_get_raster_negotiates_the_format(monkeypatch, table_name, accept, webp, tile_format, media_type):
+
+    # Arrange
+    geo_files_controller = GeoFilesController(repository=MagicMock())
+    geo_files_controller.repository.get_raster_pyramid = AsyncMock(return_value=[('solar', 0.01)])
+    geo_files_controller.repository.get_raster_tile = AsyncMock(return_value=np.ma.MaskedArray(np.zeros((2, 2))))
+    monkeypatch.setattr("controllers.geo_files_controller.style_store.get", AsyncMock(return_value={"colormap": [[0, "#000000"], [1, "#ffffff"]]}))
+    monkeypatch.setattr("controllers.geo_files_controller.webp_supported", lambda: webp)
+    render = AsyncMock(return_value=b"tile")
+    monkeypatch.setattr("controllers.geo_files_controller.tile_renderer.render", render)
+
+    # Act
+    raster_data = await geo_files_controller.get_raster(table_name, 1, 1, 1, accept=accept)
+
+    # Assert
+    assert render.await_args.args[3] == tile_format
+    assert raster_data.media_type == media_type
+    geo_files_controller.repository.get_raster_tile.assert_awaited_once_with("solar", 1, 1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_get_raster_webp_extension_without_driver(monkeypatch):
+
+    # Arrange
+    geo_files_controller = GeoFilesController(repository=MagicMock())
+    monkeypatch.setattr("controllers.geo_files_controller.webp_supported", lambda: False)
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await geo_files_controller.get_raster('solar.webp', 1, 1, 1)
+
+    # Assert
+    assert exception.value.status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+
+@pytest.mark.asyncio
+async def test_get_raster_not_modified(monkeypatch):
+
+    # Arrange
+    geo_files_controller = GeoFilesController(repository=MagicMock())
+    geo_files_controller.repository.get_raster_pyramid = AsyncMock(return_value=[('solar', 0.01)])
+    geo_files_controller.repository.get_raster_tile = AsyncMock(return_value=np.ma.MaskedArray(np.zeros((2, 2))))
+    geo_files_controller.repository.get_raster_value_range = AsyncMock(return_value=(0.0, 1.0))
+    monkeypatch.setattr("controllers.geo_files_controller.style_store.get", AsyncMock(return_value=None))
+    monkeypatch.setattr("controllers.geo_files_controller.tile_renderer.render", AsyncMock(return_value=b"tile"))
+    etag = (await geo_files_controller.get_raster('solar.png', 1, 1, 1)).headers["etag"]
+
+    # Act
+    raster_data = await geo_files_controller.get_raster('solar.png', 1, 1, 1, if_none_match=f'"other", {etag}')
+
+    # Assert
+    assert raster_data.status_code == status.HTTP_304_NOT_MODIFIED
+    assert raster_data.body == b""
+
+
+@pytest.mark.asyncio
+async def test_get_raster_invalid_table_name():
+
+    # Arrange
+    geo_files_controller = GeoFilesController(repository=MagicMock())
+    geo_files_controller.repository.get_raster_pyramid = AsyncMock(return_value=[('solar', 0.01)])
+    geo_files_controller.repository.get_raster_tile = AsyncMock(side_effect=ValueError("Nome da tabela inválido."))
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await geo_files_controller.get_raster('bad-name', 1, 1, 1)
+
+    # Assert
+    assert exception.value.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_get_raster_missing_table():
+
+    # Arrange
+    geo_files_controller = GeoFilesController(repository=MagicMock())
+    geo_files_controller.repository.get_raster_pyramid = AsyncMock(return_value=[])
+    geo_files_controller.repository.get_raster_tile = AsyncMock()
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await geo_files_controller.get_raster('missing', 1, 1, 1)
+
+    # Assert
+    assert exception.value.status_code == status.HTTP_404_NOT_FOUND
+    geo_files_controller.repository.get_raster_tile.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_get_raster_invalid_style(monkeypatch):
+
+    # Arrange
+    geo_files_controller = GeoFilesController(repository=MagicMock())
+    geo_files_controller.repository.get_raster_pyramid = AsyncMock(return_value=[('solar', 0.01)])
+    geo_files_controller.repository.get_raster_tile = AsyncMock(return_value=np.ma.MaskedArray(np.zeros((2, 2))))
+    monkeypatch.setattr("controllers.geo_files_controller.style_store.get", AsyncMock(return_value={"colormap": "rainbow"}))
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await geo_files_controller.get_raster('solar', 1, 1, 1)
+
+    # Assert
+    assert exception.value.status_code == status.HTTP_400_BAD_REQUEST
 
 
 @pytest.mark.asyncio
@@ -130,3 +327,91 @@ async def test_upload_raster_removes_temp_file_and_returns_repository_response()
     assert result["table_name"] == "wind_offshore"
     repository.upload_raster.assert_awaited_once_with(raster_path, "wind_offshore", 4674, False)
     assert not os.path.exists(raster_path)
+
+
+@pytest.mark.asyncio
+async def test_get_vector_tile_caches_tile():
+
+    # Arrange
+    from services.tile_cache import vector_tile_cache
+    vector_tile_cache.invalidate('mvt_table')
+    repository = MagicMock()
+    repository.get_vector_tile = AsyncMock(return_value=b"\x1a\x02mvt")
+    repository.get_ingested_layer_table = AsyncMock(return_value=None)
+    controller = GeoFilesController(repository=repository)
+    controller._validate_geofile = AsyncMock(return_value=None)
+
+    # Act
+    first = await controller.get_vector_tile('mvt_table', 3, 2, 1)
+    second = await controller.get_vector_tile('mvt_table', 3, 2, 1)
+
+    # Assert
+    assert first.body == second.body == b"\x1a\x02mvt"
+    assert first.media_type == "application/vnd.mapbox-vector-tile"
+    assert first.headers["cache-control"] == "private, max-age=3600"
+    repository.get_vector_tile.assert_awaited_once_with('mvt_table', 3, 2, 1)
+    vector_tile_cache.invalidate('mvt_table')
+
+
+@pytest.mark.asyncio
+async def test_get_vector_tile_empty_and_invalid():
+
+    # Arrange
+    from services.tile_cache import vector_tile_cache
+    vector_tile_cache.invalidate('mvt_empty')
+    repository = MagicMock()
+    repository.get_vector_tile = AsyncMock(return_value=None)
+    repository.get_ingested_layer_table = AsyncMock(return_value='mvt_empty')
+    controller = GeoFilesController(repository=repository)
+    controller._validate_geofile = AsyncMock(return_value=None)
+
+    # Act
+    response = await controller.get_vector_tile('mvt_empty', 1, 0, 0)
+    with pytest.raises(HTTPException) as error:
+        await controller.get_vector_tile('mvt_empty', 1, 2, 0)
+
+    # Assert
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    controller._validate_geofile.assert_not_awaited()
+    assert error.value.status_code == status.HTTP_400_BAD_REQUEST
+    vector_tile_cache.invalidate('mvt_empty')
+
+
+def test_polygon_resolution_uses_stored_level():
+
+    # Arrange
+    from repositories.geo_repository import VectorTableSource
+    source = VectorTableSource(4674, [("gid", "int8")], {"low"}, True)
+
+    # Act
+    stored = GeoRepository.simplified_geometry(source, PolygonQuery.resolution_for_zoom(5))
+    on_the_fly = GeoRepository.simplified_geometry(source, "medium")
+
+    # Assert
+    assert stored == "t.geometry_low"
+    assert on_the_fly.startswith("ST_SimplifyPreserveTopology")
+    assert PolygonQuery.resolution_for_zoom(16) == "full"
+    assert GeoRepository.simplification_tolerance("low", True) == pytest.approx(1000 / 111320)
+
+
+@pytest.mark.asyncio
+async def test_get_polygon_whole_table_not_modified(monkeypatch):
+
+    # Arrange
+    from services.polygon_artifact_store import PolygonArtifact
+    artifact = PolygonArtifact(signature="1", etag='"abc"', files={"gzip": "parques.full.abc.geojson.gz"})
+    artifact_store = MagicMock()
+    artifact_store.get_or_build = AsyncMock(return_value=artifact)
+    monkeypatch.setattr("controllers.geo_files_controller.polygon_artifact_store", artifact_store)
+    repository = MagicMock()
+    repository.build_polygon_features_query = AsyncMock(return_value=("SELECT", {}))
+    repository.get_table_signature = AsyncMock(return_value="1")
+    controller = GeoFilesController(repository=repository)
+    controller._validate_vector_table = AsyncMock(return_value=None)
+
+    # Act
+    response = await controller.get_polygon('parques', if_none_match='"abc"', accept_encoding="gzip")
+
+    # Assert
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == '"abc"'
@@ -0,0 +1,127 @@
+from unittest.mock import MagicMock, Mock
+
+import numpy as np
+import pytest
+
+from scripts.geo_processing import (
+    DURATION_CURVE_POINTS, HISTOGRAM_BINS, PERCENTILES, ZonalBatch, masked_band_values, zonal_statistics
+)
+
+
+def fake_dataset(values, geo_transform=(-38.5, 0.01, 0, -4.8, 0, -0.01)):
+    dataset = MagicMock()
+    dataset.RasterCount = len(values)
+    dataset.RasterYSize, dataset.RasterXSize = values.shape[1:]
+    dataset.GetGeoTransform.return_value = geo_transform
+    dataset.GetProjection.return_value = "EPSG:4674"
+    dataset.ReadAsArray.side_effect = lambda x_offset, y_offset, x_size, y_size: (
+        values[:, y_offset:y_offset + y_size, x_offset:x_offset + x_size]
+    )
+    return dataset
+
+
+def test_masked_band_values_reads_only_the_mask_window():
+
+    # Arrange
+    values = np.arange(2 * 5 * 6, dtype=np.float32).reshape(2, 5, 6)
+    values[0, 2, 2] = -9999
+    dataset = fake_dataset(values)
+    mask = np.zeros((5, 6), dtype=np.uint8)
+    mask[1, 2] = mask[2, 2] = mask[2, 3] = 1
+
+    # Act
+    band_values = masked_band_values(dataset, mask)
+
+    # Assert
+    dataset.ReadAsArray.assert_called_once_with(2, 1, 2, 2)
+    assert [values.tolist() for values in band_values] == [[8.0, 15.0], [38.0, 44.0, 45.0]]
+
+
+def test_masked_band_values_without_pixels():
+
+    # Arrange
+    dataset = MagicMock()
+    dataset.RasterCount = 3
+
+    # Act
+    band_values = masked_band_values(dataset, np.zeros((4, 4), dtype=np.uint8))
+
+    # Assert
+    assert [len(values) for values in band_values] == [0, 0, 0]
+    dataset.ReadAsArray.assert_not_called()
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000, 12345])
+def test_zonal_statistics_match_numpy(size):
+
+    # Arrange
+    values = np.random.default_rng(size).gamma(2.0, 3.0, size).astype(np.float32)
+
+    # Act
+    statistics = zonal_statistics(values)
+
+    # Assert
+    assert statistics['count'] == size
+    assert statistics['min'] == pytest.approx(values.min(), abs=1e-4)
+    assert statistics['max'] == pytest.approx(values.max(), abs=1e-4)
+    assert statistics['mean'] == pytest.approx(values.mean(dtype=np.float64), abs=1e-4)
+    assert list(statistics['percentiles'].values()) == pytest.approx(np.percentile(values.astype(np.float64), PERCENTILES), abs=1e-4)
+    assert sum(statistics['histogram']['counts']) == size
+    assert len(statistics['histogram']['edges']) == HISTOGRAM_BINS + 1
+    curve = statistics['durationCurve']['values']
+    assert len(curve) == DURATION_CURVE_POINTS
+    assert curve[0] == statistics['max'] and curve[-1] == statistics['min']
+    assert curve == sorted(curve, reverse=True)
+
+
+def test_zonal_statistics_without_values():
+
+    # Act
+    statistics = zonal_statistics(np.empty(0, dtype=np.float32))
+
+    # Assert
+    assert statistics['count'] == 0
+    assert statistics['mean'] is None
+    assert statistics['durationCurve']['values'] == []
+
+
+@pytest.mark.asyncio
+async def test_zonal_batch_rasterizes_once_per_grid(monkeypatch):
+
+    # Arrange
+    mask = np.zeros((3, 4), dtype=np.uint8)
+    mask[1:, 1:3] = 1
+    rasterize_mask = Mock(return_value=mask)
+    geometry_from_feature = Mock(return_value="geometry")
+    monkeypatch.setattr("scripts.geo_processing.geometry_from_feature", geometry_from_feature)
+    monkeypatch.setattr("scripts.geo_processing.rasterize_mask", rasterize_mask)
+    feature = MagicMock()
+    feature.properties.name = "Parque"
+    grid_values = np.arange(12, dtype=np.float32).reshape(1, 3, 4)
+    rasters = {
+        "wind_100m": fake_dataset(grid_values),
+        "ghi_annual": fake_dataset(grid_values * 10),
+        "ghi_coarse": fake_dataset(grid_values, geo_transform=(-38.5, 0.1, 0, -4.8, 0, -0.1)),
+    }
+    batch = ZonalBatch(feature)
+
+    # Act
+    result = batch.response({name: await batch.summarize(name, dataset) for name, dataset in rasters.items()})
+
+    # Assert
+    assert geometry_from_feature.call_count == 1
+    assert rasterize_mask.call_count == 2
+    assert result["properties"]["name"] == "Parque"
+    assert list(result["properties"]["rasters"]) == ["wind_100m", "ghi_annual", "ghi_coarse"]
+    wind, ghi = result["properties"]["rasters"]["wind_100m"], result["properties"]["rasters"]["ghi_annual"]
+    assert wind["statistics"][0]["mean"] == 7.5
+    assert ghi["statistics"][0]["max"] == 100.0
+    assert wind["size"] == 1.0
+    assert "pixelValues" not in wind
+
+
+@pytest.mark.asyncio
+async def test_zonal_batch_rejects_unsupported_rasters():
+
+    with pytest.raises(ValueError):
+        await ZonalBatch(MagicMock()).summarize("solar_pv", fake_dataset(np.zeros((1, 2, 2))))
@@ -1,54 +1,353 @@
-import os
 from unittest.mock import AsyncMock, MagicMock, Mock
 
+import numpy as np
 import pytest
 from osgeo import gdal
 
-from repositories.geo_repository import GeoRepository
+from repositories.geo_repository import GeoRepository, VectorTableSource
+from schemas.polygon_query import PolygonQuery
 
-test_get_raster_parameters = [
-    ('wrong_filename', None, 1, 1, 1, None),
-    ('correct_filename', (b'test',), 1, 1, 1, b'test'),
-    ('correct_filename_no_list', b'test', 1, 1, 1, 116)
+test_get_raster_tile_parameters = [
+    ('wrong_filename', None, None, None),
+    ('unreadable_raster', (b'test',), None, None),
+    ('correct_filename', (b'test',), [[1.0, -9999.0]], [[False, True]]),
 ]
 
 
 @pytest.mark.asyncio
-@pytest.mark.parametrize("filename, query_result, x, y, z, expected", test_get_raster_parameters)
-async def test_get_raster(filename, query_result, x, y, z, expected):
+@pytest.mark.parametrize("filename, query_result, values, expected_mask", test_get_raster_tile_parameters)
+async def test_get_raster_tile(filename, query_result, values, expected_mask, monkeypatch):
 
     # Arrange
     mock_db = MagicMock()
     geo_repository = GeoRepository(db=MagicMock())
     mock_db.fetchone.return_value = (query_result)
     geo_repository.db.execute = AsyncMock(return_value=mock_db)
+    monkeypatch.setitem(GeoRepository.RASTER_PYRAMIDS, filename, [(filename, 0.01)])
+    monkeypatch.setattr(GeoRepository, "_revalidate_raster", AsyncMock())
+    dataset = MagicMock()
+    dataset.GetRasterBand.return_value.ReadAsArray.return_value = np.array(values or [[0.0]], dtype=np.float32)
+    dataset.GetRasterBand.return_value.GetNoDataValue.return_value = -9999.0
+    monkeypatch.setattr(gdal, "FileFromMemBuffer", Mock(return_value=0), raising=False)
+    monkeypatch.setattr(gdal, "Unlink", Mock(return_value=0), raising=False)
+    monkeypatch.setattr(gdal, "Open", Mock(return_value=dataset if values else None))
 
     # Act
-    raster_data = await geo_repository.get_raster(filename, x, y, z)
+    raster_data = await geo_repository.get_raster_tile(filename, 1, 1, 1)
 
     # Assert
-    assert raster_data == expected
+    if expected_mask is None:
+        assert raster_data is None
+    else:
+        assert raster_data.mask.tolist() == expected_mask
+        assert raster_data.data.tolist() == values
+        gdal.Unlink.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_raster_tile_binds_the_tile_and_reuses_the_table_query(monkeypatch):
+
+    # Arrange
+    result = MagicMock()
+    result.fetchone.return_value = (b'tiff',)
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.execute = AsyncMock(return_value=result)
+    monkeypatch.setitem(GeoRepository.RASTER_PYRAMIDS, 'solar', [('solar', 0.01)])
+    monkeypatch.setattr(GeoRepository, "_revalidate_raster", AsyncMock())
+    monkeypatch.setattr(GeoRepository, "_read_tile_values", Mock(return_value=None))
+
+    # Act
+    await geo_repository.get_raster_tile('solar', 1, 2, 3)
+    await geo_repository.get_raster_tile('solar', 4, 5, 6)
+
+    # Assert
+    first_call, second_call = geo_repository.db.execute.await_args_list
+    assert first_call.args[0] is second_call.args[0]
+    assert 'ST_TileEnvelope(:z, :x, :y)' in str(first_call.args[0])
+    assert 'ST_Clip' in str(first_call.args[0])
+    assert second_call.args[1] == {"z": 6, "x": 4, "y": 5}
+
+
+test_raster_level_for_zoom_parameters = [
+    (0, 'o_64_solar'),
+    (5, 'o_16_solar'),
+    (8, 'o_2_solar'),
+    (9, 'solar'),
+    (14, 'solar'),
+]
+
+
+@pytest.mark.parametrize("z, expected", test_raster_level_for_zoom_parameters)
+def test_raster_level_for_zoom(z, expected):
+
+    # Arrange
+    pyramid = [('solar', 0.0025)] + [(f'o_{factor}_solar', 0.0025 * factor) for factor in GeoRepository.RASTER_OVERVIEW_FACTORS]
+
+    # Act
+    level = GeoRepository.raster_level_for_zoom(pyramid, z)
+
+    # Assert
+    assert level == expected
+
+
+@pytest.mark.asyncio
+async def test_get_raster_pyramid_does_not_cache_a_missing_table(monkeypatch):
+
+    # Arrange
+    result, versions = MagicMock(), MagicMock()
+    result.fetchall.side_effect = [[], [(1, 'solar', 0.01), (2, 'o_2_solar', 0.02)]]
+    versions.first.return_value = None
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.execute = AsyncMock(return_value=result)
+    geo_repository.db.exec = AsyncMock(return_value=versions)
+    monkeypatch.setattr(GeoRepository, "RASTER_PYRAMIDS", {})
+    monkeypatch.setattr(GeoRepository, "RASTER_CACHE_VERSIONS", {})
+
+    # Act
+    before_upload = await geo_repository.get_raster_pyramid('solar')
+    cached_versions = dict(GeoRepository.RASTER_CACHE_VERSIONS)
+    after_upload = await geo_repository.get_raster_pyramid('solar')
+
+    # Assert
+    assert before_upload == []
+    assert cached_versions == {}
+    assert after_upload == [('solar', 0.01), ('o_2_solar', 0.02)]
+    assert GeoRepository.RASTER_PYRAMIDS == {'solar': after_upload}
+    assert list(GeoRepository.RASTER_CACHE_VERSIONS) == ['solar']
+
+
+@pytest.mark.asyncio
+async def test_raster_caches_follow_the_shared_version(monkeypatch):
+
+    # Arrange
+    versions = MagicMock()
+    versions.first.side_effect = [1, 1, 2]
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.exec = AsyncMock(return_value=versions)
+    monkeypatch.setattr(GeoRepository, "RASTER_CACHE_VERSIONS", {})
+    monkeypatch.setattr(GeoRepository, "CACHE_VERSION_REVALIDATE_SECONDS", 0)
+    monkeypatch.setattr(GeoRepository, "RASTER_PYRAMIDS", {})
+    monkeypatch.setattr(GeoRepository, "RASTER_VALUE_RANGES", {})
+
+    # Act
+    await geo_repository._revalidate_raster('solar')
+    GeoRepository.RASTER_PYRAMIDS['solar'] = [('solar', 0.01)]
+    GeoRepository.RASTER_VALUE_RANGES[('solar', 1)] = (0.0, 1.0)
+    await geo_repository._revalidate_raster('solar')
+    unchanged = dict(GeoRepository.RASTER_PYRAMIDS)
+    await geo_repository._revalidate_raster('solar')
+
+    # Assert
+    assert unchanged == {'solar': [('solar', 0.01)]}
+    assert GeoRepository.RASTER_PYRAMIDS == {}
+    assert GeoRepository.RASTER_VALUE_RANGES == {}
+
+
+@pytest.mark.asyncio
+async def test_get_raster_value_range_is_refreshed_by_an_upload_in_another_worker(monkeypatch):
+
+    # Arrange
+    versions, stats = MagicMock(), MagicMock()
+    versions.first.side_effect = [1, 2]
+    stats.fetchall.return_value = [(1, 'solar', 0.01)]
+    stats.fetchone.side_effect = [(0.0, 10.0), (5.0, 50.0)]
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.exec = AsyncMock(return_value=versions)
+    geo_repository.db.execute = AsyncMock(return_value=stats)
+    monkeypatch.setattr(GeoRepository, "RASTER_CACHE_VERSIONS", {})
+    monkeypatch.setattr(GeoRepository, "CACHE_VERSION_REVALIDATE_SECONDS", 0)
+    monkeypatch.setattr(GeoRepository, "RASTER_PYRAMIDS", {})
+    monkeypatch.setattr(GeoRepository, "RASTER_VALUE_RANGES", {})
+
+    # Act
+    before = await geo_repository.get_raster_value_range('solar')
+    after = await geo_repository.get_raster_value_range('solar')
+
+    # Assert
+    assert before == (0.0, 10.0)
+    assert after == (5.0, 50.0)
+
+
+@pytest.mark.asyncio
+async def test_get_raster_band_count_does_not_cache_a_missing_table(monkeypatch):
+
+    # Arrange
+    result = MagicMock()
+    result.fetchone.return_value = (12,)
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.execute = AsyncMock(return_value=result)
+    monkeypatch.setattr(GeoRepository, "get_raster_pyramid", AsyncMock(side_effect=[[], [('ghi_monthly', 0.01)]]))
+    monkeypatch.setattr(GeoRepository, "RASTER_BAND_COUNTS", {})
+
+    # Act
+    before_upload = await geo_repository.get_raster_band_count('ghi_monthly')
+    after_upload = await geo_repository.get_raster_band_count('ghi_monthly')
+
+    # Assert
+    assert (before_upload, after_upload) == (0, 12)
+    assert GeoRepository.RASTER_BAND_COUNTS == {'ghi_monthly': 12}
+
+
+def test_raster_tile_query_rejects_invalid_table_names():
+
+    with pytest.raises(ValueError):
+        GeoRepository.raster_tile_query('solar; DROP TABLE "User"')
+
+
+def test_raster_tile_query_clips_the_requested_band():
+
+    # Act
+    query = GeoRepository.raster_tile_query('ghi_monthly', 7)
+
+    # Assert
+    assert 'ST_Clip(source.rast, 7,' in str(query)
+    assert GeoRepository.raster_tile_query('ghi_monthly', 7) is query
+    assert GeoRepository.raster_tile_query('ghi_monthly') is not query
+
+
+@pytest.mark.asyncio
+async def test_check_raster_bands(monkeypatch):
+
+    # Arrange
+    result = MagicMock()
+    result.fetchone.return_value = (12,)
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.execute = AsyncMock(return_value=result)
+    monkeypatch.setattr(GeoRepository, "get_raster_pyramid", AsyncMock(return_value=[('ghi_monthly', 0.01)]))
+    monkeypatch.setattr(GeoRepository, "RASTER_BAND_COUNTS", {})
+
+    # Act
+    default_bands = await geo_repository.check_raster_bands('ghi_monthly', None)
+    months = await geo_repository.check_raster_bands('ghi_monthly', [1, 6, 12])
+    with pytest.raises(ValueError):
+        await geo_repository.check_raster_bands('ghi_monthly', [13])
+
+    # Assert
+    assert default_bands == [1]
+    assert months == [1, 6, 12]
+    geo_repository.db.execute.assert_awaited_once()
 
 test_get_raster_dataset_parameters = [
     ('wrong_filename', None, 'dataset', None),
     ('correct_filename', (b'test',), 'dataset', 'dataset'),
+    ('unreadable_raster', (b'test',), None, None),
 ]
 
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize("filename, query_result, dataset, expected", test_get_raster_dataset_parameters)
-async def test_get_raster_dataset(filename, query_result, dataset, expected):
+async def test_get_raster_dataset(filename, query_result, dataset, expected, monkeypatch):
 
     mock_db = MagicMock()
     # Arrange
     mock_db.fetchone.return_value = (query_result)
     geo_repository = GeoRepository(db=MagicMock())
     geo_repository.db.execute = AsyncMock(return_value=mock_db)
-    gdal.Open = Mock(return_value=dataset)
-    os.remove = Mock(return_value=None)
+    monkeypatch.setattr(gdal, "FileFromMemBuffer", Mock(return_value=0), raising=False)
+    monkeypatch.setattr(gdal, "Unlink", Mock(return_value=0), raising=False)
+    monkeypatch.setattr(gdal, "Open", Mock(return_value=dataset))
+
+    # Act
+    raster = await geo_repository.get_raster_dataset(filename)
+
+    # Assert
+    assert (raster.dataset if raster else None) == expected
+    if query_result:
+        path = gdal.FileFromMemBuffer.call_args.args[0]
+        assert path.startswith('/vsimem/')
+        gdal.Open.assert_called_once_with(path)
+    if raster:
+        raster.close()
+        assert raster.dataset is None
+    if query_result:
+        gdal.Unlink.assert_called_once_with(path)
+
+
+@pytest.mark.asyncio
+async def test_get_raster_dataset_invalid_table_name():
+
+    # Arrange
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.execute = AsyncMock()
+
+    # Act
+    with pytest.raises(ValueError):
+        await geo_repository.get_raster_dataset("wind_100m; DROP TABLE users --", [1])
+
+    # Assert
+    geo_repository.db.execute.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_store_simplification_levels_backfills_the_missing_rows(monkeypatch):
+
+    # Arrange
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.execute = AsyncMock()
+    geo_repository.db.commit = AsyncMock()
+    source = VectorTableSource(4674, [('nome', 'varchar')], set(), True)
+    monkeypatch.setattr(GeoRepository, "get_vector_table_source", AsyncMock(return_value=source))
+
+    # Act
+    levels = await geo_repository.store_simplification_levels('Municipios')
+
+    # Assert
+    statements = [str(call.args[0]) for call in geo_repository.db.execute.await_args_list]
+    assert levels == ['low', 'medium', 'high']
+    assert statements[:3] == [
+        f"ALTER TABLE municipios ADD COLUMN IF NOT EXISTS geometry_{level} geometry(Geometry, 4674)" for level in levels
+    ]
+    assert "geometry_low = ST_SimplifyPreserveTopology(geometry, :tolerance_low)" in statements[3]
+    assert "geometry_high IS NULL" in statements[3]
+    assert geo_repository.db.execute.await_args_list[3].args[1]["tolerance_low"] == pytest.approx(1000 / GeoRepository.METERS_PER_DEGREE)
+    geo_repository.db.commit.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_vector_table_source_is_refreshed_by_an_ingest_in_another_worker(monkeypatch):
+
+    # Arrange
+    versions, result = MagicMock(), MagicMock()
+    versions.first.side_effect = [1, 1, 2]
+    result.scalar.side_effect = [4674, True, 4674, True]
+    result.fetchall.side_effect = [[('nome', 'varchar')], [('nome', 'varchar'), ('geometry_low', 'geometry')]]
+    geo_repository = GeoRepository(db=MagicMock())
+    geo_repository.db.exec = AsyncMock(return_value=versions)
+    geo_repository.db.execute = AsyncMock(return_value=result)
+    monkeypatch.setattr(GeoRepository, "CACHE_VERSION_REVALIDATE_SECONDS", 0)
+    monkeypatch.setattr(GeoRepository, "_vector_table_sources", {})
+    monkeypatch.setattr(GeoRepository, "_vector_cache_versions", {})
+
+    # Act
+    before = await geo_repository.get_vector_table_source('municipios')
+    cached = await geo_repository.get_vector_table_source('municipios')
+    after = await geo_repository.get_vector_table_source('municipios')
+
+    # Assert
+    assert cached is before
+    assert before.simplified_levels == set()
+    assert after.simplified_levels == {'low'}
+
+
+@pytest.mark.asyncio
+async def test_build_polygon_features_query_pages_on_gid_only(monkeypatch):
+
+    # Arrange
+    geo_repository = GeoRepository(db=MagicMock())
+    with_gid = VectorTableSource(4674, [('gid', 'int4'), ('nome', 'varchar')], set(), True)
+    without_gid = VectorTableSource(4674, [('nome', 'varchar')], set(), True)
+    monkeypatch.setattr(GeoRepository, "get_vector_table_source", AsyncMock(side_effect=[with_gid, without_gid, without_gid]))
 
     # Act
-    raster_data = await geo_repository.get_raster_dataset(filename)
+    paged, parameters = await geo_repository.build_polygon_features_query('parques', PolygonQuery(limit=10, cursor=GeoRepository.encode_cursor('5')))
+    whole, _ = await geo_repository.build_polygon_features_query('parques', PolygonQuery())
+    with pytest.raises(ValueError):
+        await geo_repository.build_polygon_features_query('parques', PolygonQuery(limit=10))
 
     # Assert
-    assert raster_data == expected
+    assert "t.gid > CAST(CAST(:cursor AS text) AS int8)" in paged
+    assert "ORDER BY t.gid" in paged
+    assert "t.\"gid\"" in paged
+    assert parameters["cursor"] == '5'
+    assert "ctid" not in paged + whole
+    assert "row_number() OVER () - 1 AS key" in whole
@@ -0,0 +1,54 @@
+from schemas.email import EmailMessage
+from utils.html_generator import HtmlGenerator
+from utils.htmls import confirmation_account, recovery_password
+
+
+def test_confirmation_account_matches_template_function():
+
+    # Arrange
+    values = {
+        'user_email': 'test@example.com',
+        'contact_link': 'https://front/contact',
+        'confirmation_email_link': 'https://back/confirm-email/1',
+        'img_isi_er_cid': 'isi',
+        'img_state_cid': 'estado',
+        'img_logo_cid': 'logo',
+    }
+
+    # Act
+    content = HtmlGenerator().confirmation_account(**values)
+
+    # Assert
+    assert content == confirmation_account.get_confirmation_email_html(style=confirmation_account.get_style(), **values)
+
+
+def test_password_recovery_matches_template_function():
+
+    # Arrange
+    values = {
+        'user_email': 'test@example.com',
+        'enter_link': 'https://front/login',
+        'contact_link': 'https://front/contact',
+        'img_isi_er_cid': 'isi',
+        'img_state_cid': 'estado',
+        'img_logo_cid': 'logo',
+        'new_password': '123456789',
+        'reset_password_link': 'https://front/login',
+    }
+
+    # Act
+    content = HtmlGenerator().get_password_recovery(**values)
+
+    # Assert
+    assert content == recovery_password.recovery_password(style=recovery_password.style(), **values)
+
+
+def test_default_logo_images_are_loaded_once():
+
+    # Act
+    first_message = EmailMessage.with_default_logo_images(subject='a', to_email='a@example.com', html_content='a')
+    second_message = EmailMessage.with_default_logo_images(subject='b', to_email='b@example.com', html_content='b')
+
+    # Assert
+    assert len(first_message.images) == 3
+    assert all(first is second for first, second in zip(first_message.images, second_message.images))
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from services.layer_config_store import LayerConfigStore
+
+
+@pytest.mark.asyncio
+async def test_set_and_get_layer_config(tmp_path):
+
+    # Arrange
+    path = tmp_path / "popups_fields.json"
+    path.write_text(json.dumps({"APCBio": {"title": "Área"}}), encoding="utf-8")
+    store = LayerConfigStore(path)
+
+    # Act
+    await store.set("Parques_Eolicos", {"title": "Parques"})
+
+    # Assert
+    assert await store.get("APCBio") == {"title": "Área"}
+    assert await store.get("Parques_Eolicos") == {"title": "Parques"}
+    assert json.loads(path.read_text(encoding="utf-8")) == {"APCBio": {"title": "Área"}, "Parques_Eolicos": {"title": "Parques"}}
+    assert [file.name for file in tmp_path.iterdir() if file.suffix == ".tmp"] == []
+
+
+@pytest.mark.asyncio
+async def test_write_merges_changes_from_other_workers(tmp_path):
+
+    # Arrange
+    path = tmp_path / "layers_style.json"
+    store = LayerConfigStore(path)
+    other_worker_store = LayerConfigStore(path)
+    await store.set("layer_a", {"color": "red"})
+
+    # Act
+    await other_worker_store.set("layer_b", {"color": "blue"})
+    await store.delete("layer_a")
+
+    # Assert
+    assert json.loads(path.read_text(encoding="utf-8")) == {"layer_b": {"color": "blue"}}
+    assert await store.get("layer_b") == {"color": "blue"}
+
+
+@pytest.mark.asyncio
+async def test_get_missing_file_returns_none(tmp_path):
+
+    # Arrange
+    store = LayerConfigStore(tmp_path / "missing.json")
+
+    # Act
+    popup = await store.get("layer")
+
+    # Assert
+    assert popup is None
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from scripts import layer_schema
+from scripts.layer_schema import extract_property_schema
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Forces features to be split across several reads
+    monkeypatch.setattr(layer_schema, "CHUNK_SIZE", 16)
+
+
+def test_extract_property_schema(tmp_path, small_chunks):
+
+    # Arrange
+    features = [
+        {"type": "Feature", "properties": {"id": index, "nome": f"Parque {index}", "potencia": None if index == 0 else index * 1.5},
+         "geometry": {"type": "Point", "coordinates": [-36.5, -5.5]}}
+        for index in range(5)
+    ]
+    path = tmp_path / "layer.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "name": "layer", "features": features}, indent=2), encoding="utf-8")
+
+    # Act
+    schema = extract_property_schema(str(path))
+
+    # Assert
+    assert schema["feature_count"] == 5
+    assert list(schema["fields"]) == ["id", "nome", "potencia"]
+    assert schema["fields"]["id"] == {"type": "integer", "count": 5, "min": 0, "max": 4, "values": [0, 1, 2, 3, 4]}
+    assert schema["fields"]["potencia"]["type"] == "number"
+    assert schema["fields"]["potencia"]["count"] == 4
+    assert (schema["fields"]["potencia"]["min"], schema["fields"]["potencia"]["max"]) == (1.5, 6.0)
+
+
+def test_extract_property_schema_invalid_file(tmp_path, small_chunks):
+
+    # Arrange
+    path = tmp_path / "layer.geojson"
+    path.write_text('{"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {', encoding="utf-8")
+
+    # Act / Assert
+    with pytest.raises(ValueError):
+        extract_property_schema(str(path))
@@ -0,0 +1,120 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import orjson
+import pytest
+from fastapi import status
+
+from controllers.layers_controller import LayersController
+from services.layer_tree_cache import layer_tree_cache
+
+layer_tree = [{"id": "1", "name": "Energia", "layers": [], "subgroups": []}]
+
+
+@pytest.fixture(autouse=True)
+def clear_layer_tree_cache():
+    layer_tree_cache.invalidate()
+    yield
+    layer_tree_cache.invalidate()
+
+
+@pytest.mark.asyncio
+async def test_get_layer_groups_serves_cached_tree():
+
+    # Arrange
+    repository = MagicMock()
+    repository.get_layers_version = AsyncMock(return_value=1)
+    repository.get_all_groups_and_layers = AsyncMock(return_value=layer_tree)
+    controller = LayersController(repository=repository)
+
+    # Act
+    first_response = await controller.get_layer_groups()
+    second_response = await controller.get_layer_groups()
+
+    # Assert
+    assert first_response.status_code == status.HTTP_200_OK
+    assert orjson.loads(first_response.body) == layer_tree
+    assert first_response.headers["ETag"] == second_response.headers["ETag"]
+    repository.get_all_groups_and_layers.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_layer_groups_not_modified():
+
+    # Arrange
+    repository = MagicMock()
+    repository.get_layers_version = AsyncMock(return_value=1)
+    repository.get_all_groups_and_layers = AsyncMock(return_value=layer_tree)
+    controller = LayersController(repository=repository)
+    etag = (await controller.get_layer_groups()).headers["ETag"]
+
+    # Act
+    response = await controller.get_layer_groups(if_none_match=etag)
+
+    # Assert
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.body == b""
+
+
+@pytest.mark.asyncio
+async def test_create_layer_group_invalidates_tree():
+
+    # Arrange
+    repository = MagicMock()
+    repository.get_layers_version = AsyncMock(return_value=1)
+    repository.get_all_groups_and_layers = AsyncMock(return_value=layer_tree)
+    repository.create_layer_group = AsyncMock(return_value={"name": "Nova"})
+    controller = LayersController(repository=repository)
+    await controller.get_layer_groups()
+
+    # Act
+    await controller.create_layer_group(MagicMock())
+    await controller.get_layer_groups()
+
+    # Assert
+    assert repository.get_all_groups_and_layers.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_create_layer_popup_uses_stored_schema(monkeypatch):
+
+    # Arrange
+    layer = MagicMock()
+    layer.name = "Parques Eólicos"
+    layer.path = "assets/public/layers/missing.geojson"
+    layer.properties_schema = {"feature_count": 1, "fields": {"nome": {"type": "string"}, "potencia": {"type": "number"}}}
+    repository = MagicMock()
+    repository.get_layer_by_id = AsyncMock(return_value=layer)
+    popup_store = MagicMock()
+    popup_store.set = AsyncMock()
+    monkeypatch.setattr("controllers.layers_controller.popup_store", popup_store)
+    controller = LayersController(repository=repository)
+    fields = {"title": "Parques", "titleProperty": "nome", "fields": {"potencia": {"title": "Potência", "unit": "MW", "decimal": 1}}}
+
+    # Act
+    popup = await controller.create_layer_popup("id", fields)
+
+    # Assert
+    assert popup["Parques_Eolicos"]["fields"] == {"Potência": {"property": "potencia", "unit": "MW", "decimal": 1}}
+    popup_store.set.assert_awaited_once_with("Parques_Eolicos", popup["Parques_Eolicos"])
+
+
+@pytest.mark.asyncio
+async def test_create_layer_schedules_postgis_ingest():
+
+    # Arrange
+    new_layer = MagicMock()
+    new_layer.ingest_status = "pending"
+    repository = MagicMock()
+    repository.create_layer = AsyncMock(return_value=new_layer)
+    background_tasks = MagicMock()
+    ingest_service = MagicMock()
+    controller = LayersController(repository=repository, background_tasks=background_tasks, ingest_service=ingest_service)
+    controller.create_layer_files = AsyncMock()
+
+    # Act
+    await controller.create_layer(MagicMock(), MagicMock(), MagicMock())
+
+    # Assert
+    background_tasks.add_task.assert_called_once_with(
+        ingest_service.ingest, new_layer.id, new_layer.path, new_layer.properties_schema
+    )
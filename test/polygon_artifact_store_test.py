@@ -0,0 +1,55 @@
+import gzip
+
+import pytest
+
+from services.polygon_artifact_store import PolygonArtifactStore
+
+
+async def feature_collection():
+    yield b'{"type":"FeatureCollection","features":['
+    yield b'{"type":"Feature","id":"1","geometry":null,"properties":{}}'
+    yield b"]}"
+
+
+@pytest.mark.asyncio
+async def test_get_or_build_reuses_artifact_until_signature_changes(tmp_path):
+
+    # Arrange
+    store = PolygonArtifactStore(tmp_path)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return feature_collection()
+
+    # Act
+    first = await store.get_or_build("parques.full", "1:1:10:0:0", build)
+    second = await store.get_or_build("parques.full", "1:1:10:0:0", build)
+    changed = await store.get_or_build("parques.full", "1:1:11:0:0", build)
+
+    # Assert
+    assert len(builds) == 2
+    assert first == second
+    assert changed.signature == "1:1:11:0:0"
+    assert changed.etag == first.etag
+    with open(first.files["gzip"], "rb") as f:
+        assert gzip.decompress(f.read()).startswith(b'{"type":"FeatureCollection"')
+
+
+@pytest.mark.asyncio
+async def test_build_failure_leaves_no_artifact(tmp_path):
+
+    # Arrange
+    store = PolygonArtifactStore(tmp_path)
+
+    async def failing_build():
+        yield b"{"
+        raise RuntimeError("conexão perdida")
+
+    # Act
+    with pytest.raises(RuntimeError):
+        await store.get_or_build("parques.full", "1", failing_build)
+
+    # Assert
+    assert store.get("parques.full", "1") is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.util import greenlet_spawn
+
+from sql_app.pool_metrics import InstrumentedQueuePool, PoolMetrics
+
+
+class FakeConnection:
+
+    def close(self):
+        pass
+
+
+def make_pool(pool_size=1, max_overflow=0, timeout=0.01):
+
+    return InstrumentedQueuePool(FakeConnection, pool_size=pool_size, max_overflow=max_overflow, timeout=timeout)
+
+
+def test_checkouts_are_recorded_with_wait_time_and_usage(monkeypatch):
+
+    # Arrange
+    metrics = PoolMetrics()
+    monkeypatch.setattr("sql_app.pool_metrics.pool_metrics", metrics)
+    pool = make_pool(pool_size=2)
+    metrics.register("primary", pool)
+
+    # Act
+    first = pool.connect()
+    second = pool.connect()
+    snapshot = metrics.snapshot()["primary"]
+
+    # Assert
+    assert snapshot["checkouts"] == 2
+    assert snapshot["checked_out"] == 2
+    assert snapshot["pool_size"] == 2
+    assert sum(snapshot["checkout_wait_histogram"].values()) == 2
+    assert snapshot["checkout_wait_max_ms"] >= snapshot["checkout_wait_mean_ms"] >= 0
+    first.close()
+    second.close()
+    assert metrics.snapshot()["primary"]["checked_out"] == 0
+
+
+@pytest.mark.asyncio
+async def test_exhausted_pool_counts_the_timeout(monkeypatch):
+
+    # Arrange
+    metrics = PoolMetrics()
+    monkeypatch.setattr("sql_app.pool_metrics.pool_metrics", metrics)
+    pool = make_pool(pool_size=1)
+    metrics.register("replica", pool)
+    connection = pool.connect()
+
+    # Act
+    with pytest.raises(PoolTimeoutError):
+        # The async adapted queue only waits inside the greenlet of an async connection
+        await greenlet_spawn(pool.connect)
+
+    # Assert
+    snapshot = metrics.snapshot()["replica"]
+    assert snapshot["checkout_timeouts"] == 1
+    assert snapshot["checkouts"] == 1
+    connection.close()
+
+
+def test_recreated_pool_keeps_reporting_under_the_same_name(monkeypatch):
+
+    # Arrange
+    metrics = PoolMetrics()
+    monkeypatch.setattr("sql_app.pool_metrics.pool_metrics", metrics)
+    pool = make_pool()
+    metrics.register("primary", pool)
+
+    # Act
+    recreated = pool.recreate()
+
+    # Assert
+    assert metrics.pools["primary"] is recreated
+    assert recreated.metrics_name == "primary"
@@ -0,0 +1,85 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import status
+from fastapi.exceptions import HTTPException
+
+from controllers.process_controller import ProcessController
+
+
+def polygon_feature():
+    feature = MagicMock()
+    feature.type = "Feature"
+    feature.geometry.type = "Polygon"
+    feature.geometry.coordinates = [[[0, 0], [1, 0], [1, 1], [0, 0]]]
+    return feature
+
+
+@pytest.mark.asyncio
+async def test_batch_geo_process_holds_at_most_two_rasters(monkeypatch):
+
+    # Arrange
+    raster_names = ["wind_100m", "ghi_annual", "ghi_monthly", "wind_150m"]
+    open_rasters, max_open = set(), []
+
+    def load_raster(name, bands):
+        raster = MagicMock(dataset=f"{name} dataset")
+        raster.__enter__.return_value = raster
+        raster.__exit__.side_effect = lambda *args: open_rasters.discard(name)
+        open_rasters.add(name)
+        max_open.append(len(open_rasters))
+        return raster
+
+    async def summarize(self, raster_name, dataset):
+        assert raster_name in open_rasters
+        return {"dataset": dataset}
+
+    repository = MagicMock()
+    repository.check_raster_bands = AsyncMock(side_effect=lambda name, bands: bands or [1])
+    repository.get_raster_dataset = AsyncMock(side_effect=load_raster)
+    monkeypatch.setattr("controllers.process_controller.ZonalBatch.summarize", summarize)
+    controller = ProcessController(repository=repository)
+    feature = polygon_feature()
+    feature.properties.name = "Parque"
+
+    # Act
+    result = await controller.batch_geo_process(feature, raster_names + ["wind_100m"], [2])
+
+    # Assert
+    assert result["properties"]["rasters"] == {name: {"dataset": f"{name} dataset"} for name in raster_names}
+    assert repository.get_raster_dataset.await_count == 4
+    assert max(max_open) <= 2
+    assert open_rasters == set()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("raster_name", ["solar_pv", "wind_100m; DROP TABLE users --"])
+async def test_batch_geo_process_rejects_unsupported_rasters_before_loading(raster_name):
+
+    # Arrange
+    repository = MagicMock()
+    repository.get_raster_dataset = AsyncMock()
+    controller = ProcessController(repository=repository)
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await controller.batch_geo_process(polygon_feature(), ["wind_100m", raster_name])
+
+    # Assert
+    assert exception.value.status_code == status.HTTP_400_BAD_REQUEST
+    repository.get_raster_dataset.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_batch_geo_process_limits_the_rasters():
+
+    # Arrange
+    controller = ProcessController(repository=MagicMock())
+    raster_names = [f"ghi_{index}" for index in range(ProcessController.MAX_BATCH_RASTERS + 1)]
+
+    # Act
+    with pytest.raises(HTTPException) as exception:
+        await controller.batch_geo_process(polygon_feature(), raster_names)
+
+    # Assert
+    assert exception.value.status_code == status.HTTP_400_BAD_REQUEST
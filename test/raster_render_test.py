@@ -0,0 +1,167 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from scripts.raster_render import ColorMap, color_indices, encode_png, lookup_table, render_tile, webp_supported
+
+
+def decode_png(png: bytes) -> np.ndarray:
+
+    # Enough of a decoder for the RGBA and palette images the encoders of raster_render write
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    position, chunks = 8, {}
+    while position < len(png):
+        length, = struct.unpack(">I", png[position:position + 4])
+        tag = png[position + 4:position + 8]
+        chunks[tag] = png[position + 8:position + 8 + length]
+        position += length + 12
+    width, height = struct.unpack(">II", chunks[b"IHDR"][:8])
+    if chunks[b"IHDR"][9] == 3:
+        # Palette image of encode_palette_png, indices into PLTE with the alpha in tRNS
+        scanlines = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width + 1)
+        assert (scanlines[:, 0] == 2).all()
+        palette = np.column_stack([
+            np.frombuffer(chunks[b"PLTE"], dtype=np.uint8).reshape(-1, 3),
+            np.frombuffer(chunks[b"tRNS"], dtype=np.uint8)
+        ])
+        return palette[np.cumsum(scanlines[:, 1:], axis=0, dtype=np.uint8)]
+    scanlines = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width * 4 + 1)
+    assert (scanlines[:, 0] == 2).all()
+    return np.cumsum(scanlines[:, 1:], axis=0, dtype=np.uint8).reshape(height, width, 4)
+
+
+def test_style_stops_are_parsed_and_sorted():
+
+    # Arrange
+    style = {"colormap": {"stops": [[10, "#ff0000"], [0, [0, 0, 255]]], "interpolate": False}}
+
+    # Act
+    colormap = ColorMap.from_style(style)
+
+    # Assert
+    assert colormap.values == (0.0, 10.0)
+    assert colormap.colors == ((0, 0, 255, 255), (255, 0, 0, 255))
+    assert not colormap.relative
+    assert not colormap.interpolate
+    assert colormap.value_range((100.0, 200.0)) == (0.0, 10.0)
+
+
+def test_relative_stops_follow_the_raster_range():
+
+    # Arrange
+    colormap = ColorMap.from_style({"colormap": [["0%", "#000000"], ["50%", "#ffffff"]]})
+
+    # Act
+    value_range = colormap.value_range((100.0, 300.0))
+
+    # Assert
+    assert colormap.relative
+    assert value_range == (100.0, 200.0)
+
+
+def test_style_without_colormap_uses_bluered():
+
+    assert ColorMap.from_style(None) == ColorMap.preset("bluered")
+    assert ColorMap.from_style({"color": "red"}) == ColorMap.preset("bluered")
+
+
+@pytest.mark.parametrize("style", [
+    {"colormap": "rainbow"},
+    {"colormap": [[0, "#000000"]]},
+    {"colormap": [["0%", "#000000"], [10, "#ffffff"]]},
+    {"colormap": [[0, "#00"], [1, "#ffffff"]]},
+])
+def test_invalid_styles_are_rejected(style):
+
+    with pytest.raises(ValueError):
+        ColorMap.from_style(style)
+
+
+def test_lookup_table_interpolates_and_keeps_nodata_transparent():
+
+    # Arrange
+    colormap = ColorMap.from_style({"colormap": [[0, "#000000"], [1, "#ffffff"]]})
+
+    # Act
+    table = lookup_table(colormap)
+
+    # Assert
+    assert table.shape == (256, 4)
+    assert table[0].tolist() == [0, 0, 0, 0]
+    assert table[1].tolist() == [0, 0, 0, 255]
+    assert table[255].tolist() == [255, 255, 255, 255]
+    assert (np.diff(table[1:, 0].astype(int)) >= 0).all()
+
+
+def test_color_indices_clip_the_range_and_mask_nodata():
+
+    # Arrange
+    values = np.ma.MaskedArray([[-5.0, 0.0, 5.0], [10.0, 50.0, np.nan]], mask=[[False, False, False], [False, False, False]])
+    values[0, 2] = np.ma.masked
+
+    # Act
+    indices = color_indices(values, (0.0, 10.0))
+
+    # Assert
+    assert indices.tolist() == [[1, 1, 0], [255, 255, 0]]
+
+
+def test_render_tile_returns_the_colored_png():
+
+    # Arrange
+    colormap = ColorMap.from_style({"colormap": {"stops": [[0, "#0000ff"], [1, "#ff0000"]], "interpolate": False}})
+    values = np.ma.MaskedArray([[0.0, 1.0], [1.0, 0.0]], mask=[[False, False], [True, False]])
+
+    # Act
+    rgba = decode_png(render_tile(values, colormap, None))
+
+    # Assert
+    assert rgba.tolist() == [
+        [[0, 0, 255, 255], [255, 0, 0, 255]],
+        [[0, 0, 0, 0], [0, 0, 255, 255]]
+    ]
+
+
+def test_encode_png_round_trips_any_image():
+
+    # Arrange
+    rgba = np.random.default_rng(7).integers(0, 256, size=(16, 9, 4), dtype=np.uint8)
+
+    # Act
+    decoded = decode_png(encode_png(rgba))
+
+    # Assert
+    assert np.array_equal(decoded, rgba)
+
+
+def test_palette_png_has_the_same_pixels_as_the_rgba_png():
+
+    # Arrange
+    colormap = ColorMap.preset("bluered")
+    field = np.cumsum(np.cumsum(np.random.default_rng(7).normal(size=(256, 256)), axis=0), axis=1)
+    values = np.ma.MaskedArray(field)
+    values[:10] = np.ma.masked
+    raster_range = (float(field.min()), float(field.max()))
+
+    # Act
+    rgba_png = render_tile(values, colormap, raster_range, "png")
+    palette_png = render_tile(values, colormap, raster_range, "png8")
+
+    # Assert
+    assert np.array_equal(decode_png(palette_png), decode_png(rgba_png))
+    assert len(palette_png) < len(rgba_png)
+
+
+@pytest.mark.skipif(not webp_supported(), reason="GDAL without the WEBP driver")
+def test_render_tile_encodes_webp():
+
+    # Arrange
+    values = np.ma.MaskedArray(np.linspace(0, 1, 64).reshape(8, 8))
+
+    # Act
+    webp = render_tile(values, ColorMap.preset("fire"), (0.0, 1.0), "webp")
+
+    # Assert
+    assert webp[:4] == b"RIFF" and webp[8:12] == b"WEBP"
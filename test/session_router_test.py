@@ -0,0 +1,99 @@
+import math
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from sql_app.session_router import SessionRouter
+
+
+class FakeRepository:
+
+    def __init__(self, db):
+        self.db = db
+
+    async def read(self):
+        return self.db
+
+
+def make_router(lags: dict, replicas: list, **kwargs) -> SessionRouter:
+
+    session_maker = MagicMock(side_effect=lambda bind: MagicMock(
+        __aenter__=AsyncMock(return_value=f"session on {bind}"),
+        __aexit__=AsyncMock(return_value=False)
+    ))
+    router = SessionRouter("primary", replicas, session_maker, **kwargs)
+    router._measure_lag = AsyncMock(side_effect=lambda engine: lags[engine])
+    return router
+
+
+@pytest.mark.asyncio
+async def test_reads_stay_on_the_request_session_without_replicas():
+
+    # Arrange
+    router = make_router({}, [])
+    repository = FakeRepository("request session")
+
+    # Act
+    result = await router.read_only(FakeRepository.read)(repository)
+
+    # Assert
+    assert result == "request session"
+    router.session_maker.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_a_replica_in_time():
+
+    # Arrange
+    router = make_router({"replica_0": 0.5}, ["replica_0"])
+    repository = FakeRepository("request session")
+
+    # Act
+    result = await router.read_only(FakeRepository.read)(repository)
+
+    # Assert
+    assert result == "session on replica_0"
+    assert repository.db == "request session"
+
+
+@pytest.mark.asyncio
+async def test_lagging_or_failing_replicas_fall_back_to_the_primary():
+
+    # Arrange
+    router = make_router({"replica_0": 30.0, "replica_1": math.inf}, ["replica_0", "replica_1"])
+    repository = FakeRepository("request session")
+
+    # Act
+    result = await router.read_only(FakeRepository.read)(repository)
+
+    # Assert
+    assert result == "request session"
+
+
+@pytest.mark.asyncio
+async def test_lag_is_measured_once_per_interval_and_replicas_alternate():
+
+    # Arrange
+    router = make_router({"replica_0": 0.0, "replica_1": 1.0}, ["replica_0", "replica_1"], check_interval=60)
+
+    # Act
+    engines = [await router.read_engine() for _ in range(4)]
+
+    # Assert
+    assert engines == ["replica_0", "replica_1", "replica_0", "replica_1"]
+    assert router._measure_lag.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_nested_reads_reuse_the_routed_session():
+
+    # Arrange
+    router = make_router({"replica_0": 0.0}, ["replica_0"])
+
+    # Act
+    async with router.route(FakeRepository("request session")) as reader:
+        result = await router.read_only(FakeRepository.read)(reader)
+
+    # Assert
+    assert result == "session on replica_0"
+    assert router.session_maker.call_count == 1
@@ -0,0 +1,68 @@
+from unittest.mock import MagicMock, patch
+import smtplib
+
+import pytest
+
+from schemas.email import EmailMessage
+from services.email_service import EmailService
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+def _email_message(to_email: str) -> EmailMessage:
+
+    return EmailMessage(subject="Assunto", to_email=to_email, html_content="<p>conteudo</p>", images=[])
+
+
+def test_send_batch_reuses_smtp_session():
+
+    # Arrange
+    email_service = EmailService(host="smtp.test", port="587", email="sender@test.com", password="password")
+    server = MagicMock()
+    server.noop.return_value = (250, b"OK")
+
+    # Act
+    with patch("services.email_service.smtplib.SMTP", return_value=server) as smtp:
+        errors = email_service.send_batch([_email_message("a@test.com"), _email_message("b@test.com")])
+
+    # Assert
+    assert errors == [None, None]
+    smtp.assert_called_once()
+    server.login.assert_called_once_with("sender@test.com", "password")
+    assert server.sendmail.call_count == 2
+
+
+def test_send_batch_reports_error_per_message_and_reconnects():
+
+    # Arrange
+    email_service = EmailService(host="smtp.test", port="587", email="sender@test.com", password="password")
+    broken_server = MagicMock()
+    broken_server.sendmail.side_effect = smtplib.SMTPServerDisconnected("connection lost")
+    server = MagicMock()
+    server.noop.return_value = (250, b"OK")
+
+    # Act
+    with patch("services.email_service.smtplib.SMTP", side_effect=[broken_server, server]):
+        errors = email_service.send_batch([_email_message("a@test.com"), _email_message("b@test.com")])
+
+    # Assert
+    assert errors == ["connection lost", None]
+    server.sendmail.assert_called_once()
+
+
+def test_send_email_quits_session_on_success():
+
+    # Arrange
+    email_service = EmailService(host="smtp.test", port="587", email="sender@test.com", password="password")
+    server = MagicMock()
+
+    # Act
+    with patch("services.email_service.smtplib.SMTP", return_value=server):
+        email_service.send_email_account_confirmation(_email_message("a@test.com"))
+
+    # Assert
+    server.quit.assert_called_once()
+    assert email_service._server is None
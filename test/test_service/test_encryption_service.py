@@ -0,0 +1,90 @@
+import base64
+import gzip
+
+import numpy
+import orjson
+import pytest
+from Crypto.Cipher import AES
+
+from services.encryption_service import EncryptionService
+
+KEY_HEX = "00112233445566778899aabbccddeeff00112233445566778899aabbccddeeff"
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def encryption_service(monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", KEY_HEX)
+    service = EncryptionService()
+    service.load_key()
+    return service
+
+
+@pytest.mark.anyio
+async def test_encrypt_serializes_numpy_values(encryption_service):
+
+    # Arrange
+    data = {"values": numpy.arange(4, dtype=numpy.float32)[::2], "mean": numpy.float64(1.5), "count": numpy.int64(2)}
+
+    # Act
+    encrypted = await encryption_service.encrypt(data)
+
+    # Assert
+    assert encryption_service.decrypt(base64.b64decode(encrypted)) == {"values": [0.0, 2.0], "mean": 1.5, "count": 2}
+
+
+@pytest.mark.anyio
+async def test_encrypt_envelope_with_gzip_payload(encryption_service):
+
+    # Arrange
+    data = {"pixels": list(range(100))}
+
+    # Act
+    envelope = await encryption_service.encrypt_envelope(data, "gzip")
+
+    # Assert
+    cipher = AES.new(bytes.fromhex(KEY_HEX), AES.MODE_GCM, nonce=envelope[:12])
+    plaintext = cipher.decrypt_and_verify(envelope[12:-16], envelope[-16:])
+    assert orjson.loads(gzip.decompress(plaintext)) == data
+
+
+def test_key_is_read_once(monkeypatch, encryption_service):
+
+    # Act
+    monkeypatch.setenv("ENCRYPTION_KEY", "ff" * 32)
+
+    # Assert
+    assert encryption_service.key == bytes.fromhex(KEY_HEX)
+
+
+@pytest.mark.anyio
+async def test_encrypt_stream_frames_concatenate_to_the_document(encryption_service):
+
+    # Arrange
+    document = b'{"data":{' + b",".join(b'"%d":%d' % (i, i) for i in range(2000)) + b"}}"
+
+    async def chunks():
+        for start in range(0, len(document), 700):
+            yield document[start:start + 700]
+
+    # Act
+    stream = b"".join([frame async for frame in encryption_service.encrypt_stream(chunks(), frame_size=4096)])
+
+    # Assert
+    plaintext, position, frames = b"", 0, 0
+    while position < len(stream):
+        length = int.from_bytes(stream[position:position + 4], "big")
+        nonce = stream[position + 4:position + 16]
+        ciphertext = stream[position + 16:position + 16 + length]
+        tag = stream[position + 16 + length:position + 32 + length]
+        position += 32 + length
+        cipher = AES.new(bytes.fromhex(KEY_HEX), AES.MODE_GCM, nonce=nonce)
+        cipher.update(b"final" if position == len(stream) else b"frame")
+        plaintext += cipher.decrypt_and_verify(ciphertext, tag)
+        frames += 1
+    assert plaintext == document
+    assert frames == len(document) // 4096 + 1
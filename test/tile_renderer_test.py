@@ -0,0 +1,52 @@
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from scripts.raster_render import ColorMap
+from services.tile_renderer import TileRenderer
+
+
+@pytest.fixture(scope="module")
+def anyio_backend():
+    return "asyncio"
+
+
+class FakePool(Executor):
+
+    created = []
+
+    def __init__(self, broken: bool):
+        self.broken = broken
+        self.closed = False
+        FakePool.created.append(self)
+
+    def submit(self, fn, *args):
+        future = Future()
+        if self.broken:
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        else:
+            future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.closed = True
+
+
+@pytest.mark.anyio
+async def test_render_replaces_a_broken_pool(monkeypatch):
+
+    # Arrange
+    FakePool.created = []
+    monkeypatch.setattr("services.tile_renderer.ProcessPoolExecutor", lambda **kwargs: FakePool(broken=not FakePool.created))
+    renderer = TileRenderer(max_workers=1)
+
+    # Act
+    png = await renderer.render(np.ma.MaskedArray(np.zeros((2, 2))), ColorMap.preset("fire"), (0.0, 1.0))
+
+    # Assert
+    assert png.startswith(b"\x89PNG")
+    broken, fresh = FakePool.created
+    assert broken.closed and not fresh.closed
+    assert renderer._executor is fresh
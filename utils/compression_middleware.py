@@ -0,0 +1,156 @@
+import zlib
+
+from asyncer import asyncify
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.content_encoding import negotiate_encoding
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Already compressed or encrypted payloads, compressing them again only spends CPU
+INCOMPRESSIBLE_MEDIA_TYPES = (
+    "image/png",
+    "image/jpeg",
+    "image/webp",
+    "application/zip",
+    "application/gzip",
+    "application/octet-stream",
+    "application/x-aes-gcm-stream",
+)
+# Chunks bigger than this are compressed in a worker thread to keep the event loop free
+THREAD_COMPRESSION_SIZE = 256 * 1024
+
+
+class _Compressor:
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+
+        # Every chunk is flushed so streamed responses reach the client as they are produced
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+
+        if self.encoding == "zstd":
+            return self._compressor.compress(data) + self._compressor.flush()
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+
+    """
+        Compresses responses with zstd, brotli or gzip, whichever the client accepts first in that order.
+        Responses that already have a Content-Encoding, partial responses, small bodies and incompressible
+        media types are sent untouched.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = [encoding for encoding, available in (("zstd", zstandard), ("br", brotli), ("gzip", True)) if available]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        await _CompressionResponder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _CompressionResponder:
+
+    def __init__(self, app: ASGIApp, encoding: str, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.send: Send = None
+        self.start_message: Message | None = None
+        self.compressor: _Compressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def _is_compressible(self, message: Message) -> bool:
+
+        headers = Headers(raw=message["headers"])
+        media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        if message["status"] in (204, 206, 304) or "content-encoding" in headers:
+            return False
+        return media_type not in INCOMPRESSIBLE_MEDIA_TYPES
+
+    async def _compress(self, body: bytes, final: bool) -> bytes:
+
+        operation = self.compressor.finish if final else self.compressor.compress
+        if len(body) > THREAD_COMPRESSION_SIZE:
+            return await asyncify(operation)(body)
+        return operation(body)
+
+    async def send_compressed(self, message: Message) -> None:
+
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            self.passthrough = not self._is_compressible(message)
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+
+            self.compressor = _Compressor(self.encoding)
+            compressed = await self._compress(body, final=not more_body)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["content-encoding"] = self.encoding
+            headers.add_vary_header("accept-encoding")
+            if more_body:
+                del headers["content-length"]
+            else:
+                headers["content-length"] = str(len(compressed))
+            await self.send(self.start_message)
+        else:
+            compressed = await self._compress(body, final=not more_body)
+
+        await self.send({"type": "http.response.body", "body": compressed, "more_body": more_body})
@@ -0,0 +1,25 @@
+def negotiate_encoding(accept_encoding: str | None, available: list[str]) -> str | None:
+
+    """
+        Content coding of available, in order of preference, accepted by the Accept-Encoding header,
+        None when the client only takes the identity coding
+    """
+
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        if parameters.strip().startswith("q="):
+            try:
+                quality = float(parameters.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    for coding in available:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
@@ -1,15 +1,55 @@
 from .htmls import recovery_password, confirmation_account
 
 
+class CompiledTemplate:
+
+    """
+        Template rendered once with placeholder markers and split into literal segments,
+        rendering only joins the literal segments with the per email values
+    """
+
+    MARKER = '\x00'
+
+    def __init__(self, template_function, fields: list[str], **static_values):
+        html = template_function(**static_values, **{field: f'{self.MARKER}{field}{self.MARKER}' for field in fields})
+        self.segments = html.split(self.MARKER)
+        self.fields = fields
+
+    def render(self, **values) -> str:
+        # Odd positions hold the field names left by the markers
+        return ''.join(
+            segment if index % 2 == 0 else str(values[segment])
+            for index, segment in enumerate(self.segments)
+        )
+
+
 class HtmlGenerator:
 
+    _templates: dict[str, CompiledTemplate] = {}
+
     def __init__(self):
-        pass
+        if not HtmlGenerator._templates:
+            HtmlGenerator.compile_templates()
+
+    @classmethod
+    def compile_templates(cls) -> None:
+        cls._templates = {
+            'password_recovery': CompiledTemplate(
+                recovery_password.recovery_password,
+                ['user_email', 'enter_link', 'contact_link', 'img_isi_er_cid', 'img_state_cid',
+                 'img_logo_cid', 'new_password', 'reset_password_link'],
+                style=recovery_password.style()
+            ),
+            'confirmation_account': CompiledTemplate(
+                confirmation_account.get_confirmation_email_html,
+                ['user_email', 'contact_link', 'confirmation_email_link', 'img_isi_er_cid', 'img_state_cid', 'img_logo_cid'],
+                style=confirmation_account.get_style()
+            ),
+        }
 
     def get_password_recovery(self, user_email, enter_link, contact_link, img_isi_er_cid, img_state_cid,
                               img_logo_cid, new_password, reset_password_link) -> str:
-        return recovery_password.recovery_password(
-            style=recovery_password.style(),
+        return self._templates['password_recovery'].render(
             enter_link=enter_link,
             img_isi_er_cid=img_isi_er_cid,
             img_state_cid=img_state_cid,
@@ -21,8 +61,7 @@ class HtmlGenerator:
         )
 
     def confirmation_account(self, user_email, contact_link, confirmation_email_link, img_isi_er_cid, img_state_cid, img_logo_cid) -> str:
-        return confirmation_account.get_confirmation_email_html(
-            style=confirmation_account.get_style(),
+        return self._templates['confirmation_account'].render(
             confirmation_email_link=confirmation_email_link,
             contact_link=contact_link,
             img_isi_er_cid=img_isi_er_cid,